@@ -5,12 +5,22 @@ from django.db.models import Count, Q
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
 from django import forms
 from django.forms import PasswordInput
 from .models import (
     LawFirm, LawFirmUser, DocumentTemplate, EmailTemplate,
-    ExcelUpload, RetainerRecipient, DocumentSubmission, DocumentWebhookEvent
+    ChunkedUpload, ColumnMappingProfile, ExcelUpload, ExcelUploadShard, RetainerRecipient, DocumentSubmission, DocumentWebhookEvent,
+    SubmissionOutbox, SubmissionSyncState
 )
+from .progress import get_progress
+from roblex import document_mirror
+from roblex.task_publishing import publish_bulk
+from .excel_import import preview_upload
+from .row_report import row_report_csv_response, row_report_xlsx_response
+from .utils import get_user_law_firm
 
 
 class SuperuserOnlyModelAdmin(admin.ModelAdmin):
@@ -37,50 +47,7 @@ class LawFirmFilteredModelAdmin(admin.ModelAdmin):
     
     def get_user_law_firm(self, request):
         """Get the law firm associated with the current user"""
-        if request.user.is_superuser:
-            return None
-        
-        try:
-            # Try retainer app law firm user first (direct association)
-            try:
-                law_firm_user = LawFirmUser.objects.get(user=request.user)
-                return law_firm_user.law_firm
-            except LawFirmUser.DoesNotExist:
-                pass
-            
-            # Import here to avoid circular imports
-            from roblex_app.models import LawFirmUser as RoblexLawFirmUser
-            try:
-                roblex_law_firm_user = RoblexLawFirmUser.objects.get(user=request.user)
-                roblex_firm_name = roblex_law_firm_user.law_firm.name
-                
-                # Try exact match first
-                try:
-                    retainer_law_firm = LawFirm.objects.get(name=roblex_firm_name)
-                    return retainer_law_firm
-                except LawFirm.DoesNotExist:
-                    pass
-                
-                # Try partial match (for cases like "Bullock Legal" vs "Bullock Legal Group")
-                # Look for retainer law firm containing the roblex firm name
-                retainer_firms = LawFirm.objects.filter(name__icontains=roblex_firm_name)
-                if retainer_firms.exists():
-                    return retainer_firms.first()
-                
-                # Try the reverse - roblex firm name containing retainer firm name
-                retainer_firms = LawFirm.objects.all()
-                for firm in retainer_firms:
-                    if firm.name.lower() in roblex_firm_name.lower() or roblex_firm_name.lower() in firm.name.lower():
-                        return firm
-                
-                return None
-                
-            except RoblexLawFirmUser.DoesNotExist:
-                return None
-                
-        except Exception as e:
-            # Log the error for debugging but don't crash
-            return None
+        return get_user_law_firm(request.user)
     
     def get_queryset(self, request):
         """Filter queryset based on user's law firm"""
@@ -121,6 +88,12 @@ class LawFirmFilteredModelAdmin(admin.ModelAdmin):
             kwargs["queryset"] = EmailTemplate.objects.filter(
                 Q(law_firm=user_law_firm) | Q(law_firm__isnull=True)
             )
+        
+        if db_field.name == "previous_upload" and user_law_firm:
+            kwargs["queryset"] = ExcelUpload.objects.filter(law_firm=user_law_firm)
+        
+        if db_field.name == "column_mapping" and user_law_firm:
+            kwargs["queryset"] = ColumnMappingProfile.objects.filter(law_firm=user_law_firm)
             
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
@@ -142,6 +115,19 @@ class LawFirmAdminForm(forms.ModelForm):
         fields = '__all__'
 
 
+class ExcelUploadAdminForm(forms.ModelForm):
+    """Upload form that can hold processing back until the file has been previewed"""
+    start_processing = forms.BooleanField(
+        required=False,
+        initial=True,
+        help_text="Uncheck to preview the file first, then start it with the 'Trigger processing' action."
+    )
+    
+    class Meta:
+        model = ExcelUpload
+        fields = '__all__'
+
+
 # ====================
 # Law Firm Management
 # ====================
@@ -285,6 +271,13 @@ class DocumentTemplateAdmin(LawFirmFilteredModelAdmin):
     search_fields = ['name', 'display_name', 'description', 'nextkeysign_template_id', 'law_firm__name']
 
 
+@admin.register(ColumnMappingProfile)
+class ColumnMappingProfileAdmin(LawFirmFilteredModelAdmin):
+    list_display = ['name', 'law_firm', 'is_default', 'updated_at']
+    list_filter = ['law_firm', 'is_default']
+    search_fields = ['name', 'law_firm__name']
+
+
 @admin.register(EmailTemplate)
 class EmailTemplateAdmin(LawFirmFilteredModelAdmin):
     def get_law_firm_field_name(self):
@@ -330,6 +323,20 @@ class EmailTemplateAdmin(LawFirmFilteredModelAdmin):
 # Excel Upload Management
 # ====================
 
+class ExcelUploadShardInline(admin.TabularInline):
+    model = ExcelUploadShard
+    extra = 0
+    can_delete = False
+    fields = [
+        'start_row', 'end_row', 'next_row', 'status', 'total_rows',
+        'successful_rows', 'failed_rows', 'skipped_rows', 'error_message', 'updated_at'
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(ExcelUpload)
 class ExcelUploadAdmin(LawFirmFilteredModelAdmin):
     def uploaded_by_name(self, obj):
@@ -351,14 +358,21 @@ class ExcelUploadAdmin(LawFirmFilteredModelAdmin):
     status_colored.short_description = "Status"
 
     def progress_bar(self, obj):
+        processed_rows = obj.processed_rows
+        if obj.status == 'processing':
+            # Shards report live progress to Redis, the row is only updated when finalized
+            counters = get_progress(obj.id)
+            if counters:
+                processed_rows = counters['parsed']
+        
         if obj.total_rows and obj.total_rows > 0:
-            percentage = (obj.processed_rows / obj.total_rows) * 100
+            percentage = min((processed_rows / obj.total_rows) * 100, 100)
             return format_html(
                 '<div style="width: 100px; background-color: #e9ecef; border-radius: 3px;">'
                 '<div style="width: {}%; height: 20px; background-color: #007bff; border-radius: 3px;"></div>'
                 '</div>'
                 '<small>{}/{} ({}%)</small>',
-                percentage, obj.processed_rows, obj.total_rows, round(percentage, 1)
+                percentage, processed_rows, obj.total_rows, round(percentage, 1)
             )
         return "Not started"
     progress_bar.short_description = "Progress"
@@ -371,25 +385,111 @@ class ExcelUploadAdmin(LawFirmFilteredModelAdmin):
         return "N/A"
     success_rate.short_description = "Success Rate"
 
+    def row_report(self, obj):
+        if not (obj.skipped_rows or obj.failed_submissions or obj.status == 'processing'):
+            return "-"
+        return format_html(
+            '<a href="{}">CSV</a> | <a href="{}">XLSX</a>',
+            reverse('admin:retainer_app_excelupload_row_report', args=[obj.id, 'csv']),
+            reverse('admin:retainer_app_excelupload_row_report', args=[obj.id, 'xlsx']),
+        )
+    row_report.short_description = "Skipped/Failed Rows"
+
+    def preview_link(self, obj):
+        if not obj.pk:
+            return "-"
+        return format_html(
+            '<a href="{}">Preview</a>',
+            reverse('admin:retainer_app_excelupload_preview', args=[obj.id]),
+        )
+    preview_link.short_description = "Preview"
+
+    def preview_view(self, request, object_id):
+        """Headers, row count and first rows of the uploaded file"""
+        upload = self.get_object(request, object_id)
+        if upload is None or not self.has_view_permission(request, upload):
+            raise PermissionDenied
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'upload': upload,
+            'title': f"Preview of upload #{upload.id}",
+        }
+        try:
+            headers, estimated_rows, rows = preview_upload(upload.file.path)
+            mapping = upload.compile_column_mapping(headers)
+            context.update({
+                'headers': headers,
+                'estimated_rows': estimated_rows,
+                'rows': [(row_number, [row.get(header) for header in headers]) for row_number, row in rows],
+                'column_sources': mapping.sources.items(),
+                'missing_columns': mapping.missing_required,
+            })
+        except Exception as e:
+            context['error'] = str(e)
+        
+        return TemplateResponse(request, 'admin/retainer_app/excelupload/preview.html', context)
+
+    def row_report_view(self, request, object_id, file_format):
+        """Download the skipped and failed rows of an upload"""
+        upload = self.get_object(request, object_id)
+        if upload is None or not self.has_view_permission(request, upload):
+            raise PermissionDenied
+        if file_format == 'xlsx':
+            return row_report_xlsx_response(upload)
+        return row_report_csv_response(upload)
+
+    def get_urls(self):
+        urls = [
+            path(
+                '<path:object_id>/row-report.<str:file_format>',
+                self.admin_site.admin_view(self.row_report_view),
+                name='retainer_app_excelupload_row_report',
+            ),
+            path(
+                '<path:object_id>/preview/',
+                self.admin_site.admin_view(self.preview_view),
+                name='retainer_app_excelupload_preview',
+            ),
+        ]
+        return urls + super().get_urls()
+
     def trigger_processing(self, request, queryset):
-        """Admin action to trigger processing of uploaded files"""
+        """Admin action to trigger processing of uploaded files, or resume interrupted ones"""
         from .tasks import process_excel_upload
         for upload in queryset.filter(status='uploaded'):
             process_excel_upload.delay(upload.id)
             self.message_user(request, f'Processing triggered for upload {upload.id}', messages.SUCCESS)
-    trigger_processing.short_description = "Trigger processing for selected uploads"
+        
+        # Interrupted uploads continue from their shard checkpoints; ones
+        # stopped before they had shards are split again from the start
+        for upload in queryset.filter(status__in=['processing', 'failed']).annotate(shard_count=Count('shards')):
+            process_excel_upload.delay(upload.id)
+            action = 'resumed' if upload.shard_count else 'restarted'
+            self.message_user(request, f'Processing {action} for upload {upload.id}', messages.SUCCESS)
+    trigger_processing.short_description = "Trigger or resume processing for selected uploads"
 
     list_display = [
         'id', 'law_firm', 'uploaded_by_name', 'document_template', 
-        'status_colored', 'progress_bar', 'success_rate', 'created_at'
+        'status_colored', 'progress_bar', 'success_rate', 'preview_link', 'row_report', 'created_at'
     ]
     list_filter = ['status', 'law_firm', 'document_template', 'created_at']
     search_fields = ['uploaded_by__username', 'law_firm__name']
     readonly_fields = [
         'status', 'total_rows', 'processed_rows', 'successful_submissions', 
-        'failed_submissions', 'skipped_rows', 'processing_started_at', 'completed_at'
+        'failed_submissions', 'skipped_rows', 'processing_started_at', 'completed_at', 'preview_link', 'row_report'
     ]
     actions = ['trigger_processing']
+    inlines = [ExcelUploadShardInline]
+    form = ExcelUploadAdminForm
+
+    def get_fields(self, request, obj=None):
+        fields = super().get_fields(request, obj)
+        if obj is not None:
+            # Only meaningful when the upload is first saved
+            fields = [field for field in fields if field != 'start_processing']
+        return fields
 
     def save_model(self, request, obj, form, change):
         """Auto-assign law firm and trigger processing"""
@@ -404,9 +504,37 @@ class ExcelUploadAdmin(LawFirmFilteredModelAdmin):
         
         # Trigger processing if new upload
         if not change and obj.status == 'uploaded':
-            from .tasks import process_excel_upload
-            process_excel_upload.delay(obj.id)
-            self.message_user(request, f'Processing started for upload {obj.id}', messages.SUCCESS)
+            if form.cleaned_data.get('start_processing', True):
+                from .tasks import process_excel_upload
+                process_excel_upload.delay(obj.id)
+                self.message_user(request, f'Processing started for upload {obj.id}', messages.SUCCESS)
+            else:
+                preview_url = reverse('admin:retainer_app_excelupload_preview', args=[obj.id])
+                self.message_user(
+                    request,
+                    format_html('Upload {} saved without processing. <a href="{}">Preview it</a>.', obj.id, preview_url),
+                    messages.INFO
+                )
+
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(LawFirmFilteredModelAdmin):
+    def received(self, obj):
+        percentage = round((obj.offset / obj.total_size) * 100, 1) if obj.total_size else 0
+        return f"{obj.offset}/{obj.total_size} bytes ({percentage}%)"
+    received.short_description = "Received"
+
+    list_display = ['filename', 'law_firm', 'uploaded_by', 'status', 'received', 'excel_upload', 'updated_at']
+    list_filter = ['status', 'law_firm', 'created_at']
+    search_fields = ['filename', 'upload_id', 'uploaded_by__username']
+    readonly_fields = [
+        'upload_id', 'law_firm', 'uploaded_by', 'document_template', 'email_template', 'previous_upload',
+        'column_mapping', 'filename', 'total_size', 'offset', 'status', 'excel_upload', 'created_at', 'updated_at'
+    ]
+
+    def has_add_permission(self, request):
+        # Created through the chunked upload API
+        return False
 
 
 # ====================
@@ -448,10 +576,9 @@ class RetainerRecipientAdmin(LawFirmFilteredModelAdmin):
     def retry_failed(self, request, queryset):
         """Admin action to retry failed submissions"""
         from .tasks import retry_failed_submission
-        failed_recipients = queryset.filter(status='failed')
-        for recipient in failed_recipients:
-            retry_failed_submission.delay(recipient.id)
-        self.message_user(request, f'Retry triggered for {failed_recipients.count()} failed recipients', messages.SUCCESS)
+        failed_ids = queryset.filter(status='failed').values_list('id', flat=True)
+        count = publish_bulk(retry_failed_submission, [(recipient_id,) for recipient_id in failed_ids])
+        self.message_user(request, f'Retry triggered for {count} failed recipients', messages.SUCCESS)
     retry_failed.short_description = "Retry failed submissions"
 
     list_display = [
@@ -460,7 +587,7 @@ class RetainerRecipientAdmin(LawFirmFilteredModelAdmin):
     ]
     list_filter = ['status', 'excel_upload__law_firm', 'excel_upload', 'created_at']
     search_fields = ['external_id', 'name', 'email', 'excel_upload__id']
-    readonly_fields = ['status', 'retry_count', 'error_message', 'last_processed_at']
+    readonly_fields = ['status', 'retry_count', 'error_message', 'last_processed_at', 'row_hash']
     actions = ['retry_failed']
     inlines = [DocumentSubmissionInline]
 
@@ -506,11 +633,33 @@ class DocumentSubmissionAdmin(LawFirmFilteredModelAdmin):
     signing_link.short_description = "Signing Link"
 
     def signed_document_link(self, obj):
+        if obj.signed_document_sha256:
+            url = reverse('admin:retainer_app_documentsubmission_document', args=[obj.pk, 'signed'])
+            return format_html('<a href="{}" target="_blank">📋 View Signed Document</a>', url)
         if obj.signed_document_url:
             return format_html('<a href="{}" target="_blank">📋 View Signed Document</a>', obj.signed_document_url)
         return "Not signed"
     signed_document_link.short_description = "Signed Document"
 
+    def document_view(self, request, object_id, kind):
+        """Serve the mirrored signed document or audit log"""
+        submission = self.get_object(request, object_id)
+        if submission is None or not self.has_view_permission(request, submission):
+            raise PermissionDenied
+        if kind == 'audit-log':
+            return document_mirror.serve(submission.audit_log_sha256, f"audit-log-{submission.external_id}.pdf")
+        return document_mirror.serve(submission.signed_document_sha256, f"{submission.external_id}.pdf")
+
+    def get_urls(self):
+        urls = [
+            path(
+                '<path:object_id>/document/<str:kind>/',
+                self.admin_site.admin_view(self.document_view),
+                name='retainer_app_documentsubmission_document',
+            ),
+        ]
+        return urls + super().get_urls()
+
     list_display = [
         'recipient_name', 'recipient_email', 'document_template', 
         'status_colored', 'signing_link', 'signed_document_link', 'created_at'
@@ -524,9 +673,28 @@ class DocumentSubmissionAdmin(LawFirmFilteredModelAdmin):
     ]
     readonly_fields = [
         'nextkeysign_submission_id', 'nextkeysign_submitter_id', 'nextkeysign_slug', 
-        'external_id', 'created_at', 'updated_at', 'sent_at', 'completed_at'
+        'external_id', 'created_at', 'updated_at', 'sent_at', 'completed_at',
+        'signed_document_sha256', 'audit_log_sha256', 'documents_mirrored_at', 'mirror_attempts'
+    ]
+
+
+@admin.register(SubmissionOutbox)
+class SubmissionOutboxAdmin(LawFirmFilteredModelAdmin):
+    def get_law_firm_field_name(self):
+        return 'recipient__excel_upload__law_firm'
+
+    list_display = ['idempotency_key', 'recipient', 'status', 'attempts', 'claimed_at', 'sent_at', 'email_queued_at']
+    list_filter = ['status', 'recipient__excel_upload__law_firm', 'created_at']
+    search_fields = ['idempotency_key', 'recipient__name', 'recipient__email']
+    readonly_fields = [
+        'recipient', 'idempotency_key', 'status', 'attempts', 'claimed_at', 'last_error',
+        'email_queued_at', 'created_at', 'sent_at'
     ]
 
+    def has_add_permission(self, request):
+        # Written alongside recipients when an upload is processed
+        return False
+
 
 # ====================
 # Webhook Event Tracking
@@ -551,6 +719,19 @@ class DocumentWebhookEventAdmin(SuperuserOnlyModelAdmin):
     readonly_fields = ['webhook_data', 'created_at']
 
 
+@admin.register(SubmissionSyncState)
+class SubmissionSyncStateAdmin(SuperuserOnlyModelAdmin):
+    list_display = ['name', 'floor_id', 'cursor_id', 'sweep_started_at', 'last_sweep_completed_at', 'last_run_at']
+    readonly_fields = [
+        'name', 'floor_id', 'cursor_id', 'sweep_report', 'last_report',
+        'sweep_started_at', 'last_sweep_completed_at', 'last_run_at'
+    ]
+
+    def has_add_permission(self, request):
+        # Created by the first reconciliation run
+        return False
+
+
 # ====================
 # Admin Site Customization
 # ====================
@@ -0,0 +1,94 @@
+"""
+Bulk loading of validated recipients into the retainer database.
+
+On PostgreSQL rows are streamed with COPY straight into the recipients table;
+other backends fall back to bulk_create. The target connection is always the
+one RetainerDatabaseRouter picks for RetainerRecipient writes.
+"""
+import csv
+import io
+import logging
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.utils import timezone
+
+from .models import RetainerRecipient
+
+logger = logging.getLogger(__name__)
+
+# Columns written for every recipient, in COPY order
+RECIPIENT_COPY_FIELDS = [
+    'id', 'excel_upload_id', 'external_id', 'name', 'email', 'phone', 'state', 'zip_code',
+    'age', 'first_name_injured', 'last_name_injured', 'row_hash', 'status', 'error_message',
+    'retry_count', 'created_at',
+]
+
+
+def recipient_db_alias():
+    """Database alias RetainerRecipient writes are routed to"""
+    return router.db_for_write(RetainerRecipient) or DEFAULT_DB_ALIAS
+
+
+def _allocate_ids(cursor, count):
+    """
+    Reserve primary keys up front so COPY can write them explicitly and the
+    caller knows the id of every row without a RETURNING round trip.
+    """
+    table = RetainerRecipient._meta.db_table
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+        [table, count],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _copy_recipients(connection, upload_id, records):
+    table = RetainerRecipient._meta.db_table
+    created_at = timezone.now().isoformat()
+
+    with connection.cursor() as cursor:
+        ids = _allocate_ids(cursor, len(records))
+
+        buffer = io.StringIO()
+        # Non-numeric values are quoted so '' stays an empty string. csv writes None
+        # as a quoted '' too, so FORCE_NULL turns it back into NULL for the nullable age.
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n')
+        for recipient_id, record in zip(ids, records):
+            writer.writerow([
+                recipient_id, upload_id, record['external_id'], record['name'], record['email'],
+                record['phone'], record['state'], record['zip_code'], record['age'],
+                record['first_name_injured'], record['last_name_injured'], record['row_hash'],
+                'pending', '', 0, created_at,
+            ])
+        buffer.seek(0)
+
+        column_list = ', '.join(connection.ops.quote_name(field) for field in RECIPIENT_COPY_FIELDS)
+        cursor.copy_expert(
+            f"COPY {connection.ops.quote_name(table)} ({column_list}) FROM STDIN "
+            f"WITH (FORMAT csv, FORCE_NULL ({connection.ops.quote_name('age')}))",
+            buffer,
+        )
+
+    return ids
+
+
+def load_recipients(upload, records):
+    """
+    Insert normalized recipient records for an upload in one round trip.
+    Returns the ids of the created recipients in the same order as records.
+    """
+    if not records:
+        return []
+
+    alias = recipient_db_alias()
+    connection = connections[alias]
+
+    if connection.vendor != 'postgresql':
+        created = RetainerRecipient.objects.using(alias).bulk_create([
+            RetainerRecipient(excel_upload_id=upload.id, **record)
+            for record in records
+        ])
+        return [recipient.id for recipient in created]
+
+    with transaction.atomic(using=alias):
+        return _copy_recipients(connection, upload.id, records)
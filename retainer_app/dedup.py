@@ -0,0 +1,200 @@
+"""
+Cross-upload recipient deduplication.
+
+Every imported recipient is indexed per law firm under its normalized
+external ID and email (RecipientDedupKey). Rows of later uploads that hit
+the index are skipped before any NextKeySign call or email is made.
+Recipients whose submission failed for good were never sent a retainer, so
+their keys are released and a later upload may import them again.
+
+An upload that revises earlier uploads (ExcelUpload.previous_upload) is
+diffed against them first: rows whose content hash is unchanged are carried
+over, and changed rows replace the recipient they correct instead of being
+treated as duplicates. The corrected recipient is superseded: its unsent
+submission is cancelled and a sent one archived (see
+tasks._supersede_recipients), so the person only ever has one retainer to
+sign. Rows of a person who has already signed are skipped.
+"""
+import logging
+
+from django.db.models import Q
+
+from .models import RecipientDedupKey, RetainerRecipient
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_external_id(value):
+    return value.strip().casefold()
+
+
+def normalize_email(value):
+    return value.strip().lower()
+
+
+def dedup_keys(record):
+    """(key_type, normalized value) pairs a recipient record is indexed under"""
+    return [
+        ('external_id', normalize_external_id(record['external_id'])),
+        ('email', normalize_email(record['email'])),
+    ]
+
+
+class RevisionDiff:
+    """
+    Latest row hash and status per external ID across the uploads an upload revises
+    """
+    def __init__(self, upload):
+        self.upload_ids = upload.get_previous_upload_ids()
+        self.hashes = {}
+        
+        # Oldest rows first so the most recent correction of a row wins
+        rows = RetainerRecipient.objects.filter(
+            excel_upload_id__in=self.upload_ids
+        ).order_by('id').values_list('external_id', 'row_hash', 'excel_upload_id', 'status')
+        for external_id, row_hash, upload_id, status in rows.iterator(chunk_size=5000):
+            self.hashes[normalize_external_id(external_id)] = (row_hash, upload_id, status)
+    
+    def exclude_unchanged(self, normalized):
+        """
+        Move rows identical to their previous version, or whose previous
+        version has already been signed, to the skipped list. Returns the
+        normalized external IDs of rows that changed.
+        """
+        unchanged_indexes = []
+        reasons = []
+        changed = set()
+        for index, record in enumerate(normalized.records):
+            external_id = normalize_external_id(record['external_id'])
+            previous = self.hashes.get(external_id)
+            if previous is None:
+                continue
+            
+            row_hash, upload_id, status = previous
+            if row_hash == record['row_hash']:
+                unchanged_indexes.append(index)
+                reasons.append(f"Unchanged since upload #{upload_id}")
+            elif status == 'completed':
+                unchanged_indexes.append(index)
+                reasons.append(f"Already signed in upload #{upload_id}")
+            elif row_hash:
+                # Recipients imported before row hashing existed still go through dedup
+                changed.add(external_id)
+        
+        if unchanged_indexes:
+            normalized.skip(unchanged_indexes, reasons)
+        
+        return changed
+
+
+def exclude_duplicates(law_firm_id, normalized, replacing=frozenset(), superseded_upload_ids=()):
+    """
+    Move rows of a NormalizedBatch that match the law firm's dedup index, or an
+    earlier row of the same batch, to its skipped list. Rows whose external ID
+    is in `replacing` may match keys of the superseded uploads. Returns the
+    number of rows removed.
+    """
+    if not normalized.records:
+        return 0
+
+    keys_by_record = [dedup_keys(record) for record in normalized.records]
+
+    lookup = Q()
+    for key_type in ('external_id', 'email'):
+        values = {value for keys in keys_by_record for kind, value in keys if kind == key_type}
+        lookup |= Q(key_type=key_type, value__in=values)
+
+    # One query for the whole batch
+    existing = {
+        (key_type, value): upload_id
+        for key_type, value, upload_id in RecipientDedupKey.objects.filter(
+            lookup, law_firm_id=law_firm_id
+        ).values_list('key_type', 'value', 'recipient__excel_upload_id')
+    }
+
+    duplicate_indexes = []
+    reasons = []
+    seen = {}
+    for index, keys in enumerate(keys_by_record):
+        is_replacement = keys[0][1] in replacing
+        for key_type, value in keys:
+            label = 'external ID' if key_type == 'external_id' else 'email'
+            if is_replacement and existing.get((key_type, value)) in superseded_upload_ids:
+                pass
+            elif (key_type, value) in existing:
+                duplicate_indexes.append(index)
+                reasons.append(f"Duplicate {label} {value} already imported in upload #{existing[(key_type, value)]}")
+                break
+            if (key_type, value) in seen:
+                duplicate_indexes.append(index)
+                reasons.append(f"Duplicate {label} {value} repeats row {seen[(key_type, value)]}")
+                break
+        else:
+            for key in keys:
+                seen[key] = normalized.row_numbers[index]
+
+    if duplicate_indexes:
+        normalized.skip(duplicate_indexes, reasons)
+
+    return len(duplicate_indexes)
+
+
+def record_dedup_keys(law_firm_id, recipient_ids, records, replacing=frozenset(), superseded_upload_ids=()):
+    """
+    Index newly created recipients. Must run in the same transaction as the
+    recipient insert: a concurrent shard importing the same person makes this
+    raise IntegrityError, and the caller retries the batch.
+    
+    Keys of superseded recipients that a replacing row corrects are moved to
+    the new recipient. Returns the ids of those superseded recipients.
+    """
+    superseded_ids = []
+    if replacing and superseded_upload_ids:
+        lookup = Q()
+        for record in records:
+            if normalize_external_id(record['external_id']) in replacing:
+                for key_type, value in dedup_keys(record):
+                    lookup |= Q(key_type=key_type, value=value)
+        if lookup:
+            superseded_keys = RecipientDedupKey.objects.filter(
+                lookup, law_firm_id=law_firm_id, recipient__excel_upload_id__in=superseded_upload_ids
+            )
+            superseded_ids = list(set(superseded_keys.values_list('recipient_id', flat=True)))
+            superseded_keys.delete()
+    
+    RecipientDedupKey.objects.bulk_create([
+        RecipientDedupKey(law_firm_id=law_firm_id, key_type=key_type, value=value, recipient_id=recipient_id)
+        for recipient_id, record in zip(recipient_ids, records)
+        for key_type, value in dedup_keys(record)
+    ])
+    return superseded_ids
+
+
+def release_dedup_keys(recipient_ids):
+    """Drop the keys of recipients whose submission failed for good"""
+    if recipient_ids:
+        RecipientDedupKey.objects.filter(recipient_id__in=recipient_ids).delete()
+
+
+def restore_dedup_keys(law_firm_id, recipient):
+    """
+    Index a failed recipient again before its submission is retried. Returns
+    the id of an upload that has imported the same person since, in which
+    case nothing is indexed and the retry should not go ahead, or None.
+    """
+    keys = dedup_keys({'external_id': recipient.external_id, 'email': recipient.email})
+    lookup = Q()
+    for key_type, value in keys:
+        lookup |= Q(key_type=key_type, value=value)
+    
+    reimported_in = RecipientDedupKey.objects.filter(lookup, law_firm_id=law_firm_id).exclude(
+        recipient_id=recipient.id
+    ).values_list('recipient__excel_upload_id', flat=True).first()
+    if reimported_in is not None:
+        return reimported_in
+    
+    RecipientDedupKey.objects.bulk_create([
+        RecipientDedupKey(law_firm_id=law_firm_id, key_type=key_type, value=value, recipient_id=recipient.id)
+        for key_type, value in keys
+    ], ignore_conflicts=True)
+    return None
@@ -0,0 +1,97 @@
+"""
+Asyncio dispatcher for high-concurrency outbound API calls.
+
+A Celery task hands dispatch() a list of items and a blocking call to make
+for each one. The calls run on an event loop in a background thread, capped
+by a semaphore, and each one runs in a worker thread via asyncio.to_thread.
+That way they share the pooled NextKeySign session. Waits for rate-limit
+tokens are reserved and waited out with asyncio sleeps, so they don't hold a
+thread.
+
+Outcomes are yielded back to the task's own thread as they complete. The
+task does every database write there, on its normal Django connection,
+since the ORM can't be used from inside a running event loop.
+"""
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from roblex import rate_limit
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+async def _wait_for_token(rate_limit_name):
+    # Book the token and sleep until it is ours, instead of polling for it
+    delay = await asyncio.to_thread(rate_limit.reserve, rate_limit_name)
+    if delay:
+        await asyncio.sleep(delay)
+
+
+async def _dispatch(items, call, concurrency, rate_limit_name, concurrency_limit, results):
+    loop = asyncio.get_running_loop()
+    # asyncio.run shuts this executor down when the loop finishes
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    # Acts as a semaphore whose size is re-read whenever a call finishes
+    slots = asyncio.Condition()
+    in_flight = 0
+
+    def has_slot():
+        limit = min(concurrency, concurrency_limit()) if concurrency_limit else concurrency
+        return in_flight < max(1, limit)
+
+    async def run(item):
+        nonlocal in_flight
+        async with slots:
+            await slots.wait_for(has_slot)
+            in_flight += 1
+        try:
+            if rate_limit_name:
+                await _wait_for_token(rate_limit_name)
+            results.put(await asyncio.to_thread(call, item))
+        finally:
+            async with slots:
+                in_flight -= 1
+                slots.notify_all()
+
+    await asyncio.gather(*(run(item) for item in items))
+
+
+def dispatch(items, call, concurrency, rate_limit_name=None, concurrency_limit=None):
+    """
+    Run call(item) for every item with up to `concurrency` calls in flight and
+    yield the return values in completion order. `call` should catch its own
+    errors and report them in its return value.
+
+    If rate_limit_name is given, each call first reserves a token from that
+    shared bucket and waits until it is due (see roblex/rate_limit.py). concurrency_limit is an optional
+    callable giving a lower, changing cap, such as the circuit breaker's
+    adaptive limit (see roblex/circuit_breaker.py).
+    """
+    results = queue.Queue()
+    errors = []
+
+    def run_loop():
+        try:
+            asyncio.run(_dispatch(items, call, concurrency, rate_limit_name, concurrency_limit, results))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            results.put(_DONE)
+
+    thread = threading.Thread(target=run_loop, name='submission-dispatcher', daemon=True)
+    thread.start()
+
+    while True:
+        result = results.get()
+        if result is _DONE:
+            break
+        yield result
+
+    thread.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,784 @@
+"""
+Streaming readers for bulk retainer recipient uploads.
+
+Uploads may be .xlsx, CSV/TSV or Parquet. Every format is read through a
+RowReader that yields rows one at a time, and rows are handed to the caller
+in fixed-size batches, so memory use depends on the batch size rather than
+on the size of the file.
+
+A law firm's own header names, value coercions and defaults are described by
+a ColumnMappingProfile and compiled once per import into a ColumnMapping that
+normalize_batch applies column by column.
+"""
+import codecs
+import csv
+import hashlib
+import logging
+import os
+import posixpath
+import zipfile
+from functools import partial
+from itertools import islice
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string, range_boundaries
+
+from .models import RetainerRecipient
+
+logger = logging.getLogger(__name__)
+
+# Expected columns
+REQUIRED_COLUMNS = ['ID', 'Name', 'Email']
+OPTIONAL_COLUMNS = ['Phone', 'State', 'Zip Code', 'Age', 'First Name Injured', 'Last Name Injured']
+
+# Spreadsheet column -> RetainerRecipient field
+COLUMN_FIELD_MAP = {
+    'ID': 'external_id',
+    'Name': 'name',
+    'Email': 'email',
+    'Phone': 'phone',
+    'State': 'state',
+    'Zip Code': 'zip_code',
+    'Age': 'age',
+    'First Name Injured': 'first_name_injured',
+    'Last Name Injured': 'last_name_injured',
+}
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def cell_to_str(value):
+    """
+    Convert a raw cell value to the string form the import expects.
+    Empty cells come back as None so callers can tell them apart from ''.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        # Numeric IDs, phones and zip codes are often stored as floats
+        return str(int(value))
+    return str(value)
+
+
+def _clean_headers(values):
+    return [
+        str(value).strip() if value is not None else f"Unnamed: {index}"
+        for index, value in enumerate(values)
+    ]
+
+
+class RowReader:
+    """
+    Base class for streaming upload readers.
+
+    Subclasses set self.headers in open() and implement iter_rows(), which
+    yields (row_number, row) pairs where row maps header -> string value or
+    None. Row 1 is the header, so data rows are numbered from 2.
+
+    Usage:
+        with open_row_reader(path) as reader:
+            for row_number, row in reader.iter_rows():
+                ...
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.headers = []
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def estimated_rows(self):
+        """
+        Approximate number of data rows, obtained without parsing them.
+        Returns None when it cannot be determined cheaply.
+        """
+        return None
+
+    def iter_rows(self, start_row=2, end_row=None):
+        raise NotImplementedError
+
+
+class ExcelRowReader(RowReader):
+    """
+    Read-only, row-at-a-time view over the first worksheet of an .xlsx file.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.workbook = None
+        self.worksheet = None
+
+    def open(self):
+        # read_only streams the sheet XML instead of building the full cell tree
+        self.workbook = load_workbook(self.path, read_only=True, data_only=True)
+        self.worksheet = self.workbook.worksheets[0]
+
+        header_row = next(self.worksheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        self.headers = _clean_headers(header_row)
+
+    def close(self):
+        if self.workbook is not None:
+            self.workbook.close()
+            self.workbook = None
+            self.worksheet = None
+
+    def estimated_rows(self):
+        """
+        Number of data rows according to the sheet dimensions, without reading them.
+        Returns None when the file does not record its dimensions.
+        """
+        max_row = self.worksheet.max_row
+        if not max_row:
+            return None
+        return max(max_row - 1, 0)
+
+    def iter_rows(self, start_row=2, end_row=None):
+        """
+        Yield (row_number, row) pairs where row maps header -> string value or None.
+        row_number is the spreadsheet row number (header is row 1).
+        start_row/end_row limit the scan to an inclusive range of sheet rows.
+        Completely empty rows are ignored.
+        """
+        headers = self.headers
+        start_row = max(start_row, 2)
+        rows = self.worksheet.iter_rows(min_row=start_row, max_row=end_row, values_only=True)
+        for row_number, values in enumerate(rows, start=start_row):
+            if all(value is None for value in values):
+                continue
+            yield row_number, {
+                header: cell_to_str(value)
+                for header, value in zip(headers, values)
+            }
+
+
+# Encodings a text upload is tried in, in order. utf-8-sig drops the BOM Excel
+# adds when saving as "CSV UTF-8"; a plain "CSV" saved by Excel on Windows is cp1252.
+CSV_ENCODINGS = ['utf-8-sig', 'cp1252']
+
+
+def detect_encoding(path, encodings=CSV_ENCODINGS):
+    """
+    First of `encodings` that decodes the whole file, checked in one streaming
+    pass per candidate. Raises ValueError if none does, rather than importing
+    names and emails with replacement characters.
+    """
+    for encoding in encodings:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(path, 'rb') as raw:
+                for chunk in iter(lambda: raw.read(1024 * 1024), b''):
+                    decoder.decode(chunk)
+                decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    raise ValueError(
+        "The file is not UTF-8 or Windows-1252 text. Please save it from Excel as \"CSV UTF-8\" and upload it again"
+    )
+
+
+class CsvRowReader(RowReader):
+    """
+    Streaming reader for comma or tab separated text files.
+    Row numbers count records, so quoted multi-line cells stay one row.
+    The encoding is detected with detect_encoding() unless one is given.
+    """
+
+    def __init__(self, path, delimiter=',', encoding=None):
+        super().__init__(path)
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.file = None
+        self.reader = None
+
+    def open(self):
+        if self.encoding is None:
+            self.encoding = detect_encoding(self.path)
+        self.file = open(self.path, newline='', encoding=self.encoding)
+        self.reader = csv.reader(self.file, delimiter=self.delimiter)
+        self.headers = _clean_headers(next(self.reader, []))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.reader = None
+
+    def estimated_rows(self):
+        """
+        Line count minus the header, counted on raw bytes without parsing.
+        Cells with embedded newlines make this an overestimate.
+        """
+        lines = 0
+        last_chunk = b''
+        with open(self.path, 'rb') as raw:
+            for chunk in iter(lambda: raw.read(1024 * 1024), b''):
+                lines += chunk.count(b'\n')
+                last_chunk = chunk
+        if last_chunk and not last_chunk.endswith(b'\n'):
+            lines += 1
+        return max(lines - 1, 0)
+
+    def iter_rows(self, start_row=2, end_row=None):
+        headers = self.headers
+        start_row = max(start_row, 2)
+        for row_number, values in enumerate(self.reader, start=2):
+            if end_row is not None and row_number > end_row:
+                return
+            if row_number < start_row or not any(value.strip() for value in values):
+                continue
+            yield row_number, {
+                header: value if value != '' else None
+                for header, value in zip(headers, values)
+            }
+
+
+class ParquetRowReader(RowReader):
+    """
+    Columnar reader for Parquet files. Data is read one record batch at a time
+    and the row count comes from the file metadata.
+    """
+
+    read_batch_size = 10000
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.parquet_file = None
+
+    def open(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet uploads require the pyarrow package")
+
+        self.parquet_file = pq.ParquetFile(self.path)
+        self.headers = _clean_headers(self.parquet_file.schema_arrow.names)
+
+    def close(self):
+        if self.parquet_file is not None:
+            self.parquet_file.close()
+            self.parquet_file = None
+
+    def estimated_rows(self):
+        return self.parquet_file.metadata.num_rows
+
+    def iter_rows(self, start_row=2, end_row=None):
+        headers = self.headers
+        start_row = max(start_row, 2)
+        row_number = 2
+        for record_batch in self.parquet_file.iter_batches(batch_size=self.read_batch_size):
+            batch_start = row_number
+            row_number += record_batch.num_rows
+            if row_number <= start_row:
+                continue
+            if end_row is not None and batch_start > end_row:
+                return
+
+            columns = [
+                [cell_to_str(value) for value in column.to_pylist()]
+                for column in record_batch.columns
+            ]
+            for offset, values in enumerate(zip(*columns)):
+                current_row = batch_start + offset
+                if current_row < start_row:
+                    continue
+                if end_row is not None and current_row > end_row:
+                    return
+                if all(value is None for value in values):
+                    continue
+                yield current_row, dict(zip(headers, values))
+
+
+READERS_BY_EXTENSION = {
+    '.xlsx': ExcelRowReader,
+    '.xlsm': ExcelRowReader,
+    '.csv': CsvRowReader,
+    '.tsv': partial(CsvRowReader, delimiter='\t'),
+    '.tab': partial(CsvRowReader, delimiter='\t'),
+    '.parquet': ParquetRowReader,
+}
+
+def open_row_reader(path):
+    """
+    Pick a streaming reader for an upload based on its extension, falling back
+    to the file signature for unknown or missing extensions.
+    """
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension in READERS_BY_EXTENSION:
+        return READERS_BY_EXTENSION[extension](path)
+
+    with open(path, 'rb') as raw:
+        head = raw.read(4096)
+
+    if head.startswith(b'PK\x03\x04'):
+        return ExcelRowReader(path)
+    if head.startswith(b'PAR1'):
+        return ParquetRowReader(path)
+    if head.startswith(b'\xd0\xcf\x11\xe0'):
+        raise ValueError("Legacy .xls files are not supported, please save the sheet as .xlsx or .csv")
+
+    first_line = head.split(b'\n', 1)[0]
+    delimiter = '\t' if first_line.count(b'\t') > first_line.count(b',') else ','
+    return CsvRowReader(path, delimiter=delimiter)
+
+
+# Data rows shown by an upload preview
+PREVIEW_ROWS = 20
+
+_SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+
+def _xlsx_part_paths(archive):
+    """Archive paths of the first worksheet and the shared strings table"""
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    sheet_rel_id = workbook.find(f'{_SHEET_NS}sheets/{_SHEET_NS}sheet').get(f'{_REL_NS}id')
+
+    targets = {}
+    for rel in ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels')):
+        target = rel.get('Target')
+        target = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+        targets[rel.get('Id')] = target
+        if rel.get('Type', '').endswith('/sharedStrings'):
+            targets['sharedStrings'] = target
+
+    return targets[sheet_rel_id], targets.get('sharedStrings')
+
+
+def _read_shared_strings(archive, path, indexes):
+    """Only the shared strings at `indexes`, streaming the table no further than needed"""
+    strings = {}
+    if not indexes or not path:
+        return strings
+
+    last_index = max(indexes)
+    index = 0
+    with archive.open(path) as table:
+        for _, element in ElementTree.iterparse(table):
+            if element.tag != f'{_SHEET_NS}si':
+                continue
+            if index in indexes:
+                # Plain text or rich text runs; phonetic hints are not part of the value
+                runs = element.findall(f'{_SHEET_NS}t') + element.findall(f'{_SHEET_NS}r/{_SHEET_NS}t')
+                strings[index] = ''.join(run.text or '' for run in runs)
+            element.clear()
+            if index >= last_index:
+                break
+            index += 1
+    return strings
+
+
+def _preview_xlsx(path, limit):
+    """
+    Headers, row count and first rows of an .xlsx file, read straight from
+    the sheet XML. openpyxl loads the whole shared strings table when it opens
+    a workbook and scans the whole sheet when it has no recorded dimension;
+    this stops as soon as it has `limit` rows.
+    """
+    with zipfile.ZipFile(path) as archive:
+        sheet_path, strings_path = _xlsx_part_paths(archive)
+
+        estimated_rows = None
+        raw_rows = []
+        with archive.open(sheet_path) as sheet:
+            row_number = 0
+            for _, element in ElementTree.iterparse(sheet):
+                if element.tag == f'{_SHEET_NS}dimension':
+                    ref = element.get('ref', '')
+                    if ':' in ref:
+                        estimated_rows = max(range_boundaries(ref)[3] - 1, 0)
+                elif element.tag == f'{_SHEET_NS}row':
+                    row_number = int(element.get('r', row_number + 1))
+                    cells = {}
+                    column = 0
+                    for cell in element.iter(f'{_SHEET_NS}c'):
+                        reference = cell.get('r')
+                        column = column_index_from_string(coordinate_from_string(reference)[0]) if reference else column + 1
+                        cell_type = cell.get('t', 'n')
+                        if cell_type == 'inlineStr':
+                            value = ''.join(text.text or '' for text in cell.iter(f'{_SHEET_NS}t'))
+                        else:
+                            value_element = cell.find(f'{_SHEET_NS}v')
+                            value = value_element.text if value_element is not None else None
+                        cells[column] = (cell_type, value)
+                    element.clear()
+                    if any(value is not None for _, value in cells.values()) or row_number == 1:
+                        raw_rows.append((row_number, cells))
+                    if len(raw_rows) > limit:
+                        break
+
+        shared = _read_shared_strings(
+            archive, strings_path,
+            {int(value) for _, cells in raw_rows for cell_type, value in cells.values() if cell_type == 's' and value is not None}
+        )
+
+    def convert(cell_type, value):
+        if value is None:
+            return None
+        if cell_type == 's':
+            return shared.get(int(value))
+        if cell_type == 'b':
+            return str(value == '1')
+        if cell_type == 'n':
+            number = float(value)
+            return cell_to_str(number)
+        return value
+
+    header_cells = raw_rows[0][1] if raw_rows and raw_rows[0][0] == 1 else {}
+    width = max(header_cells, default=0)
+    headers = _clean_headers([convert(*header_cells[column]) if column in header_cells else None for column in range(1, width + 1)])
+
+    rows = []
+    for row_number, cells in raw_rows:
+        if row_number == 1:
+            continue
+        rows.append((row_number, {
+            header: convert(*cells[column]) if column in cells else None
+            for column, header in enumerate(headers, start=1)
+        }))
+    return headers, estimated_rows, rows[:limit]
+
+
+def preview_upload(path, limit=PREVIEW_ROWS):
+    """
+    (headers, estimated_rows, first rows) of an upload without reading the
+    rest of the file. estimated_rows is None when the file does not record it.
+    """
+    reader = open_row_reader(path)
+    if isinstance(reader, ExcelRowReader):
+        try:
+            return _preview_xlsx(path, limit)
+        except (KeyError, AttributeError, ValueError, ElementTree.ParseError) as e:
+            # Unusual workbook layout, let openpyxl deal with it
+            logger.warning(f"Falling back to openpyxl to preview {path}: {str(e)}")
+
+    with reader:
+        rows = list(islice(reader.iter_rows(), limit))
+        return reader.headers, reader.estimated_rows(), rows
+
+
+class SpooledShardReader(CsvRowReader):
+    """
+    Rows of one shard as written by spool_shards(): a UTF-8 CSV with the
+    sheet row number in the first column, followed by the upload's columns.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, encoding='utf-8')
+
+    def open(self):
+        super().open()
+        self.headers = self.headers[1:]
+
+    def estimated_rows(self):
+        return None
+
+    def iter_rows(self, start_row=2, end_row=None):
+        headers = self.headers
+        for values in self.reader:
+            row_number = int(values[0])
+            if row_number < start_row:
+                continue
+            if end_row is not None and row_number > end_row:
+                return
+            yield row_number, {
+                header: value if value != '' else None
+                for header, value in zip(headers, values[1:])
+            }
+
+
+def spool_path(directory, start_row):
+    return os.path.join(directory, f"{start_row}.csv")
+
+
+def spool_shards(reader, directory, shard_size):
+    """
+    Split an upload into shards of shard_size data rows in a single pass over
+    the file. Each shard's rows are written to their own file under
+    `directory` (see SpooledShardReader), so a shard task reads just its rows
+    instead of parsing the upload from the top to reach them. Works the same
+    whether or not the file records its row count.
+    Returns a list of (start_row, end_row, rows) per shard.
+    """
+    os.makedirs(directory, exist_ok=True)
+    headers = reader.headers
+    shards = []
+    spool = writer = None
+    start_row = rows = 0
+
+    def close_spool(end_row):
+        spool.close()
+        path = spool_path(directory, start_row)
+        os.replace(f"{path}.tmp", path)
+        shards.append((start_row, end_row, rows))
+
+    row_number = None
+    for row_number, row in reader.iter_rows():
+        if spool is None:
+            start_row, rows = row_number, 0
+            spool = open(f"{spool_path(directory, start_row)}.tmp", 'w', newline='', encoding='utf-8')
+            writer = csv.writer(spool)
+            writer.writerow(['Row', *headers])
+        writer.writerow([row_number, *(row.get(header) for header in headers)])
+        rows += 1
+        if rows >= shard_size:
+            close_spool(row_number)
+            spool = None
+    if spool is not None:
+        close_spool(row_number)
+    return shards
+
+
+def iter_batches(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Group an iterable of rows into lists of at most batch_size items
+    """
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _zip5(column):
+    digits = column.str.replace(r'\D', '', regex=True).str[:5]
+    # Zip codes stored as numbers lose their leading zero
+    return digits.where(digits.str.len() != 4, '0' + digits)
+
+
+# Vectorized value coercions a column mapping can apply, by name
+COERCIONS = {
+    'lower': lambda column: column.str.lower(),
+    'upper': lambda column: column.str.upper(),
+    'title': lambda column: column.str.title(),
+    'digits': lambda column: column.str.replace(r'\D', '', regex=True),
+    'zip5': _zip5,
+}
+
+
+def _header_key(header):
+    """Headers match regardless of case and spacing"""
+    return ' '.join(str(header).split()).casefold()
+
+
+class ColumnMapping:
+    """
+    Column mapping compiled for one file's headers: the file header feeding
+    each expected column, plus per-column coercions and blank-cell defaults.
+    """
+
+    def __init__(self, sources, coercions, defaults):
+        # Expected column -> file header, or None when the file lacks it
+        self.sources = sources
+        # (column, vectorized function) pairs, applied in order
+        self.coercions = coercions
+        self.defaults = defaults
+
+    @property
+    def missing_required(self):
+        return [
+            column for column in REQUIRED_COLUMNS
+            if self.sources[column] is None and not self.defaults.get(column)
+        ]
+
+    def transform(self, df):
+        for column, coerce in self.coercions:
+            df[column] = coerce(df[column])
+        for column, default in self.defaults.items():
+            df[column] = df[column].mask(df[column].eq(''), default)
+        return df
+
+
+def compile_column_mapping(headers, aliases=None, coercions=None, defaults=None):
+    """
+    Resolve expected columns against a file's headers once per import.
+
+    aliases maps an expected column to other header names it may appear
+    under, coercions maps it to one or more COERCIONS names, and defaults to
+    the value used for blank cells. Raises ValueError for unknown columns or
+    coercions.
+    """
+    columns = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+    aliases = aliases or {}
+    coercions = coercions or {}
+    defaults = defaults or {}
+
+    unknown = [column for column in {**aliases, **coercions, **defaults} if column not in columns]
+    if unknown:
+        raise ValueError(f"Unknown columns in mapping: {', '.join(unknown)}")
+
+    headers_by_key = {}
+    for header in headers:
+        headers_by_key.setdefault(_header_key(header), header)
+
+    sources = {}
+    claimed = set()
+    for column in columns:
+        sources[column] = None
+        for name in [column] + list(aliases.get(column, [])):
+            header = headers_by_key.get(_header_key(name))
+            if header is not None and header not in claimed:
+                sources[column] = header
+                claimed.add(header)
+                break
+
+    compiled = []
+    for column, names in coercions.items():
+        for name in [names] if isinstance(names, str) else names:
+            if name not in COERCIONS:
+                raise ValueError(f"Unknown coercion '{name}' for column {column}")
+            compiled.append((column, COERCIONS[name]))
+
+    return ColumnMapping(
+        sources, compiled, {column: str(value).strip() for column, value in defaults.items()}
+    )
+
+
+# Recipient fields that make up a row's content hash
+HASHED_FIELDS = list(COLUMN_FIELD_MAP.values())
+
+
+def compute_row_hash(record):
+    """
+    SHA-256 of a normalized recipient record, used to spot rows that did not
+    change between an upload and its corrected version
+    """
+    content = '\x1f'.join('' if record[field] is None else str(record[field]) for field in HASHED_FIELDS)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class NormalizedBatch:
+    """
+    Result of validating one batch of rows.
+
+    records: list of dicts ready to be passed to RetainerRecipient(**record)
+    row_numbers: sheet row number of each entry in records
+    skipped: list of (row_number, reason) for rows that are not imported
+    failed: list of (row_number, reason) for rows whose data cannot be stored
+    """
+
+    def __init__(self, records, row_numbers, skipped, failed):
+        self.records = records
+        self.row_numbers = row_numbers
+        self.skipped = skipped
+        self.failed = failed
+
+    def skip(self, indexes, reasons):
+        """
+        Move the records at the given positions to skipped with the matching reasons
+        """
+        dropped = set(indexes)
+        self.skipped.extend(zip((self.row_numbers[index] for index in indexes), reasons))
+        self.skipped.sort()
+        self.records = [record for index, record in enumerate(self.records) if index not in dropped]
+        self.row_numbers = [number for index, number in enumerate(self.row_numbers) if index not in dropped]
+
+
+def _field_max_lengths():
+    lengths = {}
+    for column, field_name in COLUMN_FIELD_MAP.items():
+        max_length = getattr(RetainerRecipient._meta.get_field(field_name), 'max_length', None)
+        if max_length:
+            lengths[column] = max_length
+    return lengths
+
+
+def _reasons(mask, labels, prefix):
+    """
+    Build one reason string per row from a boolean frame, listing the columns that are True
+    """
+    joined = mask.to_numpy(dtype=object).dot(np.array([f"{label}, " for label in labels], dtype=object))
+    return [f"{prefix}: {reason.rstrip(', ')}" for reason in joined]
+
+
+def normalize_batch(batch, mapping=None):
+    """
+    Validate and normalize a batch of (row_number, row) pairs column by column.
+
+    Every check runs once per column over the whole batch instead of once per
+    row, which keeps the per-row Python work down to building the final dicts.
+    Without a ColumnMapping, headers must match the expected columns exactly.
+    """
+    if not batch:
+        return NormalizedBatch([], [], [], [])
+
+    columns = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+    if mapping is None:
+        sources = {column: column for column in columns}
+    else:
+        sources = {column: source for column, source in mapping.sources.items() if source is not None}
+
+    df = pd.DataFrame.from_records(
+        [row for _, row in batch],
+        index=[row_number for row_number, _ in batch],
+        columns=list(sources.values()),
+    )
+    df.columns = list(sources)
+    df = df.reindex(columns=columns)
+
+    # Blank cells, whitespace-only cells and missing columns all become ''
+    df = df.fillna('').astype(str).apply(lambda column: column.str.strip())
+
+    if mapping is not None:
+        df = mapping.transform(df)
+
+    # Required field checks
+    missing = df[REQUIRED_COLUMNS].eq('')
+    skip_mask = missing.any(axis=1)
+
+    # Values too long for their database column would fail the whole insert
+    max_lengths = _field_max_lengths()
+    too_long = pd.DataFrame(
+        {column: df[column].str.len() > max_length for column, max_length in max_lengths.items()},
+        index=df.index,
+    )
+    fail_mask = too_long.any(axis=1) & ~skip_mask
+
+    skipped = list(zip(
+        df.index[skip_mask].tolist(),
+        _reasons(missing[skip_mask], REQUIRED_COLUMNS, "Missing required data"),
+    ))
+    failed = list(zip(
+        df.index[fail_mask].tolist(),
+        _reasons(too_long[fail_mask], list(max_lengths), "Value too long"),
+    ))
+
+    valid = df[~(skip_mask | fail_mask)]
+
+    # Age must be all digits, anything else is stored as unknown
+    ages = valid['Age']
+    is_digit = ages.str.fullmatch(r'\d+').astype(bool)
+    age_values = pd.to_numeric(ages.where(is_digit), errors='coerce').astype('Int64')
+    age_values = age_values.astype(object).where(is_digit, None)
+
+    valid = valid.drop(columns=['Age']).rename(columns=COLUMN_FIELD_MAP)
+    valid['age'] = age_values
+
+    # Column lists zipped into dicts; much cheaper than to_dict('records') on string columns
+    fields = list(valid.columns)
+    records = [
+        dict(zip(fields, values))
+        for values in zip(*(valid[field].tolist() for field in fields))
+    ]
+    for record in records:
+        record['row_hash'] = compute_row_hash(record)
+
+    return NormalizedBatch(records, valid.index.tolist(), skipped, failed)
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-17 01:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0007_dashboardlink'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExcelUploadShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_row', models.IntegerField(help_text='First sheet row of this shard (header is row 1)')),
+                ('end_row', models.IntegerField(blank=True, help_text='Last sheet row of this shard, blank for end of sheet', null=True)),
+                ('next_row', models.IntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('total_rows', models.IntegerField(default=0)),
+                ('successful_rows', models.IntegerField(default=0)),
+                ('failed_rows', models.IntegerField(default=0)),
+                ('skipped_rows', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('excel_upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='retainer_app.excelupload')),
+            ],
+            options={
+                'verbose_name': 'Excel Upload Shard',
+                'verbose_name_plural': 'Excel Upload Shards',
+                'ordering': ['excel_upload', 'start_row'],
+                'unique_together': {('excel_upload', 'start_row')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.23 on 2026-10-17 01:51
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0008_exceluploadshard'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='excelupload',
+            name='file',
+            field=models.FileField(help_text='Recipient list as .xlsx, .csv, .tsv or .parquet', upload_to='retainer_excel_uploads/', validators=[django.core.validators.FileExtensionValidator(['xlsx', 'xlsm', 'csv', 'tsv', 'tab', 'txt', 'parquet'])]),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.23 on 2026-10-17 01:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_dedup_keys(apps, schema_editor):
+    """Index recipients imported before the dedup index existed, oldest first"""
+    RetainerRecipient = apps.get_model('retainer_app', 'RetainerRecipient')
+    RecipientDedupKey = apps.get_model('retainer_app', 'RecipientDedupKey')
+    db_alias = schema_editor.connection.alias
+
+    recipients = RetainerRecipient.objects.using(db_alias).order_by('id').values_list(
+        'id', 'external_id', 'email', 'excel_upload__law_firm_id'
+    )
+
+    keys = []
+    for recipient_id, external_id, email, law_firm_id in recipients.iterator(chunk_size=2000):
+        keys.append(RecipientDedupKey(
+            law_firm_id=law_firm_id, key_type='external_id',
+            value=external_id.strip().casefold(), recipient_id=recipient_id
+        ))
+        keys.append(RecipientDedupKey(
+            law_firm_id=law_firm_id, key_type='email',
+            value=email.strip().lower(), recipient_id=recipient_id
+        ))
+        if len(keys) >= 2000:
+            RecipientDedupKey.objects.using(db_alias).bulk_create(keys, ignore_conflicts=True)
+            keys = []
+
+    if keys:
+        RecipientDedupKey.objects.using(db_alias).bulk_create(keys, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0009_alter_excelupload_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipientDedupKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_type', models.CharField(choices=[('external_id', 'External ID'), ('email', 'Email')], max_length=20)),
+                ('value', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('law_firm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipient_dedup_keys', to='retainer_app.lawfirm')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dedup_keys', to='retainer_app.retainerrecipient')),
+            ],
+            options={
+                'verbose_name': 'Recipient Dedup Key',
+                'verbose_name_plural': 'Recipient Dedup Keys',
+                'unique_together': {('law_firm', 'key_type', 'value')},
+            },
+        ),
+        migrations.RunPython(backfill_dedup_keys, migrations.RunPython.noop),
+    ]
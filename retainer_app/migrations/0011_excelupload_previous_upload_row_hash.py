@@ -0,0 +1,24 @@
+# Generated by Django 4.2.23 on 2026-10-17 01:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0010_recipientdedupkey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='excelupload',
+            name='previous_upload',
+            field=models.ForeignKey(blank=True, help_text='Earlier upload this file corrects. Only new or changed rows will be processed.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='retainer_app.excelupload'),
+        ),
+        migrations.AddField(
+            model_name='retainerrecipient',
+            name='row_hash',
+            field=models.CharField(blank=True, help_text='Hash of the normalized row, used to diff re-uploads', max_length=64),
+        ),
+    ]
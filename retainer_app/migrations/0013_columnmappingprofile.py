@@ -0,0 +1,38 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0012_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ColumnMappingProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('is_default', models.BooleanField(default=False, help_text="Used for this law firm's uploads that don't pick a profile")),
+                ('header_aliases', models.JSONField(blank=True, default=dict, help_text='Expected column -> other header names, e.g. {"ID": ["Client ID", "Claimant #"], "Email": ["E-mail"]}')),
+                ('coercions', models.JSONField(blank=True, default=dict, help_text='Expected column -> coercion or list of coercions: lower, upper, title, digits, zip5. e.g. {"Email": "lower", "Zip Code": "zip5"}')),
+                ('defaults', models.JSONField(blank=True, default=dict, help_text='Expected column -> value used for blank cells, e.g. {"State": "FL"}')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('law_firm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='column_mapping_profiles', to='retainer_app.lawfirm')),
+            ],
+            options={
+                'verbose_name': 'Column Mapping Profile',
+                'verbose_name_plural': 'Column Mapping Profiles',
+                'unique_together': {('law_firm', 'name')},
+            },
+        ),
+        migrations.AddField(
+            model_name='excelupload',
+            name='column_mapping',
+            field=models.ForeignKey(blank=True, help_text="Header aliases, coercions and defaults for this file. Defaults to the law firm's default profile.", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='excel_uploads', to='retainer_app.columnmappingprofile'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0013_columnmappingprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadRowOutcome',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_number', models.PositiveIntegerField()),
+                ('outcome', models.CharField(choices=[('skipped', 'Skipped'), ('failed', 'Failed')], max_length=10)),
+                ('reason', models.TextField()),
+                ('excel_upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='row_outcomes', to='retainer_app.excelupload')),
+            ],
+            options={
+                'verbose_name': 'Upload Row Outcome',
+                'verbose_name_plural': 'Upload Row Outcomes',
+                'indexes': [models.Index(fields=['excel_upload', 'row_number'], name='retainer_ap_excel_u_bf6f3f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0014_uploadrowoutcome'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=100, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('email_queued_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('recipient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='submission_outbox', to='retainer_app.retainerrecipient')),
+            ],
+            options={
+                'verbose_name': 'Submission Outbox Entry',
+                'verbose_name_plural': 'Submission Outbox',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'claimed_at'], name='retainer_ap_status_441527_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0015_submissionoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('floor_id', models.BigIntegerField(blank=True, null=True)),
+                ('cursor_id', models.BigIntegerField(blank=True, null=True)),
+                ('sweep_report', models.JSONField(blank=True, default=dict)),
+                ('last_report', models.JSONField(blank=True, default=dict)),
+                ('sweep_started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_sweep_completed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Submission Sync State',
+                'verbose_name_plural': 'Submission Sync State',
+            },
+        ),
+    ]
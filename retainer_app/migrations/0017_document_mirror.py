@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0016_submissionsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentsubmission',
+            name='audit_log_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='documentsubmission',
+            name='documents_mirrored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentsubmission',
+            name='mirror_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='documentsubmission',
+            name='signed_document_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
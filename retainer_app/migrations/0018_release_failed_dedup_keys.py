@@ -0,0 +1,24 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:10
+
+from django.db import migrations
+
+
+def release_failed_dedup_keys(apps, schema_editor):
+    """Recipients whose submission failed were never sent a retainer, so they are not duplicates"""
+    RecipientDedupKey = apps.get_model('retainer_app', 'RecipientDedupKey')
+    db_alias = schema_editor.connection.alias
+
+    RecipientDedupKey.objects.using(db_alias).filter(
+        recipient__status='failed', recipient__document_submission__isnull=True
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0017_document_mirror'),
+    ]
+
+    operations = [
+        migrations.RunPython(release_failed_dedup_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0018_release_failed_dedup_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentsubmission',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('opened', 'Opened'), ('completed', 'Completed'), ('declined', 'Declined'), ('expired', 'Expired'), ('archived', 'Archived')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='retainerrecipient',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('submitted', 'Submitted to NextKeySign'), ('completed', 'Document Completed'), ('failed', 'Failed'), ('skipped', 'Skipped (Invalid Data)'), ('superseded', 'Superseded by a Later Upload')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='submissionoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retainer_app', '0019_supersede_corrected_recipients'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='column_mapping',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='retainer_app.columnmappingprofile'),
+        ),
+    ]
@@ -1,3 +1,9 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import FileExtensionValidator
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -177,6 +183,60 @@ class EmailTemplate(models.Model):
         unique_together = ('name', 'law_firm')
 
 
+class ColumnMappingProfile(models.Model):
+    """How a law firm's spreadsheets map onto the expected upload columns"""
+    law_firm = models.ForeignKey(LawFirm, on_delete=models.CASCADE, related_name='column_mapping_profiles')
+    name = models.CharField(max_length=100)
+    is_default = models.BooleanField(
+        default=False,
+        help_text="Used for this law firm's uploads that don't pick a profile"
+    )
+    header_aliases = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Expected column -> other header names, e.g. {"ID": ["Client ID", "Claimant #"], "Email": ["E-mail"]}'
+    )
+    coercions = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Expected column -> coercion or list of coercions: lower, upper, title, digits, zip5. '
+                  'e.g. {"Email": "lower", "Zip Code": "zip5"}'
+    )
+    defaults = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Expected column -> value used for blank cells, e.g. {"State": "FL"}'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} - {self.law_firm.name}"
+
+    def clean(self):
+        for field_name in ['header_aliases', 'coercions', 'defaults']:
+            if not isinstance(getattr(self, field_name), dict):
+                raise ValidationError({field_name: "Must be a JSON object keyed by column name"})
+        try:
+            self.compile([])
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+    def compile(self, headers):
+        """ColumnMapping of this profile for a file with the given headers"""
+        from .excel_import import compile_column_mapping
+        return compile_column_mapping(headers, self.header_aliases, self.coercions, self.defaults)
+
+    class Meta:
+        verbose_name = "Column Mapping Profile"
+        verbose_name_plural = "Column Mapping Profiles"
+        unique_together = ('law_firm', 'name')
+
+
+# Formats accepted for bulk recipient uploads, see excel_import.READERS_BY_EXTENSION
+SUPPORTED_UPLOAD_EXTENSIONS = ['xlsx', 'xlsm', 'csv', 'tsv', 'tab', 'txt', 'parquet']
+
+
 class ExcelUpload(models.Model):
     """Excel file uploads for bulk retainer document processing"""
     STATUS_CHOICES = [
@@ -188,9 +248,29 @@ class ExcelUpload(models.Model):
 
     law_firm = models.ForeignKey(LawFirm, on_delete=models.CASCADE, related_name='excel_uploads')
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
-    file = models.FileField(upload_to='retainer_excel_uploads/')
+    file = models.FileField(
+        upload_to='retainer_excel_uploads/',
+        validators=[FileExtensionValidator(SUPPORTED_UPLOAD_EXTENSIONS)],
+        help_text="Recipient list as .xlsx, .csv, .tsv or .parquet"
+    )
     document_template = models.ForeignKey(DocumentTemplate, on_delete=models.CASCADE)
     email_template = models.ForeignKey(EmailTemplate, on_delete=models.CASCADE)
+    previous_upload = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='revisions',
+        help_text="Earlier upload this file corrects. Only new or changed rows will be processed."
+    )
+    column_mapping = models.ForeignKey(
+        ColumnMappingProfile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='excel_uploads',
+        help_text="Header aliases, coercions and defaults for this file. Defaults to the law firm's default profile."
+    )
     
     # Status tracking
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploaded')
@@ -218,12 +298,137 @@ class ExcelUpload(models.Model):
             return round((self.successful_submissions / self.total_rows) * 100, 2)
         return 0
 
+    def get_column_mapping_profile(self):
+        if self.column_mapping_id:
+            return self.column_mapping
+        return self.law_firm.column_mapping_profiles.filter(is_default=True).first()
+
+    def compile_column_mapping(self, headers):
+        """ColumnMapping for this upload's file, compiled once per import"""
+        profile = self.get_column_mapping_profile()
+        if profile:
+            return profile.compile(headers)
+        from .excel_import import compile_column_mapping
+        return compile_column_mapping(headers)
+
+    def get_previous_upload_ids(self):
+        """IDs of the uploads this one revises, nearest first"""
+        upload_ids = []
+        previous = self.previous_upload
+        while previous and previous.id not in upload_ids and previous.id != self.id:
+            upload_ids.append(previous.id)
+            previous = previous.previous_upload
+        return upload_ids
+
     class Meta:
         verbose_name = "Excel Upload"
         verbose_name_plural = "Excel Uploads"
         ordering = ['-created_at']
 
 
+class ExcelUploadShard(models.Model):
+    """Row range of an Excel upload with a durable checkpoint of committed rows"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    excel_upload = models.ForeignKey(ExcelUpload, on_delete=models.CASCADE, related_name='shards')
+    start_row = models.IntegerField(help_text="First sheet row of this shard (header is row 1)")
+    end_row = models.IntegerField(null=True, blank=True, help_text="Last sheet row of this shard, blank for end of sheet")
+    
+    # Checkpoint - everything before next_row has been committed
+    next_row = models.IntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    
+    # Committed statistics
+    total_rows = models.IntegerField(default=0)
+    successful_rows = models.IntegerField(default=0)
+    failed_rows = models.IntegerField(default=0)
+    skipped_rows = models.IntegerField(default=0)
+    
+    error_message = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.excel_upload_id} rows {self.start_row}-{self.end_row or 'end'} - {self.status}"
+
+    class Meta:
+        verbose_name = "Excel Upload Shard"
+        verbose_name_plural = "Excel Upload Shards"
+        ordering = ['excel_upload', 'start_row']
+        unique_together = ('excel_upload', 'start_row')
+
+
+class UploadRowOutcome(models.Model):
+    """Skipped or failed row of an upload, kept for the row report"""
+    OUTCOME_CHOICES = [
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+    ]
+
+    excel_upload = models.ForeignKey(ExcelUpload, on_delete=models.CASCADE, related_name='row_outcomes')
+    row_number = models.PositiveIntegerField()
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES)
+    reason = models.TextField()
+
+    def __str__(self):
+        return f"Upload {self.excel_upload_id} row {self.row_number} - {self.outcome}"
+
+    class Meta:
+        verbose_name = "Upload Row Outcome"
+        verbose_name_plural = "Upload Row Outcomes"
+        indexes = [models.Index(fields=['excel_upload', 'row_number'])]
+
+
+class ChunkedUpload(models.Model):
+    """
+    Large upload file sent in parts. Parts are appended to a file on disk at
+    `offset`; once complete it becomes an ExcelUpload.
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+        ('expired', 'Expired'),
+    ]
+
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    law_firm = models.ForeignKey(LawFirm, on_delete=models.CASCADE, related_name='chunked_uploads')
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    document_template = models.ForeignKey(DocumentTemplate, on_delete=models.CASCADE)
+    email_template = models.ForeignKey(EmailTemplate, on_delete=models.CASCADE)
+    previous_upload = models.ForeignKey(ExcelUpload, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    column_mapping = models.ForeignKey(
+        ColumnMappingProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField(help_text="Size of the complete file in bytes")
+    
+    # Bytes received so far; the next part must start here
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    excel_upload = models.OneToOneField(
+        ExcelUpload, on_delete=models.SET_NULL, null=True, blank=True, related_name='chunked_upload'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size} bytes) - {self.status}"
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.RETAINER_CHUNKED_UPLOAD_DIR, f"{self.upload_id}.part")
+
+    class Meta:
+        verbose_name = "Chunked Upload"
+        verbose_name_plural = "Chunked Uploads"
+        ordering = ['-created_at']
+
+
 class RetainerRecipient(models.Model):
     """Individual recipients from Excel file for retainer documents"""
     STATUS_CHOICES = [
@@ -232,6 +437,7 @@ class RetainerRecipient(models.Model):
         ('completed', 'Document Completed'),
         ('failed', 'Failed'),
         ('skipped', 'Skipped (Invalid Data)'),
+        ('superseded', 'Superseded by a Later Upload'),
     ]
 
     excel_upload = models.ForeignKey(ExcelUpload, on_delete=models.CASCADE, related_name='recipients')
@@ -246,6 +452,7 @@ class RetainerRecipient(models.Model):
     age = models.IntegerField(null=True, blank=True)
     first_name_injured = models.CharField(max_length=100, blank=True)
     last_name_injured = models.CharField(max_length=100, blank=True)
+    row_hash = models.CharField(max_length=64, blank=True, help_text="Hash of the normalized row, used to diff re-uploads")
     
     # Processing status
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -272,6 +479,31 @@ class RetainerRecipient(models.Model):
         ordering = ['-created_at']
 
 
+class RecipientDedupKey(models.Model):
+    """
+    Per-law-firm index of recipients already imported, keyed on normalized
+    external ID and email, so repeat uploads don't send a second retainer
+    """
+    KEY_TYPE_CHOICES = [
+        ('external_id', 'External ID'),
+        ('email', 'Email'),
+    ]
+
+    law_firm = models.ForeignKey(LawFirm, on_delete=models.CASCADE, related_name='recipient_dedup_keys')
+    key_type = models.CharField(max_length=20, choices=KEY_TYPE_CHOICES)
+    value = models.CharField(max_length=255)
+    recipient = models.ForeignKey(RetainerRecipient, on_delete=models.CASCADE, related_name='dedup_keys')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.law_firm.name} - {self.key_type}: {self.value}"
+
+    class Meta:
+        verbose_name = "Recipient Dedup Key"
+        verbose_name_plural = "Recipient Dedup Keys"
+        unique_together = ('law_firm', 'key_type', 'value')
+
+
 class DocumentSubmission(models.Model):
     """NextKeySign submission tracking for retainer documents"""
     STATUS_CHOICES = [
@@ -281,6 +513,7 @@ class DocumentSubmission(models.Model):
         ('completed', 'Completed'),
         ('declined', 'Declined'),
         ('expired', 'Expired'),
+        ('archived', 'Archived'),
     ]
 
     recipient = models.OneToOneField(RetainerRecipient, on_delete=models.CASCADE, related_name='document_submission')
@@ -296,6 +529,11 @@ class DocumentSubmission(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     signed_document_url = models.URLField(max_length=500, blank=True, null=True)
     audit_log_url = models.URLField(max_length=500, blank=True, null=True)
+    # Local mirror of the documents (roblex/document_mirror.py), by content sha256
+    signed_document_sha256 = models.CharField(max_length=64, blank=True)
+    audit_log_sha256 = models.CharField(max_length=64, blank=True)
+    documents_mirrored_at = models.DateTimeField(null=True, blank=True)
+    mirror_attempts = models.PositiveSmallIntegerField(default=0)
     decline_reason = models.TextField(blank=True)
     
     # Timestamps
@@ -320,6 +558,79 @@ class DocumentSubmission(models.Model):
         ordering = ['-created_at']
 
 
+class SubmissionOutbox(models.Model):
+    """
+    A recipient's pending NextKeySign submission, written in the same
+    transaction as the recipient. The idempotency key is sent as the
+    submitter's external_id, so a call that may already have been accepted
+    is reconciled by looking it up instead of being posted twice.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    recipient = models.OneToOneField(RetainerRecipient, on_delete=models.CASCADE, related_name='submission_outbox')
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+
+    # A 'sending' entry whose claim is older than the lease is claimable again
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    # Set once, when the retainer email is queued, so it is never queued twice
+    email_queued_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.idempotency_key} - {self.status}"
+
+    @staticmethod
+    def key_for(recipient_id):
+        return f"retainer_{recipient_id}"
+
+    class Meta:
+        verbose_name = "Submission Outbox Entry"
+        verbose_name_plural = "Submission Outbox"
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'claimed_at'])]
+
+
+class SubmissionSyncState(models.Model):
+    """
+    Watermark for the periodic status reconciliation with NextKeySign.
+    
+    A sweep pages down through NextKeySign's submissions from the newest to
+    floor_id, the oldest submission still sent/opened locally when the sweep
+    began; everything below it is already settled. cursor_id is where the
+    last run stopped, so each run picks the sweep up from there.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    floor_id = models.BigIntegerField(null=True, blank=True)
+    cursor_id = models.BigIntegerField(null=True, blank=True)
+    
+    # Drift found so far in this sweep, and in the last complete one
+    sweep_report = models.JSONField(default=dict, blank=True)
+    last_report = models.JSONField(default=dict, blank=True)
+    
+    sweep_started_at = models.DateTimeField(null=True, blank=True)
+    last_sweep_completed_at = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Submission Sync State"
+        verbose_name_plural = "Submission Sync State"
+
+
 class DocumentWebhookEvent(models.Model):
     """NextKeySign webhook events for retainer documents"""
     document_submission = models.ForeignKey(DocumentSubmission, on_delete=models.CASCADE, related_name='webhook_events')
@@ -0,0 +1,118 @@
+"""
+Live progress counters for Excel uploads.
+
+Workers increment per-upload counters in a Redis hash instead of saving the
+ExcelUpload row, so shards and submission tasks never contend on it. The
+database row is only written when an upload is finalized.
+
+Counters:
+    parsed       rows read from the file
+    created      recipients imported
+    skipped      rows skipped (missing data, duplicates, unchanged)
+    failed       rows that could not be imported
+    submissions  NextKeySign submissions created
+    submission_failures  recipients whose submission gave up retrying
+    emails       retainer emails sent
+"""
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_FIELDS = [
+    'parsed', 'created', 'skipped', 'failed',
+    'submissions', 'submission_failures', 'emails',
+]
+
+# Counters outlive the upload's processing long enough for anyone still watching
+PROGRESS_TTL = 7 * 24 * 60 * 60
+
+# After a Redis error, progress calls are skipped for this long so pages
+# listing many uploads don't wait on a connect timeout per row
+ERROR_BACKOFF_SECONDS = 30
+
+_client = None
+_unavailable_until = 0
+
+
+class ProgressUnavailable(redis.RedisError):
+    pass
+
+
+def get_redis():
+    global _client
+    if time.monotonic() < _unavailable_until:
+        raise ProgressUnavailable("Progress store unavailable, backing off")
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.RETAINER_PROGRESS_REDIS_URL,
+            socket_timeout=2,
+            socket_connect_timeout=2,
+        )
+    return _client
+
+
+def _backoff():
+    global _unavailable_until
+    _unavailable_until = time.monotonic() + ERROR_BACKOFF_SECONDS
+
+
+def progress_key(upload_id):
+    return f"retainer:upload:{upload_id}:progress"
+
+
+def increment(upload_id, **counts):
+    """
+    Atomically add to an upload's counters, e.g. increment(7, parsed=1000, created=990).
+    Progress is best effort: Redis errors are logged, never raised.
+    """
+    counts = {field: value for field, value in counts.items() if value}
+    if not counts:
+        return
+
+    key = progress_key(upload_id)
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        for field, value in counts.items():
+            pipeline.hincrby(key, field, value)
+        pipeline.expire(key, PROGRESS_TTL)
+        pipeline.execute()
+    except ProgressUnavailable:
+        pass
+    except redis.RedisError as e:
+        _backoff()
+        logger.warning(f"Could not update progress for Excel upload {upload_id}: {str(e)}")
+
+
+def reset(upload_id):
+    """Clear an upload's counters before it is processed from the start"""
+    try:
+        get_redis().delete(progress_key(upload_id))
+    except ProgressUnavailable:
+        pass
+    except redis.RedisError as e:
+        _backoff()
+        logger.warning(f"Could not reset progress for Excel upload {upload_id}: {str(e)}")
+
+
+def get_progress(upload_id):
+    """
+    Current counters for an upload, all defaulting to 0.
+    Returns None if Redis is unavailable.
+    """
+    try:
+        values = get_redis().hgetall(progress_key(upload_id))
+    except ProgressUnavailable:
+        return None
+    except redis.RedisError as e:
+        _backoff()
+        logger.warning(f"Could not read progress for Excel upload {upload_id}: {str(e)}")
+        return None
+
+    progress = dict.fromkeys(PROGRESS_FIELDS, 0)
+    for field, value in values.items():
+        progress[field.decode()] = int(value)
+    return progress
@@ -0,0 +1,228 @@
+"""
+Periodic reconciliation of document submission status with NextKeySign.
+
+Status normally arrives by webhook (DocumentWebhookAPIView in both apps), so a
+missed webhook leaves a submission sent/opened forever. reconcile() pages
+through NextKeySign's submission listing in bulk and moves stale local rows
+forward, in both retainer_app and roblex_app, with one bulk_update per page
+and app. Rows are only ever moved forward (sent -> opened -> completed,
+declined or expired), so a run can't undo a webhook that arrived meanwhile.
+
+The listing is walked newest first down to a watermark kept in
+SubmissionSyncState (see the model), a bounded number of pages per run.
+"""
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Min
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from roblex import nextkeysign, rate_limit
+
+from .bulk_load import recipient_db_alias
+from .models import DocumentSubmission, RetainerRecipient, SubmissionSyncState
+
+logger = logging.getLogger(__name__)
+
+SYNC_NAME = 'nextkeysign_submissions'
+
+OPEN_STATUSES = ['sent', 'opened']
+TERMINAL_STATUSES = ['completed', 'declined', 'expired']
+STATUS_RANK = {'sent': 0, 'opened': 1, 'completed': 2, 'declined': 2, 'expired': 2}
+
+SUBMISSION_FIELDS = [
+    'status', 'opened_at', 'completed_at', 'declined_at', 'decline_reason',
+    'signed_document_url', 'audit_log_url', 'updated_at',
+]
+
+
+def _parse_time(value):
+    return parse_datetime(value) if value else None
+
+
+def remote_state(submission):
+    """Status and details of a submission from NextKeySign's listing"""
+    submitters = submission.get('submitters') or []
+    status = submission.get('status')
+    if status not in TERMINAL_STATUSES:
+        if any(s.get('status') == 'declined' for s in submitters):
+            status = 'declined'
+        elif any(s.get('status') in ('opened', 'completed') or s.get('opened_at') for s in submitters):
+            status = 'opened'
+        else:
+            status = 'sent'
+
+    def first(field):
+        return next((s.get(field) for s in submitters if s.get(field)), None)
+
+    documents = submission.get('documents') or []
+    return {
+        'status': status,
+        'opened_at': _parse_time(first('opened_at')),
+        'completed_at': _parse_time(submission.get('completed_at') or first('completed_at')),
+        'declined_at': _parse_time(first('declined_at')),
+        'decline_reason': first('decline_reason') or '',
+        'signed_document_url': (documents[0].get('url') if documents else None) or submission.get('combined_document_url'),
+        'audit_log_url': submission.get('audit_log_url'),
+    }
+
+
+def reconcile_rows(rows, remote_by_id, now):
+    """
+    Move local submission rows forward to their NextKeySign state. `rows` are
+    DocumentSubmission instances of either app, `remote_by_id` maps submission
+    id to remote_state(). Returns (changed rows, drift counted by "old->new").
+    """
+    changed = []
+    drift = Counter()
+    for row in rows:
+        remote = remote_by_id.get(int(row.nextkeysign_submission_id))
+        if not remote or STATUS_RANK.get(remote['status'], 0) <= STATUS_RANK.get(row.status, 0):
+            continue
+
+        drift[f"{row.status}->{remote['status']}"] += 1
+        row.status = remote['status']
+        if remote['status'] != 'expired':
+            row.opened_at = row.opened_at or remote['opened_at'] or now
+        if remote['status'] == 'completed':
+            row.completed_at = row.completed_at or remote['completed_at'] or now
+            row.signed_document_url = row.signed_document_url or remote['signed_document_url']
+            row.audit_log_url = row.audit_log_url or remote['audit_log_url']
+        elif remote['status'] == 'declined':
+            row.declined_at = row.declined_at or remote['declined_at'] or now
+            row.decline_reason = row.decline_reason or remote['decline_reason']
+        row.updated_at = now
+        changed.append(row)
+    return changed, drift
+
+
+def _reconcile_retainer(remote_by_id, now):
+    alias = recipient_db_alias()
+    with transaction.atomic(using=alias):
+        rows = list(
+            DocumentSubmission.objects.select_for_update(of=('self',)).select_related('recipient').filter(
+                nextkeysign_submission_id__in=[str(submission_id) for submission_id in remote_by_id],
+                status__in=OPEN_STATUSES,
+            )
+        )
+        changed, drift = reconcile_rows(rows, remote_by_id, now)
+        DocumentSubmission.objects.bulk_update(changed, SUBMISSION_FIELDS)
+
+        # Same recipient updates as the webhook makes
+        recipients = []
+        for row in changed:
+            if row.status == 'completed':
+                row.recipient.status = 'completed'
+            elif row.status == 'declined':
+                row.recipient.status = 'failed'
+                row.recipient.error_message = 'Document declined by recipient'
+            elif row.status == 'expired':
+                row.recipient.status = 'failed'
+                row.recipient.error_message = 'Document submission expired'
+            else:
+                continue
+            row.recipient.last_processed_at = now
+            recipients.append(row.recipient)
+        RetainerRecipient.objects.bulk_update(recipients, ['status', 'error_message', 'last_processed_at'])
+    return drift
+
+
+def _reconcile_roblex(remote_by_id, now):
+    from roblex_app.models import DocumentSubmission as RoblexDocumentSubmission
+
+    with transaction.atomic():
+        rows = list(
+            RoblexDocumentSubmission.objects.select_for_update().filter(
+                nextkeysign_submission_id__in=list(remote_by_id),
+                status__in=OPEN_STATUSES,
+            )
+        )
+        changed, drift = reconcile_rows(rows, remote_by_id, now)
+        RoblexDocumentSubmission.objects.bulk_update(changed, SUBMISSION_FIELDS)
+    return drift
+
+
+def _floor_id():
+    """Lowest NextKeySign id still open in either app, or None if nothing is open"""
+    from roblex_app.models import DocumentSubmission as RoblexDocumentSubmission
+
+    floors = [
+        DocumentSubmission.objects.filter(
+            status__in=OPEN_STATUSES, nextkeysign_submission_id__regex=r'^[0-9]+$'
+        ).aggregate(floor=Min(Cast('nextkeysign_submission_id', BigIntegerField())))['floor'],
+        RoblexDocumentSubmission.objects.filter(
+            status__in=OPEN_STATUSES
+        ).aggregate(floor=Min('nextkeysign_submission_id'))['floor'],
+    ]
+    floors = [floor for floor in floors if floor is not None]
+    return min(floors) if floors else None
+
+
+def reconcile(page_size=100, max_pages=50):
+    """
+    Continue the current sweep for up to max_pages pages, starting a new one
+    if none is in progress. Returns a summary of this run, including the
+    drift found. Progress is saved after every page.
+    
+    The run never waits for a rate limit token: once none is left it stops,
+    and the next run continues from the saved cursor.
+    """
+    state, _ = SubmissionSyncState.objects.get_or_create(name=SYNC_NAME)
+    now = timezone.now()
+    state.last_run_at = now
+
+    if state.cursor_id is None and state.sweep_started_at is None:
+        floor = _floor_id()
+        if floor is None:
+            state.save(update_fields=['last_run_at'])
+            return {'pages': 0, 'checked': 0, 'drift': {}, 'sweep_complete': True}
+        state.floor_id = floor
+        state.sweep_started_at = now
+        state.sweep_report = {}
+
+    pages = checked = 0
+    drift = Counter()
+    sweep_complete = rate_limited = False
+    while pages < max_pages:
+        if rate_limit.acquire('nextkeysign'):
+            rate_limited = True
+            break
+        # `after` is exclusive, so step one below the floor to include it
+        submissions, next_before = nextkeysign.list_submissions(
+            before=state.cursor_id, after=state.floor_id - 1, limit=page_size
+        )
+        pages += 1
+        checked += len(submissions)
+
+        remote_by_id = {int(submission['id']): remote_state(submission) for submission in submissions}
+        if remote_by_id:
+            now = timezone.now()
+            page_drift = _reconcile_retainer(remote_by_id, now) + _reconcile_roblex(remote_by_id, now)
+            drift.update(page_drift)
+            state.sweep_report = dict(Counter(state.sweep_report) + page_drift)
+
+        state.cursor_id = next_before
+        if next_before is None:
+            sweep_complete = True
+            state.last_report = state.sweep_report
+            state.last_sweep_completed_at = timezone.now()
+            state.sweep_started_at = None
+            state.sweep_report = {}
+        state.save()
+        if sweep_complete:
+            break
+    if not pages:
+        # Stopped before the first page: still record the run, and a sweep it started
+        state.save()
+
+    if rate_limited:
+        logger.info(f"NextKeySign reconciliation rate limited after {pages} pages, continuing next run")
+    if drift:
+        logger.warning(f"NextKeySign reconciliation corrected {sum(drift.values())} submissions: {dict(drift)}")
+    return {
+        'pages': pages, 'checked': checked, 'drift': dict(drift),
+        'sweep_complete': sweep_complete, 'rate_limited': rate_limited,
+    }
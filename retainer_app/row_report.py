@@ -0,0 +1,67 @@
+"""
+Row reports for Excel uploads: every skipped or failed row with its reason.
+
+Both formats are produced without holding the report in memory. CSV is
+streamed straight from a database cursor, and XLSX is written row by row
+by openpyxl's write-only workbook into a temporary file that is then
+streamed back.
+"""
+import csv
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+
+from .models import UploadRowOutcome
+
+ROW_REPORT_HEADERS = ['Row', 'Outcome', 'Reason']
+
+
+class _Echo:
+    """File-like object that hands back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def iter_row_outcomes(upload):
+    return UploadRowOutcome.objects.filter(
+        excel_upload=upload
+    ).order_by('row_number').values_list('row_number', 'outcome', 'reason').iterator(chunk_size=2000)
+
+
+def _report_filename(upload, extension):
+    return f"upload_{upload.id}_row_report.{extension}"
+
+
+def row_report_csv_response(upload):
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow(ROW_REPORT_HEADERS)
+        for row in iter_row_outcomes(upload):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{_report_filename(upload, "csv")}"'
+    return response
+
+
+def row_report_xlsx_response(upload):
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Row report')
+    worksheet.append(ROW_REPORT_HEADERS)
+    for row in iter_row_outcomes(upload):
+        worksheet.append(row)
+
+    # Deleted as soon as FileResponse closes it
+    report_file = tempfile.TemporaryFile(suffix='.xlsx')
+    workbook.save(report_file)
+    report_file.seek(0)
+
+    return FileResponse(
+        report_file,
+        as_attachment=True,
+        filename=_report_filename(upload, 'xlsx'),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
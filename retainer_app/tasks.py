@@ -1,121 +1,355 @@
 import logging
-import pandas as pd
+import os
+import shutil
+import time
 import requests
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial, wraps
 from django.utils import timezone
 from django.conf import settings
-from celery import shared_task
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from celery import chord, shared_task
 from celery.exceptions import Retry
+from roblex import circuit_breaker, document_mirror, fair_queue, nextkeysign, rate_limit
+from roblex.task_publishing import publish_bulk
 from .models import (
-    ExcelUpload, RetainerRecipient, DocumentSubmission, 
-    DocumentWebhookEvent, DocumentTemplate, EmailTemplate
+    ChunkedUpload, ExcelUpload, ExcelUploadShard, RetainerRecipient, UploadRowOutcome, DocumentSubmission, 
+    DocumentWebhookEvent, DocumentTemplate, EmailTemplate, SubmissionOutbox
 )
+from . import progress, reconciliation
+from .bulk_load import load_recipients, recipient_db_alias
+from .dedup import RevisionDiff, exclude_duplicates, record_dedup_keys, release_dedup_keys, restore_dedup_keys
+from .dispatch import dispatch
 from .email_service import LawFirmEmailService
+from .excel_import import (
+    DEFAULT_BATCH_SIZE, SpooledShardReader, iter_batches, normalize_batch, open_row_reader, spool_path,
+    spool_shards
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _mark_upload_failed(upload_id, error):
+    try:
+        upload = ExcelUpload.objects.get(id=upload_id)
+        upload.status = 'failed'
+        upload.error_message = str(error)
+        upload.completed_at = timezone.now()
+        upload.save()
+    except:
+        pass
+
+
+def _start_upload_processing(upload):
+    upload.status = 'processing'
+    if not upload.processing_started_at:
+        upload.processing_started_at = timezone.now()
+    upload.error_message = ''
+    upload.save()
+
+
 @shared_task(bind=True, queue='retainer_processing')
 def process_excel_upload(self, upload_id):
     """
     Main task to process an Excel upload and create RetainerRecipient records
     Optimized for large files (50k records per file)
+    
+    The file is parsed once and split into row-range shards, each spooled to
+    its own file, that are processed in parallel by process_excel_upload_shard; finalize_excel_upload aggregates the results.
+    Shards keep a committed-row checkpoint, so calling this again for an
+    interrupted upload resumes the unfinished shards instead of starting over.
     """
     try:
         upload = ExcelUpload.objects.get(id=upload_id)
-        upload.status = 'processing'
-        upload.processing_started_at = timezone.now()
-        upload.save()
-        
-        logger.info(f"Starting processing of Excel upload {upload_id}")
-        
-        # Read Excel file with optimizations for large files
-        df = pd.read_excel(upload.file.path, dtype=str)  # Read all as strings to avoid type issues
-        total_rows = len(df)
-        upload.total_rows = total_rows
-        upload.save()
+        shards = list(upload.shards.all())
         
-        logger.info(f"Loaded {total_rows} rows from Excel file")
+        if shards:
+            logger.info(f"Resuming processing of Excel upload {upload_id}")
+            _start_upload_processing(upload)
+        else:
+            logger.info(f"Starting processing of Excel upload {upload_id}")
+            
+            # Pick the streaming reader for the upload's format (xlsx, csv/tsv, parquet)
+            with open_row_reader(upload.file.path) as reader:
+                # Validate required columns, under the law firm's header aliases
+                missing_columns = upload.compile_column_mapping(reader.headers).missing_required
+                if missing_columns:
+                    raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+                
+                # Parse the file once, writing each shard's rows to its own spool file
+                spooled = spool_shards(reader, _spool_dir(upload_id), settings.RETAINER_EXCEL_SHARD_SIZE)
+            
+            total_rows = sum(rows for _, _, rows in spooled)
+            # The upload only becomes 'processing' together with its shards, so a
+            # crash before this point leaves it to be started over, never stuck
+            with transaction.atomic(using=recipient_db_alias()):
+                upload.total_rows = total_rows
+                upload.processed_rows = 0
+                _start_upload_processing(upload)
+                shards = ExcelUploadShard.objects.bulk_create([
+                    ExcelUploadShard(excel_upload=upload, start_row=start_row, end_row=end_row, next_row=start_row)
+                    for start_row, end_row, _ in spooled
+                ])
+            progress.reset(upload_id)
+            logger.info(f"Split upload {upload_id} ({total_rows} rows) into {len(shards)} shards")
         
-        # Expected columns
-        required_columns = ['ID', 'Name', 'Email']
-        optional_columns = ['Phone', 'State', 'Zip Code', 'Age', 'First Name Injured', 'Last Name Injured']
+        unfinished = [shard for shard in shards if shard.status != 'completed']
         
-        # Validate required columns
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+        if unfinished:
+            chord(
+                process_excel_upload_shard.s(shard.id) for shard in unfinished
+            )(finalize_excel_upload.s(upload_id))
+        else:
+            finalize_excel_upload.delay([], upload_id)
         
-        successful_count = 0
-        failed_count = 0
-        skipped_count = 0
+        return {
+            'upload_id': upload_id,
+            'shards': len(shards),
+            'dispatched_shards': len(unfinished)
+        }
         
-        # Process in batches for better performance with large files
-        batch_size = 100  # Process 100 records at a time
-        recipients_batch = []
+    except Exception as e:
+        logger.error(f"Error processing Excel upload {upload_id}: {str(e)}")
+        _mark_upload_failed(upload_id, e)
+        raise
+
+
+def _spool_dir(upload_id):
+    return os.path.join(settings.RETAINER_EXCEL_SPOOL_DIR, str(upload_id))
+
+
+def _open_shard_rows(upload, shard):
+    """
+    Reader for a shard's rows: its spool file, or the upload itself for
+    shards planned before uploads were spooled
+    """
+    path = spool_path(_spool_dir(upload.id), shard.start_row)
+    if os.path.exists(path):
+        return SpooledShardReader(path)
+    return open_row_reader(upload.file.path)
+
+
+def _queue_submissions(recipient_ids, law_firm_id, front=False):
+    """
+    Queue submission blocks in the law firm's virtual queue, so firms share
+    retainer_submissions fairly, then top that queue up. Blocks put back
+    after being dispatched once go to the front.
+    """
+    if settings.RETAINER_SUBMISSION_DISPATCHER == 'asyncio':
+        task, batch_size = dispatch_nextkeysign_submissions, settings.RETAINER_ASYNC_SUBMISSION_BATCH_SIZE
+    else:
+        task, batch_size = create_nextkeysign_submissions_batch, settings.RETAINER_SUBMISSION_BATCH_SIZE
+    fair_queue.push('retainer_submissions', str(law_firm_id), task, [
+        (recipient_ids[start:start + batch_size],)
+        for start in range(0, len(recipient_ids), batch_size)
+    ], front=front)
+    _dispatch_submissions()
+
+
+def _dispatch_submissions():
+    return fair_queue.dispatch(
+        'retainer_submissions', 'retainer_submissions',
+        settings.RETAINER_FAIR_SHARE_BACKLOG, settings.RETAINER_FAIR_SHARE_WEIGHTS,
+        lease=settings.RETAINER_FAIR_SHARE_LEASE_SECONDS,
+    )
+
+
+def _fair_share_block(func):
+    """
+    For the submission tasks fed by the fair share queue: once the task is
+    done with its block, whether it finished, failed or will be retried, free
+    the block's slot and top the queue up. A block rescheduled to run when its
+    reserved tokens are due keeps its slot.
+    """
+    @wraps(func)
+    def run(self, *args, **kwargs):
+        rescheduled = False
+        try:
+            result = func(self, *args, **kwargs)
+            rescheduled = isinstance(result, dict) and result.get('rescheduled', False)
+            return result
+        finally:
+            if not rescheduled:
+                fair_queue.release('retainer_submissions', self.request.id)
+                _dispatch_submissions()
+    return run
+
+
+def _commit_shard_batch(shard, upload, batch, checkpoint, next_row, alias, revision=None, mapping=None):
+    """
+    Validate, deduplicate and insert one batch of a shard, moving its checkpoint
+    to next_row in the same transaction. Returns the NormalizedBatch, or None if
+    the shard's checkpoint is no longer at `checkpoint`.
+    """
+    for attempt in range(2):
+        # Validate and normalize the whole batch column by column
+        normalized = normalize_batch(batch, mapping)
         
-        for index, row in df.iterrows():
-            try:
-                # Validate required fields
-                if pd.isna(row['ID']) or pd.isna(row['Name']) or pd.isna(row['Email']):
-                    skipped_count += 1
-                    logger.warning(f"Skipping row {index + 1}: Missing required data")
-                    continue
+        try:
+            with transaction.atomic(using=alias):
+                locked = ExcelUploadShard.objects.select_for_update().get(id=shard.id)
+                if locked.next_row != checkpoint:
+                    return None
                 
-                # Prepare recipient data for batch creation
-                recipient_data = RetainerRecipient(
-                    excel_upload=upload,
-                    external_id=str(row['ID']),
-                    name=str(row['Name']),
-                    email=str(row['Email']),
-                    phone=str(row.get('Phone', '')) if not pd.isna(row.get('Phone', '')) else '',
-                    state=str(row.get('State', '')) if not pd.isna(row.get('State', '')) else '',
-                    zip_code=str(row.get('Zip Code', '')) if not pd.isna(row.get('Zip Code', '')) else '',
-                    age=int(row.get('Age', 0)) if not pd.isna(row.get('Age', 0)) and str(row.get('Age', '')).isdigit() else None,
-                    first_name_injured=str(row.get('First Name Injured', '')) if not pd.isna(row.get('First Name Injured', '')) else '',
-                    last_name_injured=str(row.get('Last Name Injured', '')) if not pd.isna(row.get('Last Name Injured', '')) else '',
+                # Carry over rows the revised uploads already have unchanged
+                replacing = revision.exclude_unchanged(normalized) if revision else set()
+                superseded = revision.upload_ids if revision else ()
+                
+                # Skip people this law firm has already imported, before any API call or email
+                exclude_duplicates(upload.law_firm_id, normalized, replacing, superseded)
+                
+                # COPY the batch into retainer_db in a single round trip
+                created_ids = load_recipients(upload, normalized.records)
+                _stage_submissions(created_ids)
+                superseded_ids = record_dedup_keys(
+                    upload.law_firm_id, created_ids, normalized.records, replacing, superseded
                 )
+                _supersede_recipients(superseded_ids, upload.id, alias)
                 
-                recipients_batch.append(recipient_data)
-                successful_count += 1
+                # Dropped rows are kept for the upload's row report
+                UploadRowOutcome.objects.bulk_create([
+                    UploadRowOutcome(excel_upload_id=upload.id, row_number=row_number, outcome=outcome, reason=reason)
+                    for outcome, rows in (('skipped', normalized.skipped), ('failed', normalized.failed))
+                    for row_number, reason in rows
+                ])
                 
-                # Batch create when we reach batch_size
-                if len(recipients_batch) >= batch_size:
-                    created_recipients = RetainerRecipient.objects.bulk_create(recipients_batch)
-                    # Queue NextKeySign submissions for the batch
-                    for recipient in created_recipients:
-                        create_nextkeysign_submission.delay(recipient.id)
-                    recipients_batch = []
-                    
-                    # Update progress
-                    upload.processed_rows = successful_count + failed_count + skipped_count
-                    upload.save()
-                    logger.info(f"Processed {successful_count + failed_count + skipped_count}/{total_rows} rows")
+                ExcelUploadShard.objects.filter(id=shard.id).update(
+                    next_row=next_row,
+                    total_rows=F('total_rows') + len(batch),
+                    successful_rows=F('successful_rows') + len(normalized.records),
+                    failed_rows=F('failed_rows') + len(normalized.failed),
+                    skipped_rows=F('skipped_rows') + len(normalized.skipped),
+                )
+                # Live progress goes to Redis rather than the shared upload row
+                transaction.on_commit(partial(
+                    progress.increment, upload.id,
+                    parsed=len(batch),
+                    created=len(normalized.records),
+                    skipped=len(normalized.skipped),
+                    failed=len(normalized.failed),
+                ), using=alias)
                 
-            except Exception as e:
-                failed_count += 1
-                logger.error(f"Error processing row {index + 1}: {str(e)}")
-                continue
+                # Only queue NextKeySign submissions for recipients that were committed
+                transaction.on_commit(partial(_queue_submissions, created_ids, upload.law_firm_id), using=alias)
+            
+            return normalized
+        
+        except IntegrityError:
+            # A concurrent shard indexed the same person first; the retry will see its key
+            if attempt:
+                raise
+            logger.info(f"Dedup conflict in Excel upload {upload.id} at row {checkpoint}, retrying batch")
+
+
+@shared_task(bind=True, queue='retainer_processing', acks_late=True, reject_on_worker_lost=True)
+def process_excel_upload_shard(self, shard_id):
+    """
+    Process one row range of an Excel upload, starting from its checkpoint.
+    
+    Each batch of recipients is committed in the same transaction that moves
+    the checkpoint forward, so a worker killed mid-shard loses at most the
+    batch in flight. acks_late makes the broker redeliver the task in that case.
+    Errors are recorded on the shard rather than raised so the chord callback always runs.
+    """
+    shard = ExcelUploadShard.objects.select_related('excel_upload').get(id=shard_id)
+    upload = shard.excel_upload
+    alias = recipient_db_alias()
+    row_range = f"{shard.start_row}-{shard.end_row or 'end'}"
+    
+    try:
+        ExcelUploadShard.objects.filter(id=shard.id).update(status='processing', error_message='')
+        
+        logger.info(f"Processing rows {row_range} of Excel upload {upload.id} from row {shard.next_row}")
         
-        # Create remaining recipients in the last batch
-        if recipients_batch:
-            created_recipients = RetainerRecipient.objects.bulk_create(recipients_batch)
-            for recipient in created_recipients:
-                create_nextkeysign_submission.delay(recipient.id)
+        checkpoint = shard.next_row
+        
+        # Row hashes of the uploads this one corrects, loaded once per shard
+        revision = RevisionDiff(upload) if upload.previous_upload_id else None
+        
+        # Stream the shard's rows so memory stays flat for large files
+        with _open_shard_rows(upload, shard) as reader:
+            # Header aliases, coercions and defaults are resolved once for the whole shard
+            mapping = upload.compile_column_mapping(reader.headers)
+            rows = reader.iter_rows(start_row=checkpoint, end_row=shard.end_row)
+            
+            for batch in iter_batches(rows, DEFAULT_BATCH_SIZE):
+                next_row = batch[-1][0] + 1
+                
+                normalized = _commit_shard_batch(shard, upload, batch, checkpoint, next_row, alias, revision, mapping)
+                if normalized is None:
+                    # Another run of this shard already committed past our checkpoint
+                    logger.warning(f"Rows {row_range} of Excel upload {upload.id} are being processed by another worker, stopping")
+                    return {'shard_id': shard_id, 'superseded': True}
+                
+                for row_number, reason in normalized.skipped:
+                    logger.warning(f"Skipping row {row_number}: {reason}")
+                for row_number, reason in normalized.failed:
+                    logger.error(f"Error processing row {row_number}: {reason}")
+                
+                checkpoint = next_row
+        
+        ExcelUploadShard.objects.filter(id=shard.id).update(status='completed')
+        logger.info(f"Finished rows {row_range} of Excel upload {upload.id}")
+        
+    except Exception as e:
+        logger.error(f"Error processing rows {row_range} of Excel upload {upload.id}: {str(e)}")
+        ExcelUploadShard.objects.filter(id=shard.id).update(status='failed', error_message=str(e))
+    
+    return {'shard_id': shard_id, 'superseded': False}
+
+
+@shared_task(bind=True, queue='retainer_processing')
+def finalize_excel_upload(self, shard_results, upload_id):
+    """
+    Aggregate the committed shard statistics back onto the ExcelUpload
+    """
+    try:
+        upload = ExcelUpload.objects.get(id=upload_id)
+        shards = upload.shards.all()
+        
+        if shards.filter(status__in=['pending', 'processing']).exists():
+            # A superseded or redelivered shard is still running; its own chord finalizes
+            logger.info(f"Excel upload {upload_id} still has shards in progress, not finalizing yet")
+            return {'upload_id': upload_id, 'finalized': False}
+        
+        totals = shards.aggregate(
+            total_rows=Sum('total_rows'),
+            successful=Sum('successful_rows'),
+            failed=Sum('failed_rows'),
+            skipped=Sum('skipped_rows'),
+        )
+        total_rows = totals['total_rows'] or 0
+        successful_count = totals['successful'] or 0
+        failed_count = totals['failed'] or 0
+        skipped_count = totals['skipped'] or 0
+        errors = [
+            f"Rows {shard.start_row}-{shard.end_row or 'end'}: {shard.error_message}"
+            for shard in shards.filter(status='failed')
+        ]
         
         # Update final statistics
-        upload.processed_rows = successful_count + failed_count + skipped_count  # Fix: Update final processed count
+        upload.total_rows = total_rows
+        upload.processed_rows = successful_count + failed_count + skipped_count
         upload.successful_submissions = successful_count
         upload.failed_submissions = failed_count
         upload.skipped_rows = skipped_count
-        upload.status = 'completed'
+        upload.status = 'failed' if errors else 'completed'
+        upload.error_message = '\n'.join(errors)
         upload.completed_at = timezone.now()
         upload.save()
         
+        # Spool files are kept while failed shards may still be resumed
+        if not errors:
+            shutil.rmtree(_spool_dir(upload_id), ignore_errors=True)
+        
         logger.info(f"Completed processing Excel upload {upload_id}: {successful_count} successful, {failed_count} failed, {skipped_count} skipped")
         
         return {
             'upload_id': upload_id,
+            'finalized': True,
             'total_rows': total_rows,
             'successful': successful_count,
             'failed': failed_count,
@@ -123,138 +357,531 @@ def process_excel_upload(self, upload_id):
         }
         
     except Exception as e:
-        logger.error(f"Error processing Excel upload {upload_id}: {str(e)}")
-        
-        try:
-            upload = ExcelUpload.objects.get(id=upload_id)
-            upload.status = 'failed'
-            upload.error_message = str(e)
-            upload.completed_at = timezone.now()
-            upload.save()
-        except:
-            pass
-            
+        logger.error(f"Error finalizing Excel upload {upload_id}: {str(e)}")
+        _mark_upload_failed(upload_id, e)
         raise
 
 
-@shared_task(bind=True, queue='retainer_submissions', max_retries=3)
-def create_nextkeysign_submission(self, recipient_id):
+def _post_nextkeysign_submission(document_template, recipient, external_id):
     """
-    Create a NextKeySign submission for a specific recipient and send custom email
-    Optimized for high-volume processing
+    Create a NextKeySign submission for one recipient with NextKeySign's own
+    email disabled. Returns (submission_id, submitter_id, submitter_slug).
+    
+    The outcome and latency are recorded with the shared NextKeySign circuit breaker.
     """
+    payload = {
+        "template_id": document_template.nextkeysign_template_id,
+        "send_email": False,
+        "submitters": [
+            {
+                "name": recipient.name,
+                "email": recipient.email,
+                "external_id": external_id,
+                "role": "Client"
+            }
+        ]
+    }
+    
+    started = time.monotonic()
     try:
-        recipient = RetainerRecipient.objects.get(id=recipient_id)
-        upload = recipient.excel_upload
-        law_firm = upload.law_firm
-        
-        logger.info(f"Creating NextKeySign submission for recipient {recipient_id}")
-        
-        # Add small delay to avoid overwhelming API (minimal impact)
-        import time
-        time.sleep(0.1)  # 100ms delay
-        
-        # Generate external ID
-        timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-        external_id = f"retainer_{recipient.id}_{timestamp}"
-        
-        # Prepare NextKeySign API request (with email disabled)
-        nextkeysign_url = f"{settings.NEXTKEYSIGN_BASE_URL}/api/submissions"
-        headers = {
-            'X-Auth-Token': settings.NEXTKEYSIGN_API_TOKEN,
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            "template_id": upload.document_template.nextkeysign_template_id,
-            "send_email": False,
-            "submitters": [
-                {
-                    "name": recipient.name,
-                    "email": recipient.email,
-                    "external_id": external_id,
-                    "role": "Client"
-                }
-            ]
-        }
-        
-        # Make API request
-        response = requests.post(nextkeysign_url, json=payload, headers=headers)
-        response.raise_for_status()
-        
-        response_data = response.json()
-        
-        # Handle NextKeySign response format - it returns an array of submitters directly
-        if isinstance(response_data, list) and len(response_data) > 0:
-            first_submitter = response_data[0]
-            submission_id = first_submitter.get('submission_id', '')
-            submitter_slug = first_submitter.get('slug', '')
-        else:
-            # Fallback to handle different response formats
-            first_submitter = response_data.get('submitters', [{}])[0] if 'submitters' in response_data else {}
-            submission_id = response_data.get('id', '')
-            submitter_slug = first_submitter.get('slug', '')
+        response_data = nextkeysign.create_submission(payload)
+    except Exception as e:
+        circuit_breaker.record('nextkeysign', circuit_breaker.outcome_for(e), time.monotonic() - started)
+        raise
+    circuit_breaker.record('nextkeysign', 'ok', time.monotonic() - started)
+    
+    # Handle NextKeySign response format - it returns an array of submitters directly
+    if isinstance(response_data, list) and len(response_data) > 0:
+        first_submitter = response_data[0]
+        submission_id = first_submitter.get('submission_id', '')
+    else:
+        # Fallback to handle different response formats
+        first_submitter = response_data.get('submitters', [{}])[0] if 'submitters' in response_data else {}
+        submission_id = response_data.get('id', '')
+    
+    return submission_id, first_submitter.get('id', ''), first_submitter.get('slug', '')
+
+
+def _find_nextkeysign_submission(external_id):
+    """
+    Look up a submission created by an earlier attempt with this external_id.
+    Returns (submission_id, submitter_id, submitter_slug), or None if there is none.
+    """
+    response = nextkeysign.get('submitters', params={'external_id': external_id})
+    response.raise_for_status()
+    response_data = response.json()
+    submitters = response_data.get('data', []) if isinstance(response_data, dict) else response_data
+    if not submitters:
+        return None
+    submitter = submitters[0]
+    return submitter.get('submission_id', ''), submitter.get('id', ''), submitter.get('slug', '')
+
+
+def _stage_submissions(recipient_ids):
+    """Add outbox entries for recipients; ones that already have an entry are left alone"""
+    SubmissionOutbox.objects.bulk_create([
+        SubmissionOutbox(recipient_id=recipient_id, idempotency_key=SubmissionOutbox.key_for(recipient_id))
+        for recipient_id in recipient_ids
+    ], ignore_conflicts=True)
+
+
+def _supersede_recipients(recipient_ids, upload_id, alias):
+    """
+    Retire recipients that rows of a revising upload have replaced, in the
+    transaction that creates their replacements. Submissions not sent yet
+    are cancelled; ones already created are archived once it commits, so
+    the person is never left with two retainers to sign.
+    """
+    if not recipient_ids:
+        return
+    RetainerRecipient.objects.filter(id__in=recipient_ids).exclude(status='completed').update(
+        status='superseded', error_message=f"Superseded by upload #{upload_id}"
+    )
+    # A call already in flight finds the recipient superseded when it saves (_save_submission_outcomes)
+    SubmissionOutbox.objects.filter(recipient_id__in=recipient_ids, status__in=['pending', 'sending']).update(
+        status='cancelled'
+    )
+    transaction.on_commit(partial(archive_superseded_submissions.delay, recipient_ids), using=alias)
+
+
+def _claim_outbox(recipient_ids):
+    """
+    Claim these recipients' outbox entries that are waiting to be sent, with
+    what submitting them needs. Claimed entries are marked 'sending', so no
+    other task picks them up until RETAINER_OUTBOX_LEASE_SECONDS have passed.
+    
+    Recipients queued before the outbox existed get an entry first.
+    """
+    alias = recipient_db_alias()
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.RETAINER_OUTBOX_LEASE_SECONDS)
+    with transaction.atomic(using=alias):
+        _stage_submissions(RetainerRecipient.objects.filter(
+            id__in=recipient_ids, status='pending',
+            document_submission__isnull=True, submission_outbox__isnull=True
+        ).values_list('id', flat=True))
         
-        # Create DocumentSubmission record
-        submission = DocumentSubmission.objects.create(
-            recipient=recipient,
-            document_template=upload.document_template,
-            nextkeysign_submission_id=str(submission_id),
-            nextkeysign_submitter_id=str(first_submitter.get('id', '')),
-            nextkeysign_slug=str(submitter_slug),
-            external_id=external_id,
-            status='created',  # Set to created, will update to sent after email
-            sent_at=timezone.now()
+        entries = list(
+            SubmissionOutbox.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                Q(status='pending') | Q(status='sending', claimed_at__lt=stale),
+                recipient_id__in=recipient_ids,
+                recipient__status='pending',
+                recipient__document_submission__isnull=True,
+            ).select_related('recipient__excel_upload__law_firm', 'recipient__excel_upload__document_template')
         )
+        SubmissionOutbox.objects.filter(id__in=[entry.id for entry in entries]).update(
+            status='sending', claimed_at=now, attempts=F('attempts') + 1
+        )
+    
+    for entry in entries:
+        entry.attempts += 1
+    return entries
+
+
+def _renew_outbox_claims(entry_ids):
+    """Extend the lease on claimed entries whose calls haven't finished yet"""
+    if entry_ids:
+        SubmissionOutbox.objects.filter(id__in=list(entry_ids), status='sending').update(claimed_at=timezone.now())
+
+
+def _outbox_claim_size():
+    """
+    Entries a long-running task claims at a time: as many as the NextKeySign
+    rate limit lets it send in half a lease, so a window is done long before
+    its claims could be taken for abandoned.
+    """
+    rate = settings.OUTBOUND_RATE_LIMITS['nextkeysign']['rate']
+    return max(settings.RETAINER_SUBMISSION_WRITE_BATCH, int(rate * settings.RETAINER_OUTBOX_LEASE_SECONDS / 2))
+
+
+def _wait_for_token():
+    """Book one NextKeySign token for a call of its own and sleep until it is due"""
+    delay = rate_limit.reserve('nextkeysign')
+    if delay:
+        time.sleep(delay)
+
+
+def _submit_outbox_entry(entry):
+    """
+    Make the NextKeySign call for one claimed outbox entry without touching
+    the database. Returns (entry, result, error).
+    
+    If an earlier attempt may have been accepted, the submission is looked up
+    by its idempotency key first, on a rate limit token of its own, and only
+    posted if it doesn't exist. Once
+    this process has seen the circuit open, remaining calls are skipped with
+    a CircuitOpen error and the recipient is deferred, not failed.
+    """
+    retry_after = circuit_breaker.open_for('nextkeysign')
+    if retry_after:
+        return entry, None, circuit_breaker.CircuitOpen('nextkeysign', retry_after)
+    
+    recipient = entry.recipient
+    try:
+        result = None
+        if entry.attempts > 1:
+            _wait_for_token()
+            result = _find_nextkeysign_submission(entry.idempotency_key)
+        if result is None:
+            result = _post_nextkeysign_submission(
+                recipient.excel_upload.document_template, recipient, entry.idempotency_key
+            )
+        return entry, result, None
+    except Exception as e:
+        return entry, None, e
+
+
+def _queue_retainer_emails(recipient_ids):
+    publish_bulk(send_retainer_email, DocumentSubmission.objects.filter(
+        recipient_id__in=recipient_ids
+    ).values_list('recipient_id', 'id', 'external_id'))
+
+
+def _save_submission_outcomes(outcomes, final_attempt):
+    """
+    Write a block of submission outcomes back in one transaction: one bulk
+    insert of submissions, then bulk updates of recipients and outbox
+    entries. Then queue emails and update progress.
+    
+    Failed entries go back to pending unless this was the final attempt.
+    Entries skipped because the circuit was open are released untouched.
+    Each recipient's email is claimed on its outbox entry, so it is queued
+    exactly once however many times the submission is retried. Recipients
+    superseded while their call was in flight stay superseded: no email is
+    sent and the new submission is archived.
+    Returns (number created, ids of failed recipients, ids of deferred recipients).
+    """
+    alias = recipient_db_alias()
+    now = timezone.now()
+    entries = []
+    recipients = []
+    submissions = []
+    failed_ids = []
+    deferred_ids = []
+    for entry, result, error in outcomes:
+        recipient = entry.recipient
+        entries.append(entry)
+        if isinstance(error, circuit_breaker.CircuitOpen):
+            entry.status = 'pending'
+            deferred_ids.append(recipient.id)
+            continue
         
-        # Generate signing URL
-        signing_url = f"{settings.NEXTKEYSIGN_BASE_URL}/s/{submitter_slug}"
-        
-        # Send custom email using law firm's email configuration
-        if law_firm.has_email_config():
-            # Send custom email via background task
-            send_retainer_email.delay(recipient.id, submission.id, external_id)
-            submission.status = 'sent'
-            submission.save()
-            logger.info(f"Custom email queued for recipient {recipient_id}")
+        recipient.last_processed_at = now
+        recipients.append(recipient)
+        if error is None:
+            submission_id, submitter_id, submitter_slug = result
+            submissions.append(DocumentSubmission(
+                recipient=recipient,
+                document_template=recipient.excel_upload.document_template,
+                nextkeysign_submission_id=str(submission_id),
+                nextkeysign_submitter_id=str(submitter_id),
+                nextkeysign_slug=str(submitter_slug),
+                external_id=entry.idempotency_key,
+                # Marked sent either way so the NextKeySign process continues
+                status='sent',
+                sent_at=now
+            ))
+            entry.status = 'sent'
+            entry.sent_at = now
+            entry.last_error = ''
+            recipient.status = 'submitted'
+            recipient.error_message = ''
         else:
-            logger.warning(f"Law firm {law_firm.name} has incomplete email configuration, skipping email")
-            submission.status = 'sent'  # Still mark as sent so NextKeySign process continues
-            submission.save()
-        
-        # Update recipient status
-        recipient.status = 'submitted'
-        recipient.last_processed_at = timezone.now()
-        recipient.save()
-        
-        logger.info(f"Successfully created NextKeySign submission {submission.nextkeysign_submission_id} for recipient {recipient_id}")
+            logger.error(f"Error creating NextKeySign submission for recipient {recipient.id}: {str(error)}")
+            entry.status = 'failed' if final_attempt else 'pending'
+            entry.last_error = str(error)
+            recipient.retry_count += 1
+            recipient.error_message = str(error)
+            if final_attempt:
+                recipient.status = 'failed'
+            failed_ids.append(recipient.id)
+    
+    with transaction.atomic(using=alias):
+        superseded_ids = set(RetainerRecipient.objects.select_for_update().filter(
+            id__in=[entry.recipient.id for entry in entries], status='superseded'
+        ).values_list('id', flat=True))
+        for entry in entries:
+            if entry.recipient.id in superseded_ids:
+                entry.recipient.status = 'superseded'
+                if entry.status != 'sent':
+                    entry.status = 'cancelled'
+        if superseded_ids:
+            transaction.on_commit(partial(archive_superseded_submissions.delay, list(superseded_ids)), using=alias)
         
-        return {
-            'recipient_id': recipient_id,
-            'submission_id': submission.nextkeysign_submission_id,
-            'external_id': external_id,
-            'signing_url': signing_url
-        }
+        # A submission saved by an earlier attempt is kept as is
+        DocumentSubmission.objects.bulk_create(submissions, ignore_conflicts=True)
+        RetainerRecipient.objects.bulk_update(
+            recipients, ['status', 'error_message', 'retry_count', 'last_processed_at']
+        )
+        SubmissionOutbox.objects.bulk_update(entries, ['status', 'last_error', 'sent_at'])
+        # Never sent a retainer, so a later upload may import them again
+        release_dedup_keys([recipient.id for recipient in recipients if recipient.status == 'failed'])
         
-    except Exception as e:
-        logger.error(f"Error creating NextKeySign submission for recipient {recipient_id}: {str(e)}")
+        # Send custom emails using each law firm's email configuration, once per recipient
+        email_recipient_ids = list(SubmissionOutbox.objects.select_for_update().filter(
+            recipient_id__in=[submission.recipient.id for submission in submissions
+                              if submission.recipient.id not in superseded_ids
+                              and submission.recipient.excel_upload.law_firm.has_email_config()],
+            email_queued_at__isnull=True,
+        ).values_list('recipient_id', flat=True))
+        if email_recipient_ids:
+            SubmissionOutbox.objects.filter(recipient_id__in=email_recipient_ids).update(email_queued_at=now)
+            transaction.on_commit(partial(_queue_retainer_emails, email_recipient_ids), using=alias)
+    
+    created_by_upload = Counter(submission.recipient.excel_upload_id for submission in submissions)
+    failed_by_upload = Counter(
+        recipient.excel_upload_id for recipient in recipients if final_attempt and recipient.status == 'failed'
+    )
+    for upload_id in created_by_upload.keys() | failed_by_upload.keys():
+        progress.increment(
+            upload_id,
+            submissions=created_by_upload[upload_id],
+            submission_failures=failed_by_upload[upload_id],
+        )
+    
+    return len(submissions), failed_ids, deferred_ids
+
+
+def _defer_submissions(recipient_ids):
+    """
+    Put recipients skipped while the NextKeySign circuit was open back at the
+    front of their law firms' virtual queues, and dispatch nothing more until
+    the circuit may close. They book rate limit tokens again when they run.
+    """
+    retry_after = max(circuit_breaker.open_for('nextkeysign'), 1)
+    fair_queue.pause('retainer_submissions', retry_after)
+    by_law_firm = {}
+    for recipient_id, law_firm_id in RetainerRecipient.objects.filter(
+        id__in=recipient_ids
+    ).values_list('id', 'excel_upload__law_firm_id'):
+        by_law_firm.setdefault(law_firm_id, []).append(recipient_id)
+    for law_firm_id, law_firm_recipient_ids in by_law_firm.items():
+        _queue_submissions(law_firm_recipient_ids, law_firm_id, front=True)
+    logger.warning(f"NextKeySign circuit open: deferring {len(recipient_ids)} submissions by {retry_after:.0f}s")
+
+
+@shared_task(bind=True, queue='retainer_submissions', max_retries=3)
+@_fair_share_block
+def create_nextkeysign_submissions_batch(self, recipient_ids, reserved=False):
+    """
+    Create NextKeySign submissions for a block of recipients.
+    
+    Outbox entries, recipients, uploads and law firms are claimed in one query, the API calls
+    run on a bounded thread pool, and submissions and recipient statuses are
+    written back with one bulk insert and one bulk update. Recipients whose
+    call failed are retried as a smaller batch with exponential backoff.
+    
+    The block's rate limit tokens are reserved up front. They come due one
+    after another at the reserved rate, so the task runs when the first of
+    them is due, rescheduling itself with reserved=True if that is later,
+    and starts one call per token as they come due rather than all at once.
+    """
+    # Pause while the NextKeySign circuit is open instead of adding to the errors
+    wait, concurrency = circuit_breaker.check('nextkeysign')
+    if wait:
+        _defer_submissions(recipient_ids)
+        return {'created': 0, 'failed': 0, 'deferred': len(recipient_ids)}
+    
+    # Book the block's share of the NextKeySign rate and come back when its first token is due
+    interval = 1 / rate_limit.reserved_rate('nextkeysign')
+    if not reserved:
+        wait = rate_limit.reserve('nextkeysign', len(recipient_ids))
+        wait = max(0.0, wait - (len(recipient_ids) - 1) * interval)
+        if wait:
+            rate_limit.reschedule(self, wait, kwargs={'reserved': True})
+            logger.info(f"Rate limited: {len(recipient_ids)} NextKeySign submissions reserved from {wait:.1f}s from now")
+            return {'created': 0, 'failed': 0, 'deferred': len(recipient_ids), 'rescheduled': True}
+    
+    entries = _claim_outbox(recipient_ids)
+    if not entries:
+        return {'created': 0, 'failed': 0}
+    
+    logger.info(f"Creating NextKeySign submissions for {len(entries)} recipients")
+    
+    started = time.monotonic()
+    
+    def submit_when_due(indexed_entry):
+        index, entry = indexed_entry
+        delay = started + index * interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return _submit_outbox_entry(entry)
+    
+    workers = min(settings.RETAINER_SUBMISSION_CONCURRENCY, concurrency)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(submit_when_due, enumerate(entries)))
+    
+    final_attempt = self.request.retries >= self.max_retries
+    created, failed_ids, deferred_ids = _save_submission_outcomes(outcomes, final_attempt)
+    if deferred_ids:
+        _defer_submissions(deferred_ids)
+    
+    logger.info(f"Created {created} NextKeySign submissions, {len(failed_ids)} failed, {len(deferred_ids)} deferred")
+    
+    if failed_ids and not final_attempt:
+        countdown = 60 * (2 ** self.request.retries)  # Exponential backoff
+        raise self.retry(args=[failed_ids], kwargs={}, countdown=countdown)
+    
+    return {'created': created, 'failed': len(failed_ids)}
+
+
+@shared_task(bind=True, queue='retainer_submissions', max_retries=3)
+@_fair_share_block
+def dispatch_nextkeysign_submissions(self, recipient_ids):
+    """
+    Create NextKeySign submissions for a large block of recipients with the
+    asyncio dispatcher, keeping up to RETAINER_ASYNC_SUBMISSION_CONCURRENCY
+    calls in flight from this one task.
+    
+    At the NextKeySign rate a block takes longer than the outbox lease, so it
+    is claimed a window at a time (see _outbox_claim_size). Outcomes are
+    written back in blocks of RETAINER_SUBMISSION_WRITE_BATCH as calls
+    complete, renewing the lease on the window's calls still in flight, so
+    a long run shows progress and a crash loses little.
+    """
+    wait, _ = circuit_breaker.check('nextkeysign')
+    if wait:
+        _defer_submissions(recipient_ids)
+        return {'created': 0, 'failed': 0, 'deferred': len(recipient_ids)}
+    
+    final_attempt = self.request.retries >= self.max_retries
+    claimed = 0
+    created = 0
+    failed_ids = []
+    deferred_ids = []
+    outcomes = []
+    in_flight = set()
+    
+    def flush():
+        nonlocal created
+        block_created, block_failed, block_deferred = _save_submission_outcomes(outcomes, final_attempt)
+        created += block_created
+        failed_ids.extend(block_failed)
+        deferred_ids.extend(block_deferred)
+        in_flight.difference_update(entry.id for entry, _, _ in outcomes)
+        outcomes.clear()
+        _renew_outbox_claims(in_flight)
+    
+    window_size = _outbox_claim_size()
+    for start in range(0, len(recipient_ids), window_size):
+        # Leave the rest of the block unclaimed once the circuit has opened
+        if circuit_breaker.open_for('nextkeysign'):
+            deferred_ids.extend(recipient_ids[start:])
+            break
         
-        try:
-            recipient = RetainerRecipient.objects.get(id=recipient_id)
-            recipient.status = 'failed'
-            recipient.error_message = str(e)
-            recipient.retry_count += 1
-            recipient.last_processed_at = timezone.now()
-            recipient.save()
-        except:
-            pass
+        entries = _claim_outbox(recipient_ids[start:start + window_size])
+        if not entries:
+            continue
+        claimed += len(entries)
+        in_flight.update(entry.id for entry in entries)
+        logger.info(f"Dispatching NextKeySign submissions for {len(entries)} recipients")
         
+        # In-flight calls follow the breaker's adaptive limit as it changes
+        for outcome in dispatch(
+            entries,
+            _submit_outbox_entry,
+            concurrency=settings.RETAINER_ASYNC_SUBMISSION_CONCURRENCY,
+            rate_limit_name='nextkeysign',
+            concurrency_limit=partial(circuit_breaker.current_limit, 'nextkeysign'),
+        ):
+            outcomes.append(outcome)
+            if len(outcomes) >= settings.RETAINER_SUBMISSION_WRITE_BATCH:
+                flush()
+        if outcomes:
+            flush()
+    
+    if not claimed and not deferred_ids:
+        return {'created': 0, 'failed': 0}
+    if deferred_ids:
+        _defer_submissions(deferred_ids)
+    
+    logger.info(f"Dispatched {created} NextKeySign submissions, {len(failed_ids)} failed, {len(deferred_ids)} deferred")
+    
+    if failed_ids and not final_attempt:
+        countdown = 60 * (2 ** self.request.retries)  # Exponential backoff
+        raise self.retry(args=[failed_ids], countdown=countdown)
+    
+    return {'created': created, 'failed': len(failed_ids)}
+
+
+@shared_task(bind=True, queue='retainer_submissions', max_retries=3)
+def create_nextkeysign_submission(self, recipient_id, reserved=False):
+    """
+    Create a NextKeySign submission for a specific recipient and send custom email
+    Optimized for high-volume processing
+    """
+    delay, _ = circuit_breaker.check('nextkeysign')
+    if delay:
+        rate_limit.reschedule(self, delay, kwargs={})
+        return {'recipient_id': recipient_id, 'deferred': delay}
+    if not reserved:
+        delay = rate_limit.reserve('nextkeysign')
+        if delay:
+            rate_limit.reschedule(self, delay, kwargs={'reserved': True})
+            return {'recipient_id': recipient_id, 'deferred': delay}
+    
+    entries = _claim_outbox([recipient_id])
+    if not entries:
+        logger.info(f"No NextKeySign submission waiting to be sent for recipient {recipient_id}")
+        return {'recipient_id': recipient_id, 'skipped': True}
+    
+    logger.info(f"Creating NextKeySign submission for recipient {recipient_id}")
+    
+    entry, result, error = _submit_outbox_entry(entries[0])
+    final_attempt = self.request.retries >= self.max_retries
+    created, failed_ids, deferred_ids = _save_submission_outcomes([(entry, result, error)], final_attempt)
+    
+    if deferred_ids:
+        rate_limit.reschedule(self, max(circuit_breaker.open_for('nextkeysign'), 1), kwargs={})
+        return {'recipient_id': recipient_id, 'deferred': True}
+    
+    if failed_ids:
         # Retry logic
-        if self.request.retries < self.max_retries:
+        if not final_attempt:
             countdown = 60 * (2 ** self.request.retries)  # Exponential backoff
-            raise self.retry(countdown=countdown, exc=e)
+            raise self.retry(kwargs={}, countdown=countdown, exc=error)
+        raise error
+    
+    logger.info(f"Successfully created NextKeySign submission for recipient {recipient_id}")
+    
+    return {
+        'recipient_id': recipient_id,
+        'submission_id': str(result[0]),
+        'external_id': entry.idempotency_key,
+        'signing_url': f"{settings.NEXTKEYSIGN_BASE_URL}/s/{result[2]}"
+    }
+
+
+@shared_task(bind=True, queue='retainer_submissions', max_retries=3)
+def archive_superseded_submissions(self, recipient_ids):
+    """
+    Archive the NextKeySign submissions of superseded recipients that have
+    not been signed, so their links stop working. Calls take one rate limit
+    token each; once none is left the rest are rescheduled for when one is.
+    """
+    submissions = list(DocumentSubmission.objects.filter(
+        recipient_id__in=recipient_ids, recipient__status='superseded', status__in=['pending', 'sent', 'opened']
+    ))
+    for index, submission in enumerate(submissions):
+        delay = rate_limit.acquire('nextkeysign')
+        if delay:
+            remaining = [pending.recipient_id for pending in submissions[index:]]
+            rate_limit.reschedule(self, delay, args=[remaining])
+            return {'archived': index, 'deferred': len(remaining)}
         
-        raise
+        try:
+            response = nextkeysign.request('DELETE', f"submissions/{submission.nextkeysign_submission_id}")
+            if response.status_code != 404:
+                response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Error archiving NextKeySign submission {submission.nextkeysign_submission_id}: {str(e)}")
+            remaining = [pending.recipient_id for pending in submissions[index:]]
+            raise self.retry(args=[remaining], countdown=60 * (2 ** self.request.retries), exc=e)
+        
+        DocumentSubmission.objects.filter(id=submission.id).update(status='archived', updated_at=timezone.now())
+        logger.info(f"Archived NextKeySign submission {submission.nextkeysign_submission_id} of superseded recipient {submission.recipient_id}")
+    
+    return {'archived': len(submissions)}
 
 
 @shared_task(bind=True, queue='retainer_submissions')
@@ -271,10 +898,18 @@ def retry_failed_submission(self, recipient_id):
         
         logger.info(f"Retrying failed submission for recipient {recipient_id}")
         
-        # Reset status and call main submission task
-        recipient.status = 'pending'
-        recipient.error_message = ''
-        recipient.save()
+        with transaction.atomic(using=recipient_db_alias()):
+            # Its dedup keys were released when it failed; another upload may have taken them since
+            reimported_in = restore_dedup_keys(recipient.excel_upload.law_firm_id, recipient)
+            if reimported_in is not None:
+                logger.warning(f"Recipient {recipient_id} was imported again in upload #{reimported_in}, skipping retry")
+                return
+            
+            # Reset status and call main submission task
+            recipient.status = 'pending'
+            recipient.error_message = ''
+            recipient.save()
+            SubmissionOutbox.objects.filter(recipient=recipient, status='failed').update(status='pending', last_error='')
         
         return create_nextkeysign_submission.delay(recipient_id)
         
@@ -404,6 +1039,7 @@ def send_retainer_email(self, recipient_id, submission_id, external_id):
             # Update recipient
             recipient.last_processed_at = timezone.now()
             recipient.save()
+            progress.increment(upload.id, emails=1)
             
             logger.info(f"Email sent successfully for recipient {recipient_id}")
             return {
@@ -434,4 +1070,171 @@ def send_retainer_email(self, recipient_id, submission_id, external_id):
             countdown = 60 * (2 ** self.request.retries)  # Exponential backoff
             raise self.retry(countdown=countdown, exc=e)
         
-        raise
\ No newline at end of file
+        raise
+
+
+@shared_task(queue='retainer_submissions')
+def drain_submission_outbox():
+    """
+    Queue outbox entries that were never dispatched or whose claim expired,
+    e.g. after a worker was lost mid-call. Safe to run at any time: entries
+    are claimed before sending, and ones that may already have been accepted
+    are reconciled by their idempotency key.
+    
+    Unsent entries of a law firm that still has blocks waiting in its fair
+    share queue are just waiting their turn, so they are left alone.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.RETAINER_OUTBOX_LEASE_SECONDS)
+    entries = SubmissionOutbox.objects.filter(
+        Q(status='pending', claimed_at__isnull=True, created_at__lt=stale) |
+        Q(status='sending', claimed_at__lt=stale)
+    ).order_by('id').values_list('recipient_id', 'status', 'recipient__excel_upload__law_firm_id')
+    waiting = fair_queue.pending('retainer_submissions') or {}
+    
+    by_law_firm = {}
+    for recipient_id, status, law_firm_id in entries[:settings.RETAINER_OUTBOX_DRAIN_LIMIT]:
+        if status == 'pending' and str(law_firm_id) in waiting:
+            continue
+        by_law_firm.setdefault(law_firm_id, []).append(recipient_id)
+    for law_firm_id, recipient_ids in by_law_firm.items():
+        _queue_submissions(recipient_ids, law_firm_id)
+    
+    queued = sum(len(recipient_ids) for recipient_ids in by_law_firm.values())
+    if queued:
+        logger.info(f"Re-queued {queued} NextKeySign submissions from the outbox")
+    return {'queued': queued}
+
+
+@shared_task(queue='retainer_dispatch')
+def dispatch_fair_share_submissions():
+    """
+    Top retainer_submissions up from the law firms' virtual queues. Runs
+    every few seconds from beat, on its own retainer_dispatch queue so it
+    never waits behind the queue it fills or behind upload shards.
+    """
+    return {'dispatched': _dispatch_submissions()}
+
+
+@shared_task(queue='retainer_processing')
+def expire_chunked_uploads():
+    """
+    Delete the parts of chunked uploads that have not received data for
+    RETAINER_CHUNKED_UPLOAD_EXPIRY_HOURS
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.RETAINER_CHUNKED_UPLOAD_EXPIRY_HOURS)
+    stale = ChunkedUpload.objects.filter(status='uploading', updated_at__lt=cutoff)
+    
+    expired_count = 0
+    for chunked_upload in stale:
+        try:
+            os.remove(chunked_upload.part_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing parts of chunked upload {chunked_upload.upload_id}: {str(e)}")
+            continue
+        
+        ChunkedUpload.objects.filter(id=chunked_upload.id).update(status='expired')
+        expired_count += 1
+    
+    logger.info(f"Expired {expired_count} stale chunked uploads")
+    return {'expired': expired_count}
+
+
+@shared_task(queue='retainer_processing')
+def reconcile_submission_statuses():
+    """
+    Catch up on missed NextKeySign webhooks: continue the reconciliation sweep
+    for up to RETAINER_RECONCILE_MAX_PAGES pages (see reconciliation.py)
+    """
+    try:
+        return reconciliation.reconcile(
+            page_size=settings.RETAINER_RECONCILE_PAGE_SIZE,
+            max_pages=settings.RETAINER_RECONCILE_MAX_PAGES,
+        )
+    except requests.RequestException as e:
+        # Progress is saved per page, so the next run picks up from here
+        logger.warning(f"NextKeySign reconciliation stopped early: {str(e)}")
+        return {'error': str(e)}
+
+
+def _download_documents(submission):
+    if submission.signed_document_url and not submission.signed_document_sha256:
+        submission.signed_document_sha256 = document_mirror.download(submission.signed_document_url)
+    if submission.audit_log_url and not submission.audit_log_sha256:
+        submission.audit_log_sha256 = document_mirror.download(submission.audit_log_url)
+
+
+def _mirror_submission_documents(submission):
+    """
+    Mirror a completed submission's signed document and audit log, in either
+    app. Returns (submission, error).
+    """
+    try:
+        try:
+            _download_documents(submission)
+        except requests.HTTPError as e:
+            # Document URLs are signed and expire, so fetch fresh ones once
+            if e.response is None or e.response.status_code not in (401, 403, 404, 410):
+                raise
+            delay = rate_limit.acquire('nextkeysign')
+            if delay:
+                raise rate_limit.RateLimited('nextkeysign', delay)
+            response = nextkeysign.get(f"submissions/{submission.nextkeysign_submission_id}")
+            response.raise_for_status()
+            remote = reconciliation.remote_state(response.json())
+            submission.signed_document_url = remote['signed_document_url'] or submission.signed_document_url
+            submission.audit_log_url = remote['audit_log_url'] or submission.audit_log_url
+            _download_documents(submission)
+    except Exception as e:
+        return submission, e
+    return submission, None
+
+
+@shared_task(queue='retainer_processing')
+def mirror_signed_documents():
+    """
+    Download completed documents of both apps into local media storage,
+    DOCUMENT_MIRROR_CONCURRENCY at a time. Failed submissions are retried on
+    later runs, up to DOCUMENT_MIRROR_MAX_ATTEMPTS times. Ones that were rate
+    limited or are being downloaded by another worker are just left for a
+    later run, without using up an attempt.
+    """
+    from roblex_app.models import DocumentSubmission as RoblexDocumentSubmission
+    
+    mirrored = failed = deferred = 0
+    for model in (DocumentSubmission, RoblexDocumentSubmission):
+        submissions = list(
+            model.objects.filter(
+                status='completed',
+                documents_mirrored_at__isnull=True,
+                mirror_attempts__lt=settings.DOCUMENT_MIRROR_MAX_ATTEMPTS,
+                signed_document_url__gt='',
+            ).order_by('id')[:settings.DOCUMENT_MIRROR_BATCH_SIZE]
+        )
+        if not submissions:
+            continue
+        
+        with ThreadPoolExecutor(max_workers=settings.DOCUMENT_MIRROR_CONCURRENCY) as executor:
+            results = list(executor.map(_mirror_submission_documents, submissions))
+        
+        now = timezone.now()
+        for submission, error in results:
+            if error is None:
+                submission.documents_mirrored_at = now
+                mirrored += 1
+            elif isinstance(error, (rate_limit.RateLimited, document_mirror.DownloadInProgress)):
+                deferred += 1
+            else:
+                submission.mirror_attempts += 1
+                failed += 1
+                logger.warning(f"Error mirroring documents of submission {submission.nextkeysign_submission_id}: {str(error)}")
+        
+        # Hashes of documents that did download are kept, so a retry only fetches the rest
+        model.objects.bulk_update(submissions, [
+            'signed_document_url', 'audit_log_url', 'signed_document_sha256', 'audit_log_sha256',
+            'documents_mirrored_at', 'mirror_attempts',
+        ])
+    
+    logger.info(f"Mirrored documents of {mirrored} submissions, {failed} failed, {deferred} deferred")
+    return {'mirrored': mirrored, 'failed': failed, 'deferred': deferred}
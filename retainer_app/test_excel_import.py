@@ -0,0 +1,225 @@
+import pytest
+from openpyxl import Workbook
+
+from retainer_app.excel_import import (
+    CsvRowReader, ExcelRowReader, ParquetRowReader, SpooledShardReader, compile_column_mapping, compute_row_hash,
+    iter_batches, normalize_batch, open_row_reader, preview_upload, spool_path, spool_shards
+)
+from retainer_app.utils import validate_excel_file
+
+
+def _write_workbook(path, rows):
+    workbook = Workbook()
+    worksheet = workbook.active
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(path)
+
+
+def test_reader_streams_rows_as_strings(tmp_path):
+    path = tmp_path / "upload.xlsx"
+    _write_workbook(path, [
+        ["ID", "Name", "Email", "Zip Code"],
+        [101, "Jane Doe", "jane@example.com", 32003.0],
+        [None, None, None, None],
+        [102, "John Doe", None, None],
+    ])
+
+    with ExcelRowReader(str(path)) as reader:
+        assert reader.headers == ["ID", "Name", "Email", "Zip Code"]
+        assert reader.estimated_rows() == 3
+        rows = list(reader.iter_rows())
+        tail = list(reader.iter_rows(start_row=4))
+
+    assert rows == [
+        (2, {"ID": "101", "Name": "Jane Doe", "Email": "jane@example.com", "Zip Code": "32003"}),
+        (4, {"ID": "102", "Name": "John Doe", "Email": None, "Zip Code": None}),
+    ]
+    assert tail == rows[1:]
+
+
+def test_preview_reads_first_rows_like_the_reader(tmp_path):
+    path = tmp_path / "upload.xlsx"
+    _write_workbook(path, [
+        ["ID", "Name", "Email", "Active"],
+        [101, "Jane Doe", "jane@example.com", True],
+        [None, None, None, None],
+        [102.0, "Jane Doe", None, False],
+        [103, "Ann Lee", "ann@example.com", None],
+    ])
+
+    headers, estimated_rows, rows = preview_upload(str(path), limit=2)
+
+    with ExcelRowReader(str(path)) as reader:
+        assert headers == reader.headers
+        assert estimated_rows == reader.estimated_rows() == 4
+        assert rows == list(reader.iter_rows())[:2]
+    assert rows[1] == (4, {"ID": "102", "Name": "Jane Doe", "Email": None, "Active": "False"})
+
+
+def test_iter_batches_splits_evenly():
+    batches = list(iter_batches(range(5), batch_size=2))
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+def test_normalize_batch_splits_valid_skipped_and_failed_rows():
+    batch = [
+        (2, {"ID": "101", "Name": " Jane Doe ", "Email": "jane@example.com", "Age": "34", "Phone": None}),
+        (3, {"ID": "102", "Name": "", "Email": None}),
+        (4, {"ID": "103", "Name": "John Doe", "Email": "john@example.com", "Zip Code": "123456789012"}),
+        (5, {"ID": "104", "Name": "Ann Lee", "Email": "ann@example.com", "Age": "unknown"}),
+    ]
+
+    normalized = normalize_batch(batch)
+    hashes = [record.pop("row_hash") for record in normalized.records]
+
+    assert normalized.skipped == [(3, "Missing required data: Name, Email")]
+    assert normalized.failed == [(4, "Value too long: Zip Code")]
+    assert normalized.records == [
+        {
+            "external_id": "101", "name": "Jane Doe", "email": "jane@example.com",
+            "phone": "", "state": "", "zip_code": "", "age": 34,
+            "first_name_injured": "", "last_name_injured": "",
+        },
+        {
+            "external_id": "104", "name": "Ann Lee", "email": "ann@example.com",
+            "phone": "", "state": "", "zip_code": "", "age": None,
+            "first_name_injured": "", "last_name_injured": "",
+        },
+    ]
+    assert type(normalized.records[0]["age"]) is int
+    assert hashes == [compute_row_hash(record) for record in normalized.records]
+    assert len(set(hashes)) == 2 and all(len(value) == 64 for value in hashes)
+    assert normalized.row_numbers == [2, 5]
+
+    normalized.skip([0], ["Duplicate external ID 101 already imported in upload #7"])
+
+    assert [record["external_id"] for record in normalized.records] == ["104"]
+    assert normalized.row_numbers == [5]
+    assert normalized.skipped == [
+        (2, "Duplicate external ID 101 already imported in upload #7"),
+        (3, "Missing required data: Name, Email"),
+    ]
+
+
+def test_column_mapping_renames_coerces_and_fills_defaults():
+    headers = ["Client ID", "full name", "E-Mail", "Zip"]
+    mapping = compile_column_mapping(
+        headers,
+        aliases={"ID": ["Client ID"], "Name": ["Full Name"], "Email": ["e-mail"], "Zip Code": ["ZIP"]},
+        coercions={"Email": "lower", "Zip Code": "zip5"},
+        defaults={"State": "FL"},
+    )
+    assert mapping.missing_required == []
+    assert compile_column_mapping(headers).missing_required == ["ID", "Name", "Email"]
+    with pytest.raises(ValueError):
+        compile_column_mapping(headers, coercions={"Email": "reverse"})
+
+    batch = [
+        (2, {"Client ID": "7", "full name": "Jane Doe", "E-Mail": "Jane@Example.COM", "Zip": "2108"}),
+        (3, {"Client ID": "8", "full name": "John Doe", "E-Mail": "john@example.com", "Zip": "32003-1234"}),
+    ]
+    records = normalize_batch(batch, mapping).records
+
+    assert [(r["external_id"], r["email"], r["zip_code"], r["state"]) for r in records] == [
+        ("7", "jane@example.com", "02108", "FL"),
+        ("8", "john@example.com", "32003", "FL"),
+    ]
+
+
+def test_spool_shards_splits_in_one_pass_without_dimensions(tmp_path):
+    # write_only workbooks record no <dimension>, so the row count is unknown up front
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["ID", "Name", "Email"])
+    for index in range(25):
+        sheet.append([100 + index, None if index == 3 else f"Person {index}", f"p{index}@example.com"])
+        if index == 10:
+            sheet.append([None, None, None])
+    path = tmp_path / "upload.xlsx"
+    workbook.save(path)
+
+    with open_row_reader(str(path)) as reader:
+        expected = list(reader.iter_rows())
+    with open_row_reader(str(path)) as reader:
+        shards = spool_shards(reader, str(tmp_path / "shards"), shard_size=10)
+
+    assert shards == [(2, 11, 10), (12, 22, 10), (23, 27, 5)]
+
+    spooled = []
+    for start_row, end_row, _ in shards:
+        with SpooledShardReader(spool_path(str(tmp_path / "shards"), start_row)) as reader:
+            assert reader.headers == ["ID", "Name", "Email"]
+            spooled.extend(reader.iter_rows())
+    assert spooled == expected
+
+    # A resumed shard starts from its checkpoint
+    with SpooledShardReader(spool_path(str(tmp_path / "shards"), 12)) as reader:
+        assert [row_number for row_number, _ in reader.iter_rows(start_row=21)] == [21, 22]
+
+
+def test_open_row_reader_streams_csv_and_tsv(tmp_path):
+    csv_path = tmp_path / "upload.csv"
+    csv_path.write_text('\ufeffID,Name,Email\n101,"Doe, Jane",jane@example.com\n,,\n102,John,\n', encoding="utf-8")
+    tsv_path = tmp_path / "upload.tsv"
+    tsv_path.write_text("ID\tName\tEmail\n101\tDoe, Jane\tjane@example.com\n", encoding="utf-8")
+
+    with open_row_reader(str(csv_path)) as reader:
+        assert isinstance(reader, CsvRowReader)
+        assert reader.headers == ["ID", "Name", "Email"]
+        assert reader.estimated_rows() == 3
+        rows = list(reader.iter_rows(start_row=2, end_row=4))
+
+    assert rows == [
+        (2, {"ID": "101", "Name": "Doe, Jane", "Email": "jane@example.com"}),
+        (4, {"ID": "102", "Name": "John", "Email": None}),
+    ]
+
+    with open_row_reader(str(tsv_path)) as reader:
+        assert list(reader.iter_rows()) == [rows[0]]
+
+
+def test_csv_reader_falls_back_to_windows_encoding(tmp_path):
+    path = tmp_path / "upload.csv"
+    path.write_bytes("ID,Name,Email\n101,Jos\u00e9 N\u00fa\u00f1ez,jose@example.com\n".encode("cp1252"))
+
+    with open_row_reader(str(path)) as reader:
+        assert reader.encoding == "cp1252"
+        assert list(reader.iter_rows())[0][1]["Name"] == "Jos\u00e9 N\u00fa\u00f1ez"
+
+    # 0x81 is undefined in cp1252 and invalid as UTF-8
+    path.write_bytes(b"ID,Name,Email\n101,\x81\xe9,jose@example.com\n")
+    with pytest.raises(ValueError, match="not UTF-8 or Windows-1252"):
+        with open_row_reader(str(path)):
+            pass
+
+
+def test_open_row_reader_streams_parquet_ranges(tmp_path, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    path = tmp_path / "upload.parquet"
+    table = pa.table({"ID": [101, 102, 103], "Name": ["Jane", None, "Ann"], "Email": ["a@x.com", "b@x.com", "c@x.com"]})
+    pq.write_table(table, path)
+
+    monkeypatch.setattr(ParquetRowReader, "read_batch_size", 2)
+    with open_row_reader(str(path)) as reader:
+        assert reader.estimated_rows() == 3
+        rows = list(reader.iter_rows(start_row=3))
+
+    assert rows == [
+        (3, {"ID": "102", "Name": None, "Email": "b@x.com"}),
+        (4, {"ID": "103", "Name": "Ann", "Email": "c@x.com"}),
+    ]
+
+
+def test_validate_excel_file_dry_run_counts_bad_rows(tmp_path):
+    path = tmp_path / "upload.csv"
+    path.write_text("ID,Name,Email,Zip Code\n101,Jane,jane@example.com,\n102,,,\n103,John,john@example.com,123456789012\n")
+
+    result = validate_excel_file(str(path), sample_size=1)
+
+    assert result["is_valid"] is False
+    assert (result["total_rows"], result["valid_rows"], result["skipped_rows"], result["failed_rows"]) == (3, 1, 1, 1)
+    assert result["sample_skipped"] == [{"row": 3, "reason": "Missing required data: Name, Email"}]
+    assert result["errors"] == ["Row 3: Missing required data: Name, Email", "Row 4: Value too long: Zip Code"]
@@ -0,0 +1,112 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from retainer_app import tasks
+
+
+class FakeOutbox:
+    """SubmissionOutbox claims and leases, as _claim_outbox and _renew_outbox_claims apply them"""
+
+    def __init__(self, recipient_ids, lease):
+        self.lease = lease
+        self.entries = {
+            recipient_id: SimpleNamespace(id=recipient_id, status='pending', claimed_at=None)
+            for recipient_id in recipient_ids
+        }
+
+    def claim(self, recipient_ids, abandoned_only=False):
+        now = time.monotonic()
+        claimed = [
+            entry for entry in (self.entries[recipient_id] for recipient_id in recipient_ids)
+            if (entry.status == 'pending' and not abandoned_only)
+            or (entry.status == 'sending' and entry.claimed_at < now - self.lease)
+        ]
+        for entry in claimed:
+            entry.status = 'sending'
+            entry.claimed_at = now
+        return claimed
+
+    def renew(self, entry_ids):
+        for entry_id in entry_ids:
+            if self.entries[entry_id].status == 'sending':
+                self.entries[entry_id].claimed_at = time.monotonic()
+
+    def save(self, outcomes, final_attempt):
+        for entry, _, _ in outcomes:
+            entry.status = 'sent'
+        return len(outcomes), [], []
+
+
+@pytest.fixture
+def outbox(settings, monkeypatch):
+    settings.RETAINER_OUTBOX_LEASE_SECONDS = 0.4
+    settings.RETAINER_SUBMISSION_WRITE_BATCH = 2
+    settings.OUTBOUND_RATE_LIMITS = {'nextkeysign': {'rate': 10, 'burst': 10}}
+    outbox = FakeOutbox(range(20), settings.RETAINER_OUTBOX_LEASE_SECONDS)
+    monkeypatch.setattr(tasks, '_claim_outbox', outbox.claim)
+    monkeypatch.setattr(tasks, '_renew_outbox_claims', outbox.renew)
+    monkeypatch.setattr(tasks, '_save_submission_outcomes', outbox.save)
+    monkeypatch.setattr(tasks, '_dispatch_submissions', lambda: 0)
+    monkeypatch.setattr(tasks.fair_queue, 'release', lambda name, task_id: None)
+    monkeypatch.setattr(tasks.circuit_breaker, 'check', lambda name: (0, 10))
+    monkeypatch.setattr(tasks.circuit_breaker, 'open_for', lambda name: 0)
+    return outbox
+
+
+def test_block_outlasting_the_lease_is_never_sent_twice(outbox, monkeypatch):
+    posted = []
+
+    def dispatch(entries, call, **kwargs):
+        for entry in entries:
+            # One call per token at 10/s: the whole block takes longer than the lease
+            time.sleep(0.05)
+            posted.append(entry.id)
+            yield entry, ('submission', 'submitter', 'slug'), None
+            # Meanwhile the drain re-claims whatever it takes for abandoned
+            posted.extend(entry.id for entry in outbox.claim(list(outbox.entries), abandoned_only=True))
+
+    monkeypatch.setattr(tasks, 'dispatch', dispatch)
+    result = tasks.dispatch_nextkeysign_submissions.run(list(range(20)))
+
+    assert sorted(posted) == list(range(20))
+    assert result == {'created': 20, 'failed': 0}
+
+
+def test_claims_are_sized_to_finish_within_half_a_lease(settings):
+    settings.OUTBOUND_RATE_LIMITS = {'nextkeysign': {'rate': 10, 'burst': 20}}
+    settings.RETAINER_OUTBOX_LEASE_SECONDS = 300
+    settings.RETAINER_SUBMISSION_WRITE_BATCH = 200
+    assert tasks._outbox_claim_size() == 1500
+
+    settings.OUTBOUND_RATE_LIMITS = {'nextkeysign': {'rate': 0.5, 'burst': 1}}
+    assert tasks._outbox_claim_size() == 200
+
+
+def test_batch_starts_one_call_per_token_as_they_come_due(outbox, monkeypatch):
+    started = []
+
+    def submit(entry):
+        started.append(time.monotonic())
+        return entry, ('submission', 'submitter', 'slug'), None
+
+    monkeypatch.setattr(tasks, '_submit_outbox_entry', submit)
+    monkeypatch.setattr(tasks.rate_limit, 'reserve', lambda name, tokens=1: 0.0)
+    result = tasks.create_nextkeysign_submissions_batch.run(list(range(5)))
+
+    # 10 tokens a second: calls start 0.1s apart even with more threads than calls
+    assert result == {'created': 5, 'failed': 0}
+    assert [round(at - started[0], 1) for at in sorted(started)] == [0.0, 0.1, 0.2, 0.3, 0.4]
+
+
+def test_batch_waits_for_its_first_token_rather_than_its_last(outbox, monkeypatch):
+    rescheduled = []
+    monkeypatch.setattr(tasks.rate_limit, 'reserve', lambda name, tokens=1: 3.0)
+    monkeypatch.setattr(tasks.rate_limit, 'reschedule', lambda task, countdown, **kwargs: rescheduled.append(countdown))
+
+    result = tasks.create_nextkeysign_submissions_batch.run(list(range(20)))
+
+    # The last of 20 tokens is due in 3s, so the first is due 1.9s earlier
+    assert result['rescheduled']
+    assert rescheduled == [pytest.approx(1.1)]
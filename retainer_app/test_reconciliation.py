@@ -0,0 +1,135 @@
+import json
+import threading
+from datetime import datetime, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+
+from retainer_app.models import (
+    DocumentSubmission, DocumentTemplate, EmailTemplate, ExcelUpload, LawFirm, RetainerRecipient
+)
+from retainer_app.reconciliation import _reconcile_retainer, reconcile_rows, remote_state
+from roblex import nextkeysign
+
+
+class StubNextKeySign(BaseHTTPRequestHandler):
+    """GET /api/submissions with NextKeySign's limit/before/after paging, newest first"""
+    submission_ids = list(range(1, 251))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: int(values[0]) for key, values in parse_qs(url.query).items()}
+        ids = [
+            submission_id for submission_id in sorted(self.submission_ids, reverse=True)
+            if submission_id < params.get('before', float('inf')) and submission_id > params.get('after', 0)
+        ][:params['limit']]
+        body = json.dumps({'data': [{'id': submission_id, 'status': 'pending'} for submission_id in ids]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_nextkeysign(settings):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubNextKeySign)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.NEXTKEYSIGN_BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    yield
+    server.shutdown()
+
+
+def test_list_submissions_pages_down_to_the_floor(stub_nextkeysign):
+    seen = []
+    before = None
+    while True:
+        submissions, before = nextkeysign.list_submissions(before=before, after=49, limit=100)
+        seen.extend(submission['id'] for submission in submissions)
+        if before is None:
+            break
+
+    assert seen == list(range(250, 49, -1))
+
+    # A run that stopped at a cursor resumes just below it
+    submissions, before = nextkeysign.list_submissions(before=151, after=49, limit=100)
+    assert [submission['id'] for submission in submissions] == list(range(150, 50, -1))
+    assert before == 51
+
+
+def test_reconcile_rows_only_moves_rows_forward():
+    now = datetime(2026, 1, 2, tzinfo=dt_timezone.utc)
+    rows = [
+        DocumentSubmission(nextkeysign_submission_id='1', status='sent'),
+        DocumentSubmission(nextkeysign_submission_id='2', status='opened'),
+        DocumentSubmission(nextkeysign_submission_id='3', status='opened'),
+        DocumentSubmission(nextkeysign_submission_id='4', status='sent'),
+        DocumentSubmission(nextkeysign_submission_id='5', status='sent'),
+    ]
+    remote_by_id = {
+        1: remote_state({
+            'id': 1, 'status': 'completed', 'completed_at': '2026-01-01T10:00:00Z',
+            'audit_log_url': 'https://sign.example.com/audit/1.pdf',
+            'documents': [{'name': 'Retainer', 'url': 'https://sign.example.com/docs/1.pdf'}],
+            'submitters': [{'status': 'completed', 'opened_at': '2026-01-01T09:00:00Z'}],
+        }),
+        # The listing lags behind a webhook that already marked it opened
+        2: remote_state({'id': 2, 'status': 'pending', 'submitters': [{'status': 'sent'}]}),
+        3: remote_state({
+            'id': 3, 'status': 'pending',
+            'submitters': [{'status': 'declined', 'declined_at': '2026-01-01T11:00:00Z', 'decline_reason': 'Wrong name'}],
+        }),
+        4: remote_state({'id': 4, 'status': 'pending', 'submitters': [{'status': 'opened'}]}),
+    }
+
+    changed, drift = reconcile_rows(rows, remote_by_id, now)
+
+    assert [row.nextkeysign_submission_id for row in changed] == ['1', '3', '4']
+    assert drift == {'sent->completed': 1, 'opened->declined': 1, 'sent->opened': 1}
+
+    completed, declined, opened = changed
+    assert completed.completed_at == datetime(2026, 1, 1, 10, tzinfo=dt_timezone.utc)
+    assert completed.opened_at == datetime(2026, 1, 1, 9, tzinfo=dt_timezone.utc)
+    assert completed.signed_document_url == 'https://sign.example.com/docs/1.pdf'
+    assert completed.audit_log_url == 'https://sign.example.com/audit/1.pdf'
+    assert declined.decline_reason == 'Wrong name'
+    assert opened.opened_at == now
+    assert rows[1].status == 'opened' and rows[4].status == 'sent'
+
+
+def test_expired_submission_fails_its_recipient(db, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    law_firm = LawFirm.objects.create(name="Doe Law", subdomain="doe", contact_email="office@doe.test")
+    template = DocumentTemplate.objects.create(
+        name="retainer", display_name="Retainer", law_firm=law_firm, nextkeysign_template_id="1"
+    )
+    upload = ExcelUpload.objects.create(
+        law_firm=law_firm, uploaded_by=User.objects.create(username="staff"), document_template=template,
+        file=ContentFile(b"", name="recipients.csv"),
+        email_template=EmailTemplate.objects.create(
+            name="invitation", template_type="invitation", law_firm=law_firm, subject="Sign", body="[Name]"
+        ),
+    )
+    recipient = RetainerRecipient.objects.create(
+        excel_upload=upload, external_id="101", name="Jane Doe", email="jane@example.com", status='submitted'
+    )
+    DocumentSubmission.objects.create(
+        recipient=recipient, document_template=template, nextkeysign_submission_id='7', external_id="101",
+        status='sent',
+    )
+    now = datetime(2026, 1, 2, tzinfo=dt_timezone.utc)
+
+    drift = _reconcile_retainer({7: remote_state({'id': 7, 'status': 'expired', 'submitters': []})}, now)
+
+    assert drift == {'sent->expired': 1}
+    recipient.refresh_from_db()
+    assert recipient.status == 'failed'
+    assert recipient.error_message == 'Document submission expired'
+    assert recipient.last_processed_at == now
@@ -0,0 +1,120 @@
+import pytest
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+
+from retainer_app import tasks
+from retainer_app.bulk_load import recipient_db_alias
+from retainer_app.models import (
+    DocumentSubmission, DocumentTemplate, EmailTemplate, ExcelUpload, ExcelUploadShard, LawFirm, RetainerRecipient,
+    SubmissionOutbox
+)
+
+
+class FakeNextKeySign:
+    """Submissions created and archived, by the calls the submission tasks make"""
+
+    def __init__(self):
+        self.created = []
+        self.archived = []
+
+    def create_submission(self, payload):
+        self.created.append(payload['submitters'][0])
+        submission_id = len(self.created)
+        return [{'submission_id': submission_id, 'id': submission_id, 'slug': f"slug-{submission_id}"}]
+
+    def request(self, method, path, **kwargs):
+        assert method == 'DELETE'
+        self.archived.append(path)
+        return type('Response', (), {'status_code': 200, 'raise_for_status': lambda self: None})()
+
+
+@pytest.fixture
+def nextkeysign(monkeypatch):
+    fake = FakeNextKeySign()
+    monkeypatch.setattr(tasks.nextkeysign, 'create_submission', fake.create_submission)
+    monkeypatch.setattr(tasks.nextkeysign, 'request', fake.request)
+    monkeypatch.setattr(tasks.circuit_breaker, 'open_for', lambda name: 0)
+    monkeypatch.setattr(tasks.circuit_breaker, 'record', lambda name, outcome, latency: None)
+    monkeypatch.setattr(tasks.rate_limit, 'acquire', lambda name: 0)
+    monkeypatch.setattr(tasks.progress, 'increment', lambda upload_id, **counts: None)
+    monkeypatch.setattr(tasks, '_queue_submissions', lambda recipient_ids, law_firm_id, front=False: None)
+    monkeypatch.setattr(
+        tasks.archive_superseded_submissions, 'delay',
+        lambda recipient_ids: tasks.archive_superseded_submissions.apply(args=[recipient_ids]),
+    )
+    return fake
+
+
+@pytest.fixture
+def upload_fields(db, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    law_firm = LawFirm.objects.create(name="Doe Law", subdomain="doe", contact_email="office@doe.test")
+    return {
+        'law_firm': law_firm,
+        'uploaded_by': User.objects.create(username="staff"),
+        'document_template': DocumentTemplate.objects.create(
+            name="retainer", display_name="Retainer", law_firm=law_firm, nextkeysign_template_id="1"
+        ),
+        'email_template': EmailTemplate.objects.create(
+            name="invitation", template_type="invitation", law_firm=law_firm, subject="Sign", body="[Name]"
+        ),
+    }
+
+
+def _import(upload_fields, rows, previous_upload=None):
+    """Import rows as a new upload, the way one shard batch commits them"""
+    upload = ExcelUpload.objects.create(
+        file=ContentFile(b"", name="recipients.csv"), previous_upload=previous_upload, **upload_fields
+    )
+    shard = ExcelUploadShard.objects.create(excel_upload=upload, start_row=2, next_row=2)
+    batch = list(enumerate(rows, start=2))
+    revision = tasks.RevisionDiff(upload) if previous_upload else None
+    tasks._commit_shard_batch(shard, upload, batch, 2, len(rows) + 2, recipient_db_alias(), revision)
+    return upload
+
+
+def _send(upload):
+    """Submit the upload's recipients, as a submission task would"""
+    entries = tasks._claim_outbox(list(upload.recipients.values_list('id', flat=True)))
+    tasks._save_submission_outcomes([tasks._submit_outbox_entry(entry) for entry in entries], final_attempt=True)
+
+
+JANE = {"ID": "101", "Name": "Jane Doe", "Email": "jane@example.com"}
+JANE_CORRECTED = {"ID": "101", "Name": "Jane Roe", "Email": "jane@example.com"}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_corrected_row_before_sending_produces_one_submission(upload_fields, nextkeysign):
+    original = _import(upload_fields, [JANE])
+    revision = _import(upload_fields, [JANE_CORRECTED], previous_upload=original)
+    _send(original)
+    _send(revision)
+
+    assert [submitter['name'] for submitter in nextkeysign.created] == ["Jane Roe"]
+    assert original.recipients.get().status == 'superseded'
+    assert SubmissionOutbox.objects.get(recipient__excel_upload=original).status == 'cancelled'
+    assert revision.recipients.get().status == 'submitted'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_corrected_row_after_sending_archives_the_first_submission(upload_fields, nextkeysign):
+    original = _import(upload_fields, [JANE])
+    _send(original)
+    revision = _import(upload_fields, [JANE_CORRECTED], previous_upload=original)
+    _send(revision)
+
+    superseded = DocumentSubmission.objects.get(recipient__excel_upload=original)
+    assert nextkeysign.archived == [f"submissions/{superseded.nextkeysign_submission_id}"]
+    assert superseded.status == 'archived'
+    assert DocumentSubmission.objects.exclude(status='archived').get().recipient.name == "Jane Roe"
+    assert RetainerRecipient.objects.get(excel_upload=original).status == 'superseded'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_corrected_row_of_a_signed_retainer_is_skipped(upload_fields, nextkeysign):
+    original = _import(upload_fields, [JANE])
+    original.recipients.update(status='completed')
+    revision = _import(upload_fields, [JANE_CORRECTED], previous_upload=original)
+
+    assert not revision.recipients.exists()
+    assert revision.row_outcomes.get().reason == f"Already signed in upload #{original.id}"
@@ -0,0 +1,117 @@
+import hashlib
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from retainer_app.models import (
+    ColumnMappingProfile, DocumentTemplate, EmailTemplate, ExcelUpload, LawFirm, LawFirmUser, RecipientDedupKey,
+    RetainerRecipient
+)
+
+
+def _staff_client(law_firm):
+    """API client logged in as a staff user of the law firm"""
+    user = User.objects.create(username=f"{law_firm.subdomain}-staff", is_staff=True)
+    LawFirmUser.objects.create(user=user, law_firm=law_firm)
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def law_firms(db, settings, tmp_path):
+    """Two law firms, the second of which has already imported jane@example.com"""
+    settings.MEDIA_ROOT = str(tmp_path)
+    own = LawFirm.objects.create(name="Doe Law", subdomain="doe", contact_email="office@doe.test")
+    other = LawFirm.objects.create(name="Roe Law", subdomain="roe", contact_email="office@roe.test")
+    upload = ExcelUpload.objects.create(
+        law_firm=other, uploaded_by=User.objects.create(username="roe-admin"),
+        file=SimpleUploadedFile("recipients.csv", b""),
+        document_template=DocumentTemplate.objects.create(
+            name="retainer", display_name="Retainer", law_firm=other, nextkeysign_template_id="1"
+        ),
+        email_template=EmailTemplate.objects.create(
+            name="invitation", template_type="invitation", law_firm=other, subject="Sign", body="[Name]"
+        ),
+    )
+    recipient = RetainerRecipient.objects.create(
+        excel_upload=upload, external_id="101", name="Jane Doe", email="jane@example.com"
+    )
+    RecipientDedupKey.objects.create(law_firm=other, key_type='email', value="jane@example.com", recipient=recipient)
+    return own, other
+
+
+def _dry_run(users_law_firm, **data):
+    csv = SimpleUploadedFile("recipients.csv", b"ID,Name,Email\n201,Jane Doe,jane@example.com\n")
+    return _staff_client(users_law_firm).post(
+        reverse('retainer_app:upload_dry_run'), {'file': csv, **data}, format='multipart'
+    )
+
+
+def test_dry_run_does_not_look_up_another_law_firms_recipients(law_firms):
+    own, other = law_firms
+
+    response = _dry_run(own, law_firm=other.id)
+    assert response.status_code == 200
+    assert response.data['skipped_rows'] == 0
+
+    response = _dry_run(other)
+    assert response.data['sample_skipped'][0]['reason'].startswith("Duplicate email jane@example.com")
+
+
+def test_dry_run_rejects_another_law_firms_column_mapping(law_firms):
+    own, other = law_firms
+    profile = ColumnMappingProfile.objects.create(law_firm=other, name="Roe export")
+
+    response = _dry_run(own, column_mapping=profile.id)
+
+    assert response.status_code == 400
+    assert response.data['error'] == 'Column mapping profile not found'
+
+
+def test_upload_progress_is_only_shown_to_the_uploads_law_firm(law_firms):
+    own, other = law_firms
+    upload = ExcelUpload.objects.get(law_firm=other)
+
+    response = _staff_client(own).get(reverse('retainer_app:upload_progress', args=[upload.id]))
+
+    assert response.status_code == 404
+    assert APIClient().get(reverse('retainer_app:upload_progress', args=[upload.id])).status_code == 403
+
+
+def test_chunked_upload_with_bad_checksum_starts_over(law_firms, settings, tmp_path):
+    _, other = law_firms
+    settings.RETAINER_CHUNKED_UPLOAD_DIR = str(tmp_path / "parts")
+    profile = ColumnMappingProfile.objects.create(law_firm=other, name="Roe export")
+    content = b"ID,Name,Email\n301,Ann Lee,ann@example.com\n"
+    client = _staff_client(other)
+
+    response = client.post(reverse('retainer_app:chunked_upload'), {
+        'filename': "recipients.csv", 'total_size': len(content), 'column_mapping': profile.id,
+        'document_template': DocumentTemplate.objects.get().id, 'email_template': EmailTemplate.objects.get().id,
+    })
+    upload_id = response.data['upload_id']
+
+    def send_file():
+        return client.put(
+            reverse('retainer_app:chunked_upload_detail', args=[upload_id]), content,
+            content_type='application/octet-stream', HTTP_CONTENT_RANGE=f"bytes 0-{len(content) - 1}/{len(content)}",
+        )
+
+    def complete(sha256):
+        return client.post(reverse('retainer_app:chunked_upload_complete', args=[upload_id]), {'sha256': sha256})
+
+    send_file()
+    response = complete("0" * 64)
+    assert response.status_code == 400
+    assert response.data['error'].startswith("Checksum mismatch")
+    assert response.data['offset'] == 0
+
+    assert send_file().data['offset'] == len(content)
+    response = complete(hashlib.sha256(content).hexdigest())
+    assert response.status_code == 201
+    excel_upload = ExcelUpload.objects.get(id=response.data['excel_upload_id'])
+    assert excel_upload.column_mapping == profile
@@ -13,5 +13,12 @@ urlpatterns = [
     
     # API endpoints for future expansion
     path('api/upload-status/<int:upload_id>/', views.UploadStatusAPIView.as_view(), name='upload_status'),
+    path('api/upload-progress/<int:upload_id>/', views.UploadProgressAPIView.as_view(), name='upload_progress'),
     path('api/retry-failed/<int:recipient_id>/', views.RetryFailedSubmissionAPIView.as_view(), name='retry_failed'),
+    path('api/upload-dry-run/', views.UploadDryRunAPIView.as_view(), name='upload_dry_run'),
+    
+    # Chunked, resumable uploads for large files
+    path('api/chunked-uploads/', views.ChunkedUploadAPIView.as_view(), name='chunked_upload'),
+    path('api/chunked-uploads/<uuid:upload_id>/', views.ChunkedUploadDetailAPIView.as_view(), name='chunked_upload_detail'),
+    path('api/chunked-uploads/<uuid:upload_id>/complete/', views.ChunkedUploadCompleteAPIView.as_view(), name='chunked_upload_complete'),
 ]
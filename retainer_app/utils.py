@@ -1,68 +1,136 @@
 import pandas as pd
 import openpyxl
 from django.core.exceptions import ValidationError
-from django.core.validators import validate_email
 
+from .dedup import dedup_keys, exclude_duplicates
+from .excel_import import compile_column_mapping, iter_batches, normalize_batch, open_row_reader
+from .models import ColumnMappingProfile, LawFirm, LawFirmUser
 
-def validate_excel_file(file_path):
+
+def get_user_law_firm(user):
     """
-    Validate Excel file structure and required columns
+    Retainer law firm of a user, via LawFirmUser or the matching roblex_app firm.
+    Superusers are not tied to a firm and get None.
     """
+    if user.is_superuser:
+        return None
+
     try:
-        # Read Excel file
-        df = pd.read_excel(file_path)
-        
-        # Required columns
-        required_columns = ['ID', 'Name', 'Email']
-        optional_columns = ['Phone', 'State', 'Zip Code', 'Age', 'First Name Injured', 'Last Name Injured']
-        
-        # Check for required columns
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            raise ValidationError(f"Missing required columns: {', '.join(missing_columns)}")
-        
-        # Validate data types and formats
-        validation_errors = []
-        
-        for index, row in df.iterrows():
-            row_num = index + 2  # Excel row number (1-indexed + header)
-            
-            # Validate ID
-            if pd.isna(row['ID']):
-                validation_errors.append(f"Row {row_num}: Missing ID")
+        # Try retainer app law firm user first (direct association)
+        try:
+            law_firm_user = LawFirmUser.objects.get(user=user)
+            return law_firm_user.law_firm
+        except LawFirmUser.DoesNotExist:
+            pass
+
+        # Import here to avoid circular imports
+        from roblex_app.models import LawFirmUser as RoblexLawFirmUser
+        try:
+            roblex_law_firm_user = RoblexLawFirmUser.objects.get(user=user)
+            roblex_firm_name = roblex_law_firm_user.law_firm.name
+
+            # Try exact match first
+            try:
+                retainer_law_firm = LawFirm.objects.get(name=roblex_firm_name)
+                return retainer_law_firm
+            except LawFirm.DoesNotExist:
+                pass
+
+            # Try partial match (for cases like "Bullock Legal" vs "Bullock Legal Group")
+            # Look for retainer law firm containing the roblex firm name
+            retainer_firms = LawFirm.objects.filter(name__icontains=roblex_firm_name)
+            if retainer_firms.exists():
+                return retainer_firms.first()
+
+            # Try the reverse - roblex firm name containing retainer firm name
+            retainer_firms = LawFirm.objects.all()
+            for firm in retainer_firms:
+                if firm.name.lower() in roblex_firm_name.lower() or roblex_firm_name.lower() in firm.name.lower():
+                    return firm
+
+            return None
+
+        except RoblexLawFirmUser.DoesNotExist:
+            return None
+
+    except Exception as e:
+        # Log the error for debugging but don't crash
+        return None
+
+
+# Bad rows returned per category by a dry run
+DRY_RUN_SAMPLE_SIZE = 50
+# Nothing is written during a dry run, so batches can be much larger than the import's
+DRY_RUN_BATCH_SIZE = 10000
+
+
+def validate_excel_file(file_path, law_firm_id=None, sample_size=DRY_RUN_SAMPLE_SIZE, column_mapping=None):
+    """
+    Dry run of an upload: stream the file through the same validation as
+    process_excel_upload without writing anything or queuing tasks.
+    With a law firm, rows that would be skipped as duplicates are counted too.
+    column_mapping is a ColumnMappingProfile; the law firm's default is used otherwise.
+    """
+    if column_mapping is None and law_firm_id:
+        column_mapping = ColumnMappingProfile.objects.filter(law_firm_id=law_firm_id, is_default=True).first()
+    
+    try:
+        with open_row_reader(file_path) as reader:
+            columns = reader.headers
+            if column_mapping:
+                mapping = column_mapping.compile(columns)
+            else:
+                mapping = compile_column_mapping(columns)
             
-            # Validate Name
-            if pd.isna(row['Name']) or str(row['Name']).strip() == '':
-                validation_errors.append(f"Row {row_num}: Missing Name")
+            missing_columns = mapping.missing_required
+            if missing_columns:
+                raise ValidationError(f"Missing required columns: {', '.join(missing_columns)}")
             
-            # Validate Email
-            if pd.isna(row['Email']):
-                validation_errors.append(f"Row {row_num}: Missing Email")
-            else:
-                try:
-                    validate_email(str(row['Email']))
-                except ValidationError:
-                    validation_errors.append(f"Row {row_num}: Invalid email format")
+            total_rows = valid_rows = 0
+            skipped = []
+            failed = []
+            skipped_count = failed_count = 0
+            seen_keys = set()
             
-            # Validate Age if provided
-            if not pd.isna(row.get('Age', '')) and row.get('Age', '') != '':
-                try:
-                    age = int(row['Age'])
-                    if age < 0 or age > 120:
-                        validation_errors.append(f"Row {row_num}: Invalid age (must be 0-120)")
-                except (ValueError, TypeError):
-                    validation_errors.append(f"Row {row_num}: Age must be a number")
-        
-        # Return validation results
-        return {
-            'is_valid': len(validation_errors) == 0,
-            'errors': validation_errors,
-            'total_rows': len(df),
-            'columns': list(df.columns)
-        }
-        
+            for batch in iter_batches(reader.iter_rows(), DRY_RUN_BATCH_SIZE):
+                normalized = normalize_batch(batch, mapping)
+                
+                if law_firm_id:
+                    exclude_duplicates(law_firm_id, normalized)
+                    # Earlier batches are not in the index during a dry run, so repeats are tracked here
+                    repeated = [
+                        index for index, record in enumerate(normalized.records)
+                        if any(key in seen_keys for key in dedup_keys(record))
+                    ]
+                    normalized.skip(repeated, ["Duplicate of an earlier row in this file"] * len(repeated))
+                    seen_keys.update(key for record in normalized.records for key in dedup_keys(record))
+                
+                total_rows += len(batch)
+                valid_rows += len(normalized.records)
+                skipped_count += len(normalized.skipped)
+                failed_count += len(normalized.failed)
+                skipped.extend(normalized.skipped[:sample_size - len(skipped)])
+                failed.extend(normalized.failed[:sample_size - len(failed)])
+    
+    except ValidationError:
+        raise
     except Exception as e:
         raise ValidationError(f"Error reading Excel file: {str(e)}")
+    
+    errors = [f"Row {row_number}: {reason}" for row_number, reason in sorted(failed + skipped)]
+    
+    return {
+        'is_valid': skipped_count == 0 and failed_count == 0,
+        'errors': errors,
+        'total_rows': total_rows,
+        'valid_rows': valid_rows,
+        'skipped_rows': skipped_count,
+        'failed_rows': failed_count,
+        'sample_skipped': [{'row': row_number, 'reason': reason} for row_number, reason in skipped],
+        'sample_failed': [{'row': row_number, 'reason': reason} for row_number, reason in failed],
+        'columns': columns,
+        'column_sources': mapping.sources,
+    }
 
 
 def clean_excel_data(row):
@@ -1,6 +1,18 @@
+import fcntl
+import hashlib
 import json
 import logging
+import os
+import re
+import tempfile
+from functools import partial
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
 from django.http import JsonResponse
+from django.utils.text import get_valid_filename
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_http_methods
@@ -8,10 +20,16 @@ from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
 from .models import (
-    ExcelUpload, RetainerRecipient, DocumentSubmission, DocumentWebhookEvent
+    ExcelUpload, RetainerRecipient, DocumentSubmission, DocumentWebhookEvent,
+    ChunkedUpload, ColumnMappingProfile, DocumentTemplate, EmailTemplate, LawFirm, SUPPORTED_UPLOAD_EXTENSIONS
 )
-from .tasks import retry_failed_submission
+from . import progress
+from .bulk_load import recipient_db_alias
+from .tasks import process_excel_upload, retry_failed_submission
+from .utils import get_user_law_firm, validate_excel_file
 
 logger = logging.getLogger(__name__)
 
@@ -199,6 +217,7 @@ class UploadStatusAPIView(APIView):
                 'success_rate': upload.get_success_rate(),
                 'created_at': upload.created_at,
                 'completed_at': upload.completed_at,
+                'progress': progress.get_progress(upload.id),
             }
             
             return Response(data, status=status.HTTP_200_OK)
@@ -237,3 +256,382 @@ class RetryFailedSubmissionAPIView(APIView):
             return Response({'error': 'Recipient not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class UploadDryRunAPIView(APIView):
+    """
+    Validate an upload file without importing it.
+    Returns row counts and a sample of the rows that would be skipped or fail.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+    
+    def post(self, request):
+        uploaded_file = request.FILES.get('file')
+        if not uploaded_file:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Duplicates and mappings are only ever looked up in the user's own law firm
+        law_firm = get_user_law_firm(request.user)
+        if law_firm is None and request.user.is_superuser and request.data.get('law_firm'):
+            law_firm = LawFirm.objects.filter(id=request.data.get('law_firm')).first()
+            if law_firm is None:
+                return Response({'error': 'Law firm not found'}, status=status.HTTP_400_BAD_REQUEST)
+        if law_firm is None and not request.user.is_superuser:
+            return Response({'error': 'Law firm not found'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        column_mapping = None
+        if request.data.get('column_mapping'):
+            column_mapping = ColumnMappingProfile.objects.filter(
+                id=request.data.get('column_mapping'), law_firm=law_firm
+            ).first()
+            if column_mapping is None:
+                return Response({'error': 'Column mapping profile not found'}, status=status.HTTP_400_BAD_REQUEST)
+        temp_path = None
+        
+        try:
+            # Large files are already on disk; small ones are spooled to a temp file for the readers
+            if hasattr(uploaded_file, 'temporary_file_path'):
+                file_path = uploaded_file.temporary_file_path()
+            else:
+                suffix = os.path.splitext(uploaded_file.name)[1]
+                with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+                    for chunk in uploaded_file.chunks():
+                        temp_file.write(chunk)
+                temp_path = file_path = temp_file.name
+            
+            result = validate_excel_file(
+                file_path, law_firm_id=law_firm.id if law_firm else None, column_mapping=column_mapping
+            )
+            return Response(result, status=status.HTTP_200_OK)
+            
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error validating upload {uploaded_file.name}: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            if temp_path:
+                os.remove(temp_path)
+
+
+def _upload_progress(upload_id, law_firm=None):
+    """
+    Status and live counters of an upload, or None if it does not exist or,
+    given a law firm, belongs to another one
+    """
+    uploads = ExcelUpload.objects.filter(id=upload_id)
+    if law_firm is not None:
+        uploads = uploads.filter(law_firm=law_firm)
+    upload = uploads.values('status', 'total_rows').first()
+    if upload is None:
+        return None
+    
+    counters = progress.get_progress(upload_id) or {}
+    submitted = counters.get('submissions', 0) + counters.get('submission_failures', 0)
+    return {
+        'id': upload_id,
+        'status': upload['status'],
+        'total_rows': upload['total_rows'],
+        **counters,
+        'finished': upload['status'] in ['completed', 'failed'] and submitted >= counters.get('created', 0),
+    }
+
+
+class UploadProgressAPIView(APIView):
+    """
+    Live progress counters of an Excel upload, read from Redis. Clients
+    poll it until `finished` is true.
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request, upload_id):
+        law_firm = get_user_law_firm(request.user)
+        if law_firm is None and not request.user.is_superuser:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        data = _upload_progress(upload_id, law_firm)
+        if data is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+# Bytes read from the request body per write
+CHUNK_COPY_SIZE = 64 * 1024
+
+
+def _chunked_upload_data(chunked_upload):
+    return {
+        'upload_id': str(chunked_upload.upload_id),
+        'filename': chunked_upload.filename,
+        'status': chunked_upload.status,
+        'offset': chunked_upload.offset,
+        'total_size': chunked_upload.total_size,
+        'chunk_size': settings.RETAINER_UPLOAD_CHUNK_SIZE,
+        'excel_upload_id': chunked_upload.excel_upload_id,
+    }
+
+
+def _user_chunked_uploads(user):
+    queryset = ChunkedUpload.objects.all()
+    if not user.is_superuser:
+        queryset = queryset.filter(uploaded_by=user)
+    return queryset
+
+
+class ChunkedUploadAPIView(APIView):
+    """
+    Start a chunked upload of a large recipient file.
+    
+    The client then PUTs consecutive parts to the returned upload with a
+    `Content-Range: bytes start-end/total` header, can GET it to find the
+    offset to resume from after a dropped connection, and POSTs to
+    complete/ once every byte has arrived.
+    """
+    permission_classes = [IsAdminUser]
+    
+    def post(self, request):
+        filename = os.path.basename(str(request.data.get('filename', '')))
+        extension = os.path.splitext(filename)[1][1:].lower()
+        if extension not in SUPPORTED_UPLOAD_EXTENSIONS:
+            return Response(
+                {'error': f"Unsupported file type, expected one of: {', '.join(SUPPORTED_UPLOAD_EXTENSIONS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            total_size = int(request.data.get('total_size'))
+        except (TypeError, ValueError):
+            return Response({'error': 'total_size is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if total_size <= 0 or total_size > settings.RETAINER_CHUNKED_UPLOAD_MAX_SIZE:
+            return Response(
+                {'error': f"total_size must be between 1 and {settings.RETAINER_CHUNKED_UPLOAD_MAX_SIZE} bytes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        law_firm = get_user_law_firm(request.user)
+        if law_firm is None and request.user.is_superuser:
+            law_firm = LawFirm.objects.filter(id=request.data.get('law_firm')).first()
+        if law_firm is None:
+            return Response({'error': 'Law firm not found'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        document_template = DocumentTemplate.objects.filter(
+            id=request.data.get('document_template'), law_firm=law_firm
+        ).first()
+        email_template = EmailTemplate.objects.filter(
+            Q(law_firm=law_firm) | Q(law_firm__isnull=True), id=request.data.get('email_template')
+        ).first()
+        if document_template is None or email_template is None:
+            return Response({'error': 'Document or email template not found'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        previous_upload = None
+        if request.data.get('previous_upload'):
+            previous_upload = ExcelUpload.objects.filter(
+                id=request.data.get('previous_upload'), law_firm=law_firm
+            ).first()
+            if previous_upload is None:
+                return Response({'error': 'Previous upload not found'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        column_mapping = None
+        if request.data.get('column_mapping'):
+            column_mapping = ColumnMappingProfile.objects.filter(
+                id=request.data.get('column_mapping'), law_firm=law_firm
+            ).first()
+            if column_mapping is None:
+                return Response({'error': 'Column mapping profile not found'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        chunked_upload = ChunkedUpload.objects.create(
+            law_firm=law_firm,
+            uploaded_by=request.user,
+            document_template=document_template,
+            email_template=email_template,
+            previous_upload=previous_upload,
+            column_mapping=column_mapping,
+            filename=filename,
+            total_size=total_size,
+        )
+        os.makedirs(settings.RETAINER_CHUNKED_UPLOAD_DIR, exist_ok=True)
+        open(chunked_upload.part_path, 'wb').close()
+        
+        logger.info(f"Started chunked upload {chunked_upload.upload_id} of {filename} ({total_size} bytes)")
+        return Response(_chunked_upload_data(chunked_upload), status=status.HTTP_201_CREATED)
+
+
+def _check_chunked_part(chunked_upload, start, end, total):
+    """Error response if a part can't be appended to the upload at its current offset, else None"""
+    if chunked_upload.status != 'uploading':
+        return Response(
+            {'error': f"Upload is {chunked_upload.status}", **_chunked_upload_data(chunked_upload)},
+            status=status.HTTP_409_CONFLICT
+        )
+    if total != chunked_upload.total_size or end >= total:
+        return Response({'error': 'Content-Range does not match the upload size'}, status=status.HTTP_400_BAD_REQUEST)
+    if start != chunked_upload.offset:
+        # Part already received or out of order; the client resumes from offset
+        return Response(
+            {'error': 'Part does not start at the current offset', **_chunked_upload_data(chunked_upload)},
+            status=status.HTTP_409_CONFLICT
+        )
+    return None
+
+
+class ChunkedUploadDetailAPIView(APIView):
+    """
+    Resume state of a chunked upload (GET) and receiving its parts (PUT)
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request, upload_id):
+        chunked_upload = _user_chunked_uploads(request.user).filter(upload_id=upload_id).first()
+        if chunked_upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_chunked_upload_data(chunked_upload), status=status.HTTP_200_OK)
+    
+    def put(self, request, upload_id):
+        match = CONTENT_RANGE_RE.match(request.headers.get('Content-Range', ''))
+        if not match:
+            return Response({'error': 'Content-Range header required'}, status=status.HTTP_400_BAD_REQUEST)
+        start, end, total = (int(value) for value in match.groups())
+        length = end - start + 1
+        
+        if length <= 0 or length > settings.RETAINER_UPLOAD_CHUNK_SIZE:
+            return Response(
+                {'error': f"Parts must be between 1 and {settings.RETAINER_UPLOAD_CHUNK_SIZE} bytes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        chunked_upload = _user_chunked_uploads(request.user).filter(upload_id=upload_id).first()
+        if chunked_upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        error_response = _check_chunked_part(chunked_upload, start, end, total)
+        if error_response:
+            return error_response
+        
+        with open(chunked_upload.part_path, 'r+b') as part_file:
+            # One writer per upload at a time, without holding a database lock while the body streams in
+            try:
+                fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return Response(
+                    {'error': 'Another part of this upload is being received', **_chunked_upload_data(chunked_upload)},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            # Another part may have been received since the check above
+            chunked_upload.refresh_from_db(fields=['status', 'offset'])
+            error_response = _check_chunked_part(chunked_upload, start, end, total)
+            if error_response:
+                return error_response
+            
+            # Stream the body to disk; anything past start left by an interrupted part is overwritten
+            received = 0
+            stream = request.stream
+            part_file.seek(start)
+            while stream is not None and received < length:
+                data = stream.read(min(CHUNK_COPY_SIZE, length - received))
+                if not data:
+                    break
+                part_file.write(data)
+                received += len(data)
+            part_file.truncate()
+            part_file.flush()
+            
+            if received != length:
+                return Response(
+                    {'error': f"Expected {length} bytes, received {received}", **_chunked_upload_data(chunked_upload)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Only the offset check and update hold the row lock, on the database the upload lives in
+            with transaction.atomic(using=recipient_db_alias()):
+                chunked_upload = ChunkedUpload.objects.select_for_update().get(id=chunked_upload.id)
+                if chunked_upload.status != 'uploading' or chunked_upload.offset != start:
+                    return Response(
+                        {'error': 'Upload changed while the part was received', **_chunked_upload_data(chunked_upload)},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                chunked_upload.offset = end + 1
+                chunked_upload.save(update_fields=['offset', 'updated_at'])
+        
+        return Response(_chunked_upload_data(chunked_upload), status=status.HTTP_200_OK)
+
+
+class ChunkedUploadCompleteAPIView(APIView):
+    """
+    Assemble a fully received chunked upload into an ExcelUpload and start processing it
+    """
+    permission_classes = [IsAdminUser]
+    
+    def post(self, request, upload_id):
+        chunked_upload = _user_chunked_uploads(request.user).filter(upload_id=upload_id).first()
+        if chunked_upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Completing twice returns the same ExcelUpload
+        if chunked_upload.status == 'complete':
+            return Response(_chunked_upload_data(chunked_upload), status=status.HTTP_200_OK)
+        
+        if chunked_upload.status != 'uploading' or chunked_upload.offset != chunked_upload.total_size:
+            return Response(
+                {'error': 'Upload is not complete', **_chunked_upload_data(chunked_upload)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # A fully received upload accepts no more parts, so it is hashed before taking the lock
+        expected_sha256 = request.data.get('sha256')
+        if expected_sha256:
+            digest = hashlib.sha256()
+            with open(chunked_upload.part_path, 'rb') as part_file:
+                for data in iter(partial(part_file.read, 1024 * 1024), b''):
+                    digest.update(data)
+            if digest.hexdigest() != expected_sha256.lower():
+                # The received bytes are corrupt, so the upload starts over instead of staying stuck at full size
+                with transaction.atomic(using=recipient_db_alias()):
+                    chunked_upload = ChunkedUpload.objects.select_for_update().get(id=chunked_upload.id)
+                    if chunked_upload.status == 'uploading' and chunked_upload.offset == chunked_upload.total_size:
+                        open(chunked_upload.part_path, 'wb').close()
+                        chunked_upload.offset = 0
+                        chunked_upload.save(update_fields=['offset', 'updated_at'])
+                logger.warning(f"Chunked upload {chunked_upload.upload_id} failed its checksum, reset to offset 0")
+                return Response(
+                    {
+                        'error': f"Checksum mismatch: received file has sha256 {digest.hexdigest()}. "
+                                 "The upload has been reset; send the file again from offset 0.",
+                        **_chunked_upload_data(chunked_upload),
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        alias = recipient_db_alias()
+        with transaction.atomic(using=alias):
+            chunked_upload = ChunkedUpload.objects.select_for_update().get(id=chunked_upload.id)
+            if chunked_upload.status == 'complete':
+                return Response(_chunked_upload_data(chunked_upload), status=status.HTTP_200_OK)
+            
+            file_name = default_storage.get_available_name(
+                f"retainer_excel_uploads/{get_valid_filename(chunked_upload.filename)}"
+            )
+            excel_upload = ExcelUpload.objects.create(
+                law_firm=chunked_upload.law_firm,
+                uploaded_by=chunked_upload.uploaded_by,
+                file=file_name,
+                document_template=chunked_upload.document_template,
+                email_template=chunked_upload.email_template,
+                previous_upload=chunked_upload.previous_upload,
+                column_mapping=chunked_upload.column_mapping,
+            )
+            chunked_upload.status = 'complete'
+            chunked_upload.excel_upload = excel_upload
+            chunked_upload.save(update_fields=['status', 'excel_upload', 'updated_at'])
+            
+            # The parts file sits on the same volume as media, so this is a rename rather than a copy
+            file_path = default_storage.path(file_name)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(chunked_upload.part_path, file_path)
+            
+            transaction.on_commit(partial(process_excel_upload.delay, excel_upload.id), using=alias)
+        
+        logger.info(f"Completed chunked upload {chunked_upload.upload_id} as Excel upload {excel_upload.id}")
+        return Response(_chunked_upload_data(chunked_upload), status=status.HTTP_201_CREATED)
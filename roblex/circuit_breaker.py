@@ -0,0 +1,257 @@
+"""
+Shared circuit breaker and adaptive (AIMD) concurrency for outbound APIs.
+
+State lives in one Redis hash per API and is only changed by Lua scripts, so
+every worker sees the same breaker and the same concurrency limit.
+
+Breaker: calls are counted over a rolling window. Once at least min_requests
+have been made and the share of errors reaches error_rate, the circuit opens
+for open_seconds and callers reschedule instead of calling. After that a
+single probe is let through (half-open). Its success closes the circuit and
+its failure opens it again.
+
+Concurrency: the limit halves on an error, a 429 or a call slower than
+latency_target, at most once per latency_target. It grows by 1/limit per
+healthy call, so roughly by one per round of calls at the current limit.
+
+Each process also caches the last state it saw, so open_for() and
+current_limit() are free to call before every request.
+
+Configured in settings.CIRCUIT_BREAKERS:
+
+    CIRCUIT_BREAKERS = {
+        'nextkeysign': {
+            'window': 30, 'min_requests': 20, 'error_rate': 0.5, 'open_seconds': 30,
+            'latency_target': 5, 'min_concurrency': 1, 'max_concurrency': 200,
+        },
+    }
+"""
+import logging
+import time
+
+import redis
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] state hash; ARGV open_ms, max_limit.
+# Returns {milliseconds until calls may resume, concurrency limit}.
+CHECK_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local open_ms = tonumber(ARGV[1])
+
+local s = redis.call('HMGET', KEYS[1], 'state', 'open_until', 'probe_until', 'limit')
+local state = s[1] or 'closed'
+local open_until = tonumber(s[2]) or 0
+local probe_until = tonumber(s[3]) or 0
+local limit = tonumber(s[4]) or tonumber(ARGV[2])
+
+if state == 'open' then
+    if now < open_until then
+        return {open_until - now, math.floor(limit)}
+    end
+    -- This caller becomes the half-open probe; everyone else waits for its result
+    redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_until', now + open_ms)
+    return {0, math.floor(limit)}
+end
+
+if state == 'half_open' and now < probe_until then
+    return {probe_until - now, math.floor(limit)}
+end
+
+return {0, math.floor(limit)}
+"""
+
+# KEYS[1] state hash; ARGV outcome ('ok', 'error' or 'throttled'), latency_ms,
+# window_ms, min_requests, error_rate, open_ms, latency_target_ms, min_limit, max_limit.
+# Returns {milliseconds the circuit stays open, concurrency limit}.
+RECORD_SCRIPT = """
+local outcome = ARGV[1]
+local latency = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local min_requests = tonumber(ARGV[4])
+local error_rate = tonumber(ARGV[5])
+local open_ms = tonumber(ARGV[6])
+local latency_target = tonumber(ARGV[7])
+local min_limit = tonumber(ARGV[8])
+local max_limit = tonumber(ARGV[9])
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+local s = redis.call('HMGET', KEYS[1], 'state', 'open_until', 'window_start', 'ok', 'errors', 'limit', 'decreased_at')
+local state = s[1] or 'closed'
+local open_until = tonumber(s[2]) or 0
+local window_start = tonumber(s[3]) or now
+local ok = tonumber(s[4]) or 0
+local errors = tonumber(s[5]) or 0
+local limit = math.min(max_limit, tonumber(s[6]) or max_limit)
+local decreased_at = tonumber(s[7]) or 0
+
+if now - window_start > window then
+    window_start = now
+    ok = 0
+    errors = 0
+end
+if outcome == 'error' then
+    errors = errors + 1
+else
+    ok = ok + 1
+end
+
+-- AIMD: one multiplicative decrease per latency target, so a burst of
+-- failures from calls already in flight only halves the limit once
+if outcome ~= 'ok' or latency > latency_target then
+    if now - decreased_at > latency_target then
+        limit = math.max(min_limit, limit / 2)
+        decreased_at = now
+    end
+else
+    limit = math.min(max_limit, limit + 1 / limit)
+end
+
+if state == 'half_open' then
+    if outcome == 'error' then
+        state = 'open'
+        open_until = now + open_ms
+    else
+        state = 'closed'
+        window_start = now
+        ok = 0
+        errors = 0
+    end
+elseif state == 'closed' and ok + errors >= min_requests and errors / (ok + errors) >= error_rate then
+    state = 'open'
+    open_until = now + open_ms
+    limit = min_limit
+end
+
+redis.call('HSET', KEYS[1], 'state', state, 'open_until', open_until, 'window_start', window_start,
+    'ok', ok, 'errors', errors, 'limit', tostring(limit), 'decreased_at', decreased_at)
+redis.call('PEXPIRE', KEYS[1], 86400000)
+
+local wait = 0
+if state == 'open' then
+    wait = math.max(0, open_until - now)
+end
+return {wait, math.floor(limit)}
+"""
+
+# After a Redis error the breaker is bypassed for this long rather than
+# blocking outbound calls on an unrelated outage
+ERROR_BACKOFF_SECONDS = 30
+
+_client = None
+_scripts = {}
+_unavailable_until = 0
+
+# Last state seen by this process: {name: (open until, on time.monotonic(); limit)}
+_local_state = {}
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit for {name} is open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.RATE_LIMIT_REDIS_URL,
+            socket_timeout=2,
+            socket_connect_timeout=2,
+        )
+        _scripts['check'] = _client.register_script(CHECK_SCRIPT)
+        _scripts['record'] = _client.register_script(RECORD_SCRIPT)
+    return _client
+
+
+def state_key(name):
+    return f"circuit:{name}"
+
+
+def _remember(name, wait_ms, limit):
+    wait = int(wait_ms) / 1000
+    _local_state[name] = (time.monotonic() + wait if wait else 0, max(1, int(limit)))
+    return wait, max(1, int(limit))
+
+
+def _run(name, script, args):
+    global _unavailable_until
+    config = settings.CIRCUIT_BREAKERS[name]
+    if time.monotonic() < _unavailable_until:
+        return 0, config['max_concurrency']
+    try:
+        get_redis()
+        wait_ms, limit = _scripts[script](keys=[state_key(name)], args=args)
+    except redis.RedisError as e:
+        _unavailable_until = time.monotonic() + ERROR_BACKOFF_SECONDS
+        logger.warning(f"Circuit breaker unavailable, not guarding {name}: {str(e)}")
+        return 0, config['max_concurrency']
+    return _remember(name, wait_ms, limit)
+
+
+def check(name):
+    """
+    Ask whether calls to `name` may go ahead.
+    Returns (seconds to wait before trying again, 0 if allowed; concurrency limit).
+    """
+    config = settings.CIRCUIT_BREAKERS[name]
+    return _run(name, 'check', [int(config['open_seconds'] * 1000), config['max_concurrency']])
+
+
+def record(name, outcome, latency):
+    """
+    Record the outcome ('ok', 'error' or 'throttled') and latency in seconds
+    of one call. Returns the same as check().
+    """
+    config = settings.CIRCUIT_BREAKERS[name]
+    return _run(name, 'record', [
+        outcome,
+        int(latency * 1000),
+        int(config['window'] * 1000),
+        config['min_requests'],
+        config['error_rate'],
+        int(config['open_seconds'] * 1000),
+        int(config['latency_target'] * 1000),
+        config['min_concurrency'],
+        config['max_concurrency'],
+    ])
+
+
+def open_for(name):
+    """
+    Seconds the circuit stays open as this process last saw it, 0 if closed.
+    No Redis round trip.
+    """
+    open_until, _ = _local_state.get(name, (0, None))
+    return max(0, open_until - time.monotonic())
+
+
+def current_limit(name):
+    """Concurrency limit this process last saw. No Redis round trip."""
+    _, limit = _local_state.get(name, (0, None))
+    return limit or settings.CIRCUIT_BREAKERS[name]['max_concurrency']
+
+
+def outcome_for(error):
+    """
+    Classify a call's exception (None for success) for record(). Only errors
+    that say something about the service's health count against the breaker.
+    A 4xx other than 429 is the request's fault, so it counts as 'ok'.
+    """
+    if error is None:
+        return 'ok'
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status == 429:
+            return 'throttled'
+        return 'error' if status >= 500 else 'ok'
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return 'error'
+    return 'ok'
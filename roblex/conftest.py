@@ -0,0 +1,21 @@
+import fakeredis
+import pytest
+import redis
+
+from roblex import circuit_breaker, fair_queue, rate_limit
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """One in-memory Redis, with Lua, behind every module that connects with from_url"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis.Redis, 'from_url',
+        lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs),
+    )
+    for module in (rate_limit, circuit_breaker, fair_queue):
+        monkeypatch.setattr(module, '_client', None)
+    monkeypatch.setattr(rate_limit, '_unavailable_until', 0)
+    monkeypatch.setattr(circuit_breaker, '_unavailable_until', 0)
+    monkeypatch.setattr(circuit_breaker, '_local_state', {})
+    return fakeredis.FakeRedis(server=server)
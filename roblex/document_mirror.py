@@ -0,0 +1,199 @@
+"""
+Local mirror of signed documents and audit logs from NextKeySign.
+
+Files are stored under SIGNED_DOCUMENTS_DIR by the sha256 of their content
+(ab/cd/abcd...), so a document downloaded twice, or shared by several
+submissions, is stored once. A download is written to a .part file first.
+If the transfer breaks, the next attempt asks for the rest with a Range
+request instead of starting over. Only a complete, hashed file is moved into
+place. A .part file is only written under an flock on its .lock file, so
+two workers never download the same URL into it at once; the second one
+raises DownloadInProgress and tries again on a later run.
+
+serve() hands the file to nginx with X-Accel-Redirect, so Django only checks
+permissions and never streams the bytes itself.
+"""
+import contextlib
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+
+import requests
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+
+_local = threading.local()
+
+
+class DownloadInProgress(Exception):
+    pass
+
+
+def get_session():
+    """
+    A plain session per thread, deliberately without the NextKeySign API
+    token: document URLs may redirect to third-party storage.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None or _local.pid != os.getpid():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _local.session = session
+        _local.pid = os.getpid()
+    return session
+
+
+def relative_path(sha256):
+    return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+
+def content_path(sha256):
+    return os.path.join(settings.SIGNED_DOCUMENTS_DIR, relative_path(sha256))
+
+
+def _part_path(url):
+    # Keyed by the URL without its query, which changes when a signed URL is refreshed
+    key = hashlib.sha256(url.split('?', 1)[0].encode()).hexdigest()
+    return os.path.join(settings.SIGNED_DOCUMENTS_DIR, 'parts', f"{key}.part")
+
+
+@contextlib.contextmanager
+def _part_lock(part_path):
+    """
+    Hold the exclusive flock on a .part file's .lock file, across threads and
+    processes, or raise DownloadInProgress if someone else does. The lock
+    file is removed on release.
+    """
+    lock_path = f"{part_path}.lock"
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            os.close(fd)
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                raise DownloadInProgress(f"{part_path} is being downloaded by another worker")
+            raise
+        try:
+            # The previous holder may have removed the file between our open and flock
+            if os.path.samestat(os.fstat(fd), os.stat(lock_path)):
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+    try:
+        yield
+    finally:
+        os.remove(lock_path)
+        os.close(fd)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _transfer(url, part_path):
+    """Fetch what the .part file is missing. Returns once the file is complete."""
+    validator_path = f"{part_path}.validator"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {}
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+        if os.path.exists(validator_path):
+            with open(validator_path) as f:
+                # The server sends the whole file instead if it changed since
+                headers['If-Range'] = f.read()
+
+    timeout = (settings.NEXTKEYSIGN_CONNECT_TIMEOUT, settings.NEXTKEYSIGN_READ_TIMEOUT)
+    with get_session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416 and offset:
+            # Nothing left to send: the part is complete if the sizes agree
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if total.isdigit() and int(total) == offset:
+                return
+            os.remove(part_path)
+            raise requests.HTTPError(f"Partial download of {url} no longer matches", response=response)
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            mode = 'ab'
+        else:
+            mode = 'wb'
+            validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+            if validator:
+                with open(validator_path, 'w') as f:
+                    f.write(validator)
+            elif os.path.exists(validator_path):
+                os.remove(validator_path)
+
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+
+
+def download(url):
+    """
+    Mirror the file at `url` and return its sha256. Broken transfers are
+    resumed up to DOCUMENT_MIRROR_MAX_RETRIES times before the error is
+    raised; the .part file is kept for the next call either way. Raises
+    DownloadInProgress if another worker is downloading the same URL.
+    """
+    part_path = _part_path(url)
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+
+    with _part_lock(part_path):
+        attempt = 0
+        while True:
+            try:
+                _transfer(url, part_path)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt >= settings.DOCUMENT_MIRROR_MAX_RETRIES:
+                    raise
+                attempt += 1
+                logger.warning(f"Download of {url} interrupted, resuming: {str(e)}")
+
+        sha256 = _file_sha256(part_path)
+        path = content_path(sha256)
+        if os.path.exists(path):
+            os.remove(part_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(part_path, path)
+        try:
+            os.remove(f"{part_path}.validator")
+        except FileNotFoundError:
+            pass
+    return sha256
+
+
+def serve(sha256, filename):
+    """Response serving a mirrored file, through nginx unless X-Accel-Redirect is off"""
+    path = content_path(sha256)
+    if not sha256 or not os.path.exists(path):
+        raise Http404("Document has not been mirrored")
+
+    with open(path, 'rb') as f:
+        content_type = 'application/pdf' if f.read(5) == b'%PDF-' else 'application/octet-stream'
+
+    if settings.SIGNED_DOCUMENTS_X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.SIGNED_DOCUMENTS_INTERNAL_URL + relative_path(sha256)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    return response
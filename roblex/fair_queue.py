@@ -0,0 +1,207 @@
+"""
+Fair-share scheduling of Celery work across tenants.
+
+A Celery queue is FIFO, so one tenant's 50k-row backlog delays everyone queued
+after it. Instead, work is pushed into a virtual queue per tenant (a Redis list)
+and dispatch() moves it to the real Celery queue by weighted round-robin:
+each turn a tenant gets up to `weight` items, then the next tenant is served.
+
+dispatch() only keeps a small backlog of work in flight. Each item it
+publishes holds a slot, a member of a Redis sorted set scored by its lease
+expiry, until the task calls release() with its task id. A slot whose task
+was lost frees itself when the lease runs out. The broker's queue length
+can't stand in for this: tasks deferred with a countdown sit on the worker,
+not in the queue, and the broker may be another Redis altogether. New work
+from a small tenant is therefore at most one round plus that backlog away
+from a worker, however much a big tenant has waiting. Interactive work such
+as lead emails doesn't go through a fair queue at all: it is routed to
+roblex_interactive, which has a worker of its own.
+
+Work that can't run yet, e.g. while a downstream circuit is open, goes back
+to the front of its tenant's queue with push(front=True), and pause() stops
+dispatching for a while.
+
+Each tenant's weight comes from the weights passed to dispatch(); unlisted
+tenants weigh 1.
+"""
+import json
+import logging
+import uuid
+
+import redis
+from celery import current_app
+from django.conf import settings
+
+from .task_publishing import publish_bulk
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] tenant list, KEYS[2] tenant ring, KEYS[3] ring members; ARGV tenant, RPUSH or LPUSH, items...
+PUSH_SCRIPT = """
+redis.call(ARGV[2], KEYS[1], unpack(ARGV, 3))
+if redis.call('SADD', KEYS[3], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+end
+return redis.call('LLEN', KEYS[1])
+"""
+
+# KEYS[1] tenant ring, KEYS[2] ring members, KEYS[3] in-flight set, KEYS[4] pause flag;
+# ARGV max in flight, tenant list key prefix, weights JSON, lease ms.
+# Serves tenants in ring order, up to their weight each, until the in-flight
+# set is full or every tenant is empty. Each item taken holds a slot until its
+# lease expires. Empty tenants leave the ring.
+POP_SCRIPT = """
+if redis.call('EXISTS', KEYS[4]) == 1 then
+    return {}
+end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+
+local budget = tonumber(ARGV[1]) - redis.call('ZCARD', KEYS[3])
+local prefix = ARGV[2]
+local weights = cjson.decode(ARGV[3])
+local expires = now + tonumber(ARGV[4])
+local out = {}
+
+while budget > 0 do
+    local tenant = redis.call('LMOVE', KEYS[1], KEYS[1], 'LEFT', 'RIGHT')
+    if not tenant then
+        break
+    end
+    local key = prefix .. tenant
+    local weight = math.max(1, math.floor(tonumber(weights[tenant]) or 1))
+    local items = redis.call('LPOP', key, math.min(weight, budget))
+    if items then
+        for _, item in ipairs(items) do
+            out[#out + 1] = item
+            -- Items queued before slots existed have no id and hold none
+            local id = cjson.decode(item)['id']
+            if id then
+                redis.call('ZADD', KEYS[3], expires, id)
+            end
+        end
+        budget = budget - #items
+    end
+    if redis.call('LLEN', key) == 0 then
+        redis.call('LREM', KEYS[1], 1, tenant)
+        redis.call('SREM', KEYS[2], tenant)
+    end
+end
+return out
+"""
+
+# Arguments per RPUSH, well under Lua's unpack() limit
+PUSH_CHUNK_SIZE = 1000
+
+_client = None
+_scripts = {}
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.FAIR_QUEUE_REDIS_URL,
+            socket_timeout=2,
+            socket_connect_timeout=2,
+        )
+        _scripts['push'] = _client.register_script(PUSH_SCRIPT)
+        _scripts['pop'] = _client.register_script(POP_SCRIPT)
+    return _client
+
+
+def _keys(name):
+    prefix = f"fairq:{name}"
+    return f"{prefix}:tenants", f"{prefix}:members", f"{prefix}:tenant:"
+
+
+def _in_flight_key(name):
+    return f"fairq:{name}:in_flight"
+
+
+def _paused_key(name):
+    return f"fairq:{name}:paused"
+
+
+def push(name, tenant, task, args_list, front=False):
+    """
+    Add task calls for a tenant to virtual queue `name`, at the back or, for
+    work that was already dispatched once, the front. If Redis is unavailable
+    the calls are published straight to Celery instead, so no work is lost,
+    only fairness.
+    """
+    ring, members, prefix = _keys(name)
+    items = [json.dumps({'id': uuid.uuid4().hex, 'task': task.name, 'args': list(args)}) for args in args_list]
+    if front:
+        # LPUSH reverses its arguments, which keeps them in order at the front
+        items.reverse()
+    try:
+        get_redis()
+        for start in range(0, len(items), PUSH_CHUNK_SIZE):
+            _scripts['push'](
+                keys=[f"{prefix}{tenant}", ring, members],
+                args=[tenant, 'LPUSH' if front else 'RPUSH', *items[start:start + PUSH_CHUNK_SIZE]],
+            )
+    except redis.RedisError as e:
+        logger.warning(f"Fair queue {name} unavailable, publishing {len(items)} tasks directly: {str(e)}")
+        publish_bulk(task, args_list)
+
+
+def dispatch(name, queue, max_in_flight, weights=None, lease=3600):
+    """
+    Move work from virtual queue `name` to Celery queue `queue` by weighted
+    round-robin, until max_in_flight items hold a slot. Each task is
+    published with its item's id as task id and keeps its slot until it
+    calls release() or `lease` seconds pass. Returns the number of tasks
+    published.
+    """
+    ring, members, prefix = _keys(name)
+    try:
+        get_redis()
+        items = _scripts['pop'](
+            keys=[ring, members, _in_flight_key(name), _paused_key(name)],
+            args=[max_in_flight, prefix, json.dumps(weights or {}), int(lease * 1000)],
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Fair queue {name} unavailable, nothing dispatched: {str(e)}")
+        return 0
+
+    calls = {}
+    for item in items:
+        call = json.loads(item)
+        calls.setdefault(call['task'], []).append(call)
+    for task_name, task_calls in calls.items():
+        task = current_app.tasks[task_name]
+        with task.app.producer_or_acquire() as producer:
+            for call in task_calls:
+                task.apply_async(args=call['args'], task_id=call.get('id'), queue=queue, producer=producer)
+    return len(items)
+
+
+def release(name, task_id):
+    """Free the slot a task dispatched from virtual queue `name` holds, once it has finished"""
+    try:
+        get_redis().zrem(_in_flight_key(name), task_id)
+    except redis.RedisError as e:
+        logger.warning(f"Fair queue {name} unavailable, slot of {task_id} freed when its lease ends: {str(e)}")
+
+
+def pause(name, seconds):
+    """Dispatch nothing from virtual queue `name` for `seconds`"""
+    try:
+        get_redis().set(_paused_key(name), 1, px=max(1, int(seconds * 1000)))
+    except redis.RedisError as e:
+        logger.warning(f"Fair queue {name} unavailable, not paused: {str(e)}")
+
+
+def pending(name):
+    """Items waiting per tenant in virtual queue `name`, or None if Redis is unavailable"""
+    ring, members, prefix = _keys(name)
+    try:
+        client = get_redis()
+        tenants = [tenant.decode() for tenant in client.lrange(ring, 0, -1)]
+        return {tenant: client.llen(f"{prefix}{tenant}") for tenant in tenants}
+    except redis.RedisError as e:
+        logger.warning(f"Fair queue {name} unavailable: {str(e)}")
+        return None
@@ -0,0 +1,161 @@
+"""
+NextKeySign API client shared by roblex_app and retainer_app.
+
+Each process keeps one pooled requests.Session, so submissions reuse
+keep-alive connections instead of paying a TLS handshake per call. Every
+request gets explicit connect/read timeouts and is retried with full-jitter
+exponential backoff on connection errors, 429 and gateway errors.
+
+A 502 or 504 comes from a proxy in front of the app, which may have passed
+the request on before it failed, and so may a dropped connection or a 500.
+POSTs are therefore only retried when NextKeySign turned them away (429,
+503) or the connection could not be opened at all, because NextKeySign may
+already have created the submission.
+
+The caller accounts for the first attempt of a request with the NextKeySign
+rate limit; every retry books a token of its own and waits until it is due.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+import urllib3
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from roblex import rate_limit
+
+logger = logging.getLogger(__name__)
+
+# Safe to retry for any method: the request was turned away without being processed
+RETRY_STATUSES = {429, 503}
+# Only retried for idempotent methods, since the request may have been processed
+IDEMPOTENT_RETRY_STATUSES = RETRY_STATUSES | {500, 502, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Per-process pooled session. Recreated after a fork so Celery's prefork
+    children never share sockets with their parent.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.NEXTKEYSIGN_POOL_SIZE,
+                    max_retries=0,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({
+                    'X-Auth-Token': settings.NEXTKEYSIGN_API_TOKEN,
+                    'Content-Type': 'application/json',
+                })
+                _session = session
+                _session_pid = os.getpid()
+    return _session
+
+
+def api_url(path):
+    return f"{settings.NEXTKEYSIGN_BASE_URL}/api/{path.lstrip('/')}"
+
+
+def _backoff(attempt, response=None):
+    """Full-jitter delay before the next attempt, honouring a short Retry-After"""
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def never_sent(error):
+    """Whether a connection error happened before any of the request was sent"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def request(method, path, **kwargs):
+    """
+    Send a request to the NextKeySign API and return the response.
+
+    Retryable failures are retried up to NEXTKEYSIGN_MAX_RETRIES times; the
+    last response is returned as-is, so callers still check the status.
+    Connection errors are raised once retries run out.
+    """
+    method = method.upper()
+    kwargs.setdefault('timeout', (settings.NEXTKEYSIGN_CONNECT_TIMEOUT, settings.NEXTKEYSIGN_READ_TIMEOUT))
+    retry_statuses = IDEMPOTENT_RETRY_STATUSES if method in IDEMPOTENT_METHODS else RETRY_STATUSES
+    url = api_url(path)
+
+    attempt = 0
+    while True:
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # A POST that may have reached the server is ambiguous, so it is never retried
+            retryable = method in IDEMPOTENT_METHODS or never_sent(e)
+            if not retryable or attempt >= settings.NEXTKEYSIGN_MAX_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            logger.warning(f"NextKeySign {method} {path} failed ({str(e)}), retrying in {delay:.1f}s")
+        else:
+            if response.status_code not in retry_statuses or attempt >= settings.NEXTKEYSIGN_MAX_RETRIES:
+                return response
+            delay = _backoff(attempt, response)
+            logger.warning(f"NextKeySign {method} {path} returned {response.status_code}, retrying in {delay:.1f}s")
+
+        # A retry is another call against the shared rate limit
+        time.sleep(max(delay, rate_limit.reserve('nextkeysign')))
+        attempt += 1
+
+
+def post(path, **kwargs):
+    return request('POST', path, **kwargs)
+
+
+def get(path, **kwargs):
+    return request('GET', path, **kwargs)
+
+
+def create_submission(payload):
+    """Create a submission and return NextKeySign's decoded response"""
+    response = post('submissions', json=payload)
+    response.raise_for_status()
+    return response.json()
+
+
+def list_submissions(before=None, after=None, limit=100):
+    """
+    One page of submissions, newest first, with ids strictly between `after`
+    and `before` when given. Returns (submissions, the `before` for the next
+    page, or None on the last page).
+    """
+    params = {'limit': limit}
+    if before is not None:
+        params['before'] = before
+    if after is not None:
+        params['after'] = after
+    response = get('submissions', params=params)
+    response.raise_for_status()
+    response_data = response.json()
+    submissions = response_data.get('data', []) if isinstance(response_data, dict) else response_data
+    if len(submissions) < limit:
+        return submissions, None
+    return submissions, min(int(submission['id']) for submission in submissions)
@@ -0,0 +1,223 @@
+"""
+Cluster-wide token-bucket rate limiting for outbound API calls.
+
+Every worker and web process takes tokens from the same Redis bucket per
+external API, so the configured rate holds across all of them together.
+Buckets are refilled lazily inside a Lua script, which makes each take
+atomic without a separate refill process.
+
+Celery tasks should not sleep waiting for tokens. reserve() books the tokens
+a task needs, running the bucket into debt if they aren't there yet, and
+returns when the last of them will be: the task reschedules itself once for
+that moment. Later reservations queue behind it, so deferred tasks run
+in turn rather than all polling the bucket.
+
+Web requests can't be rescheduled and must not block a worker either:
+require() takes a token or raises RateLimited straight away, and the view
+answers 429 with Retry-After. An API can set aside part of its rate for such
+interactive callers, so a bulk import can't starve them:
+
+    OUTBOUND_RATE_LIMITS = {
+        'nextkeysign': {
+            'rate': 10, 'burst': 20,  # tokens per second, bucket size
+            'interactive_rate': 2, 'interactive_burst': 5,  # part of rate kept for interactive callers
+        },
+    }
+"""
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] bucket hash; ARGV rate (tokens/s), capacity, requested tokens, reserve (0/1).
+# A take gets as many tokens as are available, up to the number requested. A
+# reservation gets all of them, running the bucket into debt that later takes
+# and reservations wait behind. Returns {granted, milliseconds until the
+# next token after a take, or until the reserved tokens are covered}.
+# Redis' own clock is used so every client sees the same refill.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local reserve = ARGV[4] == '1'
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+
+local granted
+local wait = 0
+if reserve then
+    granted = requested
+    tokens = tokens - requested
+    if tokens < 0 then
+        wait = math.ceil(-tokens * 1000 / rate)
+    end
+else
+    granted = math.max(0, math.min(requested, math.floor(tokens)))
+    tokens = tokens - granted
+    if tokens < 1 then
+        wait = math.ceil((1 - tokens) * 1000 / rate)
+    end
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+-- Kept until the bucket would be full again, so outstanding debt is never forgotten
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) * 1000 / rate) + 1000)
+return {granted, wait}
+"""
+
+# After a Redis error, calls are let through unthrottled for this long rather
+# than failing every outbound request
+ERROR_BACKOFF_SECONDS = 30
+
+_client = None
+_script = None
+_unavailable_until = 0
+
+
+class RateLimited(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"Rate limit for {name} exceeded, retry in {retry_after:.2f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def get_redis():
+    global _client, _script
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.RATE_LIMIT_REDIS_URL,
+            socket_timeout=2,
+            socket_connect_timeout=2,
+        )
+        _script = _client.register_script(TOKEN_BUCKET_SCRIPT)
+    return _client
+
+
+def bucket_key(name, interactive=False):
+    return f"ratelimit:{name}:interactive" if interactive else f"ratelimit:{name}"
+
+
+def _buckets(name, interactive):
+    """(key, rate, burst) of the buckets a caller draws from, in order"""
+    limit = settings.OUTBOUND_RATE_LIMITS[name]
+    interactive_rate = limit.get('interactive_rate', 0)
+    shared = (bucket_key(name), limit['rate'] - interactive_rate, limit['burst'])
+    if interactive and interactive_rate:
+        # Interactive callers use their own budget first, then whatever the shared bucket has
+        return [(bucket_key(name, interactive=True), interactive_rate, limit.get('interactive_burst', 1)), shared]
+    return [shared]
+
+
+def _run(key, rate, burst, tokens, reserve):
+    """Run the bucket script. Returns (granted, seconds), or None if Redis is unavailable."""
+    global _unavailable_until
+    if time.monotonic() < _unavailable_until:
+        return None
+    try:
+        get_redis()
+        granted, wait_ms = _script(keys=[key], args=[rate, burst, tokens, 1 if reserve else 0])
+    except redis.RedisError as e:
+        _unavailable_until = time.monotonic() + ERROR_BACKOFF_SECONDS
+        logger.warning(f"Rate limiter unavailable, not throttling {key}: {str(e)}")
+        return None
+    return int(granted), int(wait_ms) / 1000
+
+
+def take(name, tokens=1, interactive=False):
+    """
+    Take up to `tokens` tokens from the named bucket, without waiting.
+    Returns (granted, seconds until the next token is available).
+    """
+    granted = 0
+    waits = []
+    for key, rate, burst in _buckets(name, interactive):
+        result = _run(key, rate, burst, tokens - granted, reserve=False)
+        if result is None:
+            return tokens, 0.0
+        granted += result[0]
+        waits.append(result[1])
+        if granted >= tokens:
+            return granted, 0.0
+    return granted, min(waits)
+
+
+def reserve(name, tokens=1):
+    """
+    Book `tokens` tokens from the named bucket, available or not. Returns the
+    number of seconds until all of them are, 0 if they are now; the caller
+    runs then without taking them again.
+    """
+    key, rate, burst = _buckets(name, interactive=False)[0]
+    result = _run(key, rate, burst, tokens, reserve=True)
+    return 0.0 if result is None else result[1]
+
+
+def reserved_rate(name):
+    """
+    Tokens per second that reservations come due at. Tokens reserved together
+    are due one after another at this rate, the last of them when reserve() says.
+    """
+    return _buckets(name, interactive=False)[0][1]
+
+
+def acquire(name, interactive=False):
+    """
+    Take one token. Returns 0 if it was granted, otherwise the number of
+    seconds to wait before trying again.
+    """
+    granted, wait = take(name, interactive=interactive)
+    return 0 if granted else wait
+
+
+def require(name):
+    """
+    Take one token for an interactive caller, such as a web request, or raise
+    RateLimited with the time until one is available. Never waits.
+    """
+    delay = acquire(name, interactive=True)
+    if delay:
+        raise RateLimited(name, delay)
+
+
+def wait(name, max_wait=5):
+    """
+    Block until a token is available, for scripts run by hand. Raises
+    RateLimited if that would take longer than max_wait seconds.
+    """
+    deadline = time.monotonic() + max_wait
+    while True:
+        delay = acquire(name, interactive=True)
+        if not delay:
+            return
+        if time.monotonic() + delay > deadline:
+            raise RateLimited(name, delay)
+        time.sleep(delay)
+
+
+def reschedule(task, countdown, args=None, kwargs=None):
+    """
+    Re-queue a bound Celery task after `countdown` seconds without using up
+    one of its retries, e.g. to run when its reserved tokens are available.
+    Like a retry, the new message keeps the task id.
+    """
+    task.apply_async(
+        args=task.request.args if args is None else args,
+        kwargs=task.request.kwargs if kwargs is None else kwargs,
+        countdown=countdown,
+        retries=task.request.retries,
+        task_id=task.request.id,
+    )
@@ -212,6 +212,12 @@ EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 # NextKeySign Configuration
 NEXTKEYSIGN_BASE_URL = config("NEXTKEYSIGN_BASE_URL")
 NEXTKEYSIGN_API_TOKEN = config("NEXTKEYSIGN_API_TOKEN")
+# Pooled client (roblex/nextkeysign.py): connections kept per process, timeouts in seconds.
+# Raised to the asyncio dispatcher's concurrency when it is used (see below)
+NEXTKEYSIGN_POOL_SIZE = config("NEXTKEYSIGN_POOL_SIZE", default=16, cast=int)
+NEXTKEYSIGN_CONNECT_TIMEOUT = config("NEXTKEYSIGN_CONNECT_TIMEOUT", default=5, cast=float)
+NEXTKEYSIGN_READ_TIMEOUT = config("NEXTKEYSIGN_READ_TIMEOUT", default=30, cast=float)
+NEXTKEYSIGN_MAX_RETRIES = config("NEXTKEYSIGN_MAX_RETRIES", default=3, cast=int)
 
 # Celery Configuration
 CELERY_BROKER_URL = config("CELERY_BROKER_URL", default="redis://redis:6379/0")
@@ -219,19 +225,90 @@ CELERY_RESULT_BACKEND = config("CELERY_RESULT_BACKEND", default="redis://redis:6
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Store each result's task name, so a polled task id can be checked against the task expected
+CELERY_RESULT_EXTENDED = True
 CELERY_TIMEZONE = TIME_ZONE
 
+# Outbound API rate limits shared by all processes (roblex/rate_limit.py):
+# rate is tokens per second, burst the bucket size. interactive_rate is the part
+# of rate kept for web requests and signing flows, so bulk imports can't use it up.
+RATE_LIMIT_REDIS_URL = config("RATE_LIMIT_REDIS_URL", default=CELERY_BROKER_URL)
+OUTBOUND_RATE_LIMITS = {
+    'nextkeysign': {
+        'rate': config("NEXTKEYSIGN_RATE_LIMIT", default=10, cast=float),
+        'burst': config("NEXTKEYSIGN_RATE_BURST", default=20, cast=int),
+        'interactive_rate': config("NEXTKEYSIGN_INTERACTIVE_RATE_LIMIT", default=2, cast=float),
+        'interactive_burst': config("NEXTKEYSIGN_INTERACTIVE_RATE_BURST", default=5, cast=int),
+    },
+    'roblox': {
+        'rate': config("ROBLOX_RATE_LIMIT", default=1.5, cast=float),
+        'burst': config("ROBLOX_RATE_BURST", default=5, cast=int),
+    },
+}
+
+# Shared circuit breakers and adaptive concurrency (roblex/circuit_breaker.py).
+# Times are in seconds; the circuit opens when error_rate of at least
+# min_requests calls in the window fail.
+CIRCUIT_BREAKERS = {
+    'nextkeysign': {
+        'window': config("NEXTKEYSIGN_BREAKER_WINDOW", default=30, cast=int),
+        'min_requests': config("NEXTKEYSIGN_BREAKER_MIN_REQUESTS", default=20, cast=int),
+        'error_rate': config("NEXTKEYSIGN_BREAKER_ERROR_RATE", default=0.5, cast=float),
+        'open_seconds': config("NEXTKEYSIGN_BREAKER_OPEN_SECONDS", default=30, cast=int),
+        'latency_target': config("NEXTKEYSIGN_LATENCY_TARGET", default=5, cast=float),
+        'min_concurrency': 1,
+        'max_concurrency': config("NEXTKEYSIGN_MAX_CONCURRENCY", default=200, cast=int),
+    },
+}
+
 # Celery Task Routes - separate queues for retainer app
 CELERY_TASK_ROUTES = {
     'retainer_app.tasks.*': {'queue': 'retainer_processing'},
     'retainer_app.tasks.create_nextkeysign_submission': {'queue': 'retainer_submissions'},
+    'retainer_app.tasks.create_nextkeysign_submissions_batch': {'queue': 'retainer_submissions'},
+    'retainer_app.tasks.dispatch_nextkeysign_submissions': {'queue': 'retainer_submissions'},
+    'retainer_app.tasks.drain_submission_outbox': {'queue': 'retainer_submissions'},
+    'retainer_app.tasks.dispatch_fair_share_submissions': {'queue': 'retainer_dispatch'},
     'retainer_app.tasks.retry_failed_submission': {'queue': 'retainer_submissions'},
-    # Route roblex_app email tasks to submissions queue
-    'roblex_app.tasks.send_landing_page_lead_email': {'queue': 'retainer_submissions'},
-    'roblex_app.tasks.send_law_firm_notification_email': {'queue': 'retainer_submissions'},
+    # Work someone is waiting on (a new lead's emails, the documents an intake
+    # form page polls for) gets a queue and worker of their own, so it never
+    # waits behind submission blocks. Bulk resends are published to
+    # retainer_submissions by their callers.
+    'roblex_app.tasks.send_landing_page_lead_email': {'queue': 'roblex_interactive'},
+    'roblex_app.tasks.send_law_firm_notification_email': {'queue': 'roblex_interactive'},
+    'roblex_app.tasks.create_document_submissions': {'queue': 'roblex_interactive'},
     'roblex_app.tasks.auto_follow_up_new_leads': {'queue': 'retainer_submissions'},
 }
 
+# Periodic tasks, run by the celery_beat service
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-fair-share-submissions': {
+        'task': 'retainer_app.tasks.dispatch_fair_share_submissions',
+        'schedule': 2.0,
+        'options': {'expires': 10},
+    },
+    'reconcile-submission-statuses': {
+        'task': 'retainer_app.tasks.reconcile_submission_statuses',
+        'schedule': 900.0,
+        'options': {'expires': 600},
+    },
+    'mirror-signed-documents': {
+        'task': 'retainer_app.tasks.mirror_signed_documents',
+        'schedule': 300.0,
+        'options': {'expires': 240},
+    },
+    'drain-submission-outbox': {
+        'task': 'retainer_app.tasks.drain_submission_outbox',
+        'schedule': 300.0,
+        'options': {'expires': 240},
+    },
+    'expire-chunked-uploads': {
+        'task': 'retainer_app.tasks.expire_chunked_uploads',
+        'schedule': 3600.0,
+        'options': {'expires': 3000},
+    },
+}
+
 # File Upload Settings for Large Excel Files (200MB)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 262144000  # 250MB in bytes
 FILE_UPLOAD_MAX_MEMORY_SIZE = 262144000  # 250MB in bytes
@@ -243,6 +320,70 @@ FILE_UPLOAD_HANDLERS = [
     'django.core.files.uploadhandler.MemoryFileUploadHandler',
 ]
 
+# Rows per shard when an Excel upload is split across retainer_processing workers
+RETAINER_EXCEL_SHARD_SIZE = config("RETAINER_EXCEL_SHARD_SIZE", default=10000, cast=int)
+# Each shard's rows are spooled here by the single pass that splits the upload
+RETAINER_EXCEL_SPOOL_DIR = os.path.join(MEDIA_ROOT, 'retainer_upload_shards')
+
+# Redis holding live upload progress counters
+RETAINER_PROGRESS_REDIS_URL = config("RETAINER_PROGRESS_REDIS_URL", default=CELERY_BROKER_URL)
+
+# NextKeySign submissions: recipients per batch task, and concurrent API calls per task
+RETAINER_SUBMISSION_BATCH_SIZE = config("RETAINER_SUBMISSION_BATCH_SIZE", default=100, cast=int)
+RETAINER_SUBMISSION_CONCURRENCY = config("RETAINER_SUBMISSION_CONCURRENCY", default=8, cast=int)
+# "threads" queues the batch task above; "asyncio" queues larger blocks to the
+# asyncio dispatcher (retainer_app/dispatch.py), which keeps many more calls in
+# flight per worker, each on a pooled NextKeySign connection.
+RETAINER_SUBMISSION_DISPATCHER = config("RETAINER_SUBMISSION_DISPATCHER", default="threads")
+RETAINER_ASYNC_SUBMISSION_BATCH_SIZE = config("RETAINER_ASYNC_SUBMISSION_BATCH_SIZE", default=5000, cast=int)
+RETAINER_ASYNC_SUBMISSION_CONCURRENCY = config("RETAINER_ASYNC_SUBMISSION_CONCURRENCY", default=200, cast=int)
+if RETAINER_SUBMISSION_DISPATCHER == "asyncio":
+    # Every call in flight needs a connection, or it blocks waiting for the pool
+    NEXTKEYSIGN_POOL_SIZE = max(NEXTKEYSIGN_POOL_SIZE, RETAINER_ASYNC_SUBMISSION_CONCURRENCY)
+RETAINER_SUBMISSION_WRITE_BATCH = config("RETAINER_SUBMISSION_WRITE_BATCH", default=200, cast=int)
+# Submission outbox: a claimed entry is considered abandoned after the lease,
+# which must outlast a call with all its retries; the drain task re-queues at most DRAIN_LIMIT
+RETAINER_OUTBOX_LEASE_SECONDS = config("RETAINER_OUTBOX_LEASE_SECONDS", default=300, cast=int)
+RETAINER_OUTBOX_DRAIN_LIMIT = config("RETAINER_OUTBOX_DRAIN_LIMIT", default=5000, cast=int)
+# Status reconciliation with NextKeySign (retainer_app/reconciliation.py): listing
+# page size, and pages per run before the sweep continues on the next run
+RETAINER_RECONCILE_PAGE_SIZE = config("RETAINER_RECONCILE_PAGE_SIZE", default=100, cast=int)
+RETAINER_RECONCILE_MAX_PAGES = config("RETAINER_RECONCILE_MAX_PAGES", default=50, cast=int)
+# Fair share (roblex/fair_queue.py): submission blocks wait in a virtual queue per
+# law firm and are moved onto retainer_submissions by weighted round-robin, keeping
+# at most BACKLOG blocks queued or running. A block's slot is freed when its task
+# finishes, or after LEASE_SECONDS if the worker was lost. WEIGHTS is
+# "law_firm_id:weight,..."; others weigh 1.
+FAIR_QUEUE_REDIS_URL = config("FAIR_QUEUE_REDIS_URL", default=CELERY_BROKER_URL)
+RETAINER_FAIR_SHARE_BACKLOG = config("RETAINER_FAIR_SHARE_BACKLOG", default=8, cast=int)
+RETAINER_FAIR_SHARE_LEASE_SECONDS = config("RETAINER_FAIR_SHARE_LEASE_SECONDS", default=1800, cast=int)
+RETAINER_FAIR_SHARE_WEIGHTS = {
+    law_firm_id.strip(): int(weight)
+    for law_firm_id, weight in (
+        pair.split(':') for pair in config("RETAINER_FAIR_SHARE_WEIGHTS", default="", cast=Csv())
+    )
+}
+
+# Chunked uploads: parts are appended under MEDIA_ROOT (not served by nginx) so the
+# finished file can be moved into place without copying
+RETAINER_CHUNKED_UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'retainer_chunked_uploads')
+RETAINER_UPLOAD_CHUNK_SIZE = config("RETAINER_UPLOAD_CHUNK_SIZE", default=8 * 1024 * 1024, cast=int)
+RETAINER_CHUNKED_UPLOAD_MAX_SIZE = config("RETAINER_CHUNKED_UPLOAD_MAX_SIZE", default=1024 * 1024 * 1024, cast=int)
+# Parts untouched this long are deleted by expire_chunked_uploads, hourly
+RETAINER_CHUNKED_UPLOAD_EXPIRY_HOURS = config("RETAINER_CHUNKED_UPLOAD_EXPIRY_HOURS", default=24, cast=int)
+
+# Local mirror of signed documents and audit logs (roblex/document_mirror.py). Files
+# live under MEDIA_ROOT but are never served directly: nginx serves them from the
+# internal location when Django answers with X-Accel-Redirect.
+SIGNED_DOCUMENTS_DIR = os.path.join(MEDIA_ROOT, 'signed_documents')
+SIGNED_DOCUMENTS_INTERNAL_URL = '/protected-media/signed_documents/'
+SIGNED_DOCUMENTS_X_ACCEL_REDIRECT = config("SIGNED_DOCUMENTS_X_ACCEL_REDIRECT", default=True, cast=bool)
+DOCUMENT_MIRROR_CONCURRENCY = config("DOCUMENT_MIRROR_CONCURRENCY", default=8, cast=int)
+DOCUMENT_MIRROR_BATCH_SIZE = config("DOCUMENT_MIRROR_BATCH_SIZE", default=500, cast=int)
+# Resumes per download within one attempt, and attempts per submission before giving up
+DOCUMENT_MIRROR_MAX_RETRIES = config("DOCUMENT_MIRROR_MAX_RETRIES", default=3, cast=int)
+DOCUMENT_MIRROR_MAX_ATTEMPTS = config("DOCUMENT_MIRROR_MAX_ATTEMPTS", default=5, cast=int)
+
 # Temporary file upload directory
 # FILE_UPLOAD_TEMP_DIR = '/tmp/'
 
@@ -0,0 +1,62 @@
+"""
+Bulk publishing of Celery task messages.
+
+Calling .delay() in a loop takes a producer from the pool, and with it a broker
+connection, for every message. publish_bulk() acquires one producer and sends
+every message through it, so a fan-out of thousands of tasks costs one
+connection checkout.
+
+Building and sending each message still costs Celery a fraction of a
+millisecond, so a large fan-out is split into chunks of PUBLISH_CHUNK_SIZE:
+the caller publishes one publish_chunk message per chunk, and workers
+publish the chunks' messages. Queuing 50,000 messages costs the caller 100
+sends instead of 50,000, under half a second.
+
+Where many items can share a message, send fewer, larger messages instead,
+e.g. recipient id blocks for the submission tasks.
+"""
+from celery import shared_task
+
+# Messages a publish_chunk task sends; smaller fan-outs are sent by the caller
+PUBLISH_CHUNK_SIZE = 500
+
+
+def _publish(task, args_list, options):
+    with task.app.producer_or_acquire() as producer:
+        for args in args_list:
+            task.apply_async(args=args, producer=producer, **options)
+
+
+@shared_task(bind=True, ignore_result=True)
+def publish_chunk(self, task_name, args_list, options):
+    """Publish one chunk of a publish_bulk() fan-out"""
+    _publish(self.app.tasks[task_name], args_list, options)
+
+
+def publish_bulk(task, args_list, **options):
+    """
+    Queue `task` once for every args tuple in args_list, over a single
+    producer connection, or in chunks published by workers if there are
+    more than PUBLISH_CHUNK_SIZE. Extra keyword arguments are passed to
+    apply_async. Returns the number of messages queued.
+
+    Results are not stored unless ignore_result=False is passed: callers get
+    a count, not AsyncResults, and each message would otherwise cost the
+    caller a subscription to its result.
+    """
+    args_list = [list(args) for args in args_list]
+    options.setdefault('ignore_result', True)
+    if len(args_list) <= PUBLISH_CHUNK_SIZE:
+        _publish(task, args_list, options)
+        return len(args_list)
+
+    # Chunks go to the queue the task's own messages would
+    queue = (
+        options.get('queue') or getattr(task, 'queue', None)
+        or task.app.amqp.router.route({}, task.name)['queue'].name
+    )
+    _publish(task.app.tasks[publish_chunk.name], [
+        (task.name, args_list[start:start + PUBLISH_CHUNK_SIZE], options)
+        for start in range(0, len(args_list), PUBLISH_CHUNK_SIZE)
+    ], {'queue': queue})
+    return len(args_list)
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+import requests
+
+from roblex import circuit_breaker
+
+
+@pytest.fixture
+def breaker(settings, fake_redis):
+    settings.CIRCUIT_BREAKERS = {
+        'api': {
+            'window': 30, 'min_requests': 4, 'error_rate': 0.5, 'open_seconds': 0.2,
+            'latency_target': 5, 'min_concurrency': 1, 'max_concurrency': 16,
+        },
+    }
+
+
+def open_circuit():
+    for outcome in ('ok', 'error', 'ok', 'error'):
+        circuit_breaker.record('api', outcome, 0.01)
+
+
+def test_circuit_opens_once_the_error_rate_is_reached(breaker):
+    circuit_breaker.record('api', 'error', 0.01)
+    circuit_breaker.record('api', 'error', 0.01)
+    # Too few calls to judge yet
+    assert circuit_breaker.check('api')[0] == 0
+
+    circuit_breaker.record('api', 'ok', 0.01)
+    wait, limit = circuit_breaker.record('api', 'ok', 0.01)
+    assert wait > 0
+    assert limit == 1
+    assert 0 < circuit_breaker.check('api')[0] <= 0.2
+    assert 0 < circuit_breaker.open_for('api') <= 0.2
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(breaker):
+    open_circuit()
+    time.sleep(0.25)
+
+    # The first caller is the probe; everyone else waits for its result
+    assert circuit_breaker.check('api')[0] == 0
+    assert circuit_breaker.check('api')[0] > 0
+
+    assert circuit_breaker.record('api', 'ok', 0.01)[0] == 0
+    assert circuit_breaker.check('api')[0] == 0
+    assert circuit_breaker.check('api')[0] == 0
+
+
+def test_failed_probe_opens_the_circuit_again(breaker):
+    open_circuit()
+    time.sleep(0.25)
+
+    assert circuit_breaker.check('api')[0] == 0
+    wait, _ = circuit_breaker.record('api', 'error', 0.01)
+    assert wait == pytest.approx(0.2, abs=0.05)
+    assert circuit_breaker.check('api')[0] > 0
+
+
+def test_concurrency_halves_on_throttling_and_grows_back(breaker):
+    _, limit = circuit_breaker.record('api', 'throttled', 0.01)
+    assert limit == 8
+    # Only one decrease per latency target, however many calls fail together
+    assert circuit_breaker.record('api', 'throttled', 0.01)[1] == 8
+
+    # +1/limit per healthy call: about one per round of calls at the limit
+    for _ in range(9):
+        _, limit = circuit_breaker.record('api', 'ok', 0.01)
+    assert limit == 9
+    assert circuit_breaker.current_limit('api') == 9
+
+
+def test_outcome_for_only_blames_the_service_for_its_own_errors():
+    def http_error(status):
+        response = requests.Response()
+        response.status_code = status
+        return requests.HTTPError(response=response)
+
+    assert circuit_breaker.outcome_for(None) == 'ok'
+    assert circuit_breaker.outcome_for(http_error(429)) == 'throttled'
+    assert circuit_breaker.outcome_for(http_error(503)) == 'error'
+    assert circuit_breaker.outcome_for(http_error(422)) == 'ok'
+    assert circuit_breaker.outcome_for(requests.ConnectTimeout()) == 'error'
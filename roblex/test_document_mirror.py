@@ -0,0 +1,32 @@
+import multiprocessing
+import os
+
+import pytest
+
+from roblex import document_mirror
+
+
+def hold_lock(part_path, locked, release):
+    with document_mirror._part_lock(part_path):
+        locked.set()
+        release.wait(5)
+
+
+def test_part_lock_excludes_other_processes(tmp_path):
+    part_path = str(tmp_path / 'document.part')
+    locked, release = multiprocessing.Event(), multiprocessing.Event()
+    holder = multiprocessing.Process(target=hold_lock, args=(part_path, locked, release))
+    holder.start()
+    try:
+        assert locked.wait(5)
+        with pytest.raises(document_mirror.DownloadInProgress):
+            with document_mirror._part_lock(part_path):
+                pass
+    finally:
+        release.set()
+        holder.join(5)
+
+    # Released and cleaned up, so the next download can take it
+    assert not os.path.exists(f"{part_path}.lock")
+    with document_mirror._part_lock(part_path):
+        assert os.path.exists(f"{part_path}.lock")
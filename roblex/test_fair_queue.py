@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from roblex import celery_app, fair_queue
+
+ran = []
+
+
+@celery_app.task(name='roblex.test_fair_queue.record')
+def record(tenant, item):
+    ran.append(f"{tenant}{item}")
+
+
+@pytest.fixture
+def queue(fake_redis, monkeypatch):
+    monkeypatch.setattr(celery_app.conf, 'task_always_eager', True)
+    ran.clear()
+
+
+def push(tenant, count, front=False):
+    fair_queue.push('jobs', tenant, record, [(tenant, item) for item in range(1, count + 1)], front=front)
+
+
+def in_flight_ids():
+    return [member.decode() for member in fair_queue.get_redis().zrange(fair_queue._in_flight_key('jobs'), 0, -1)]
+
+
+def test_tenants_are_served_by_weighted_round_robin(queue):
+    push('a', 5)
+    push('b', 3)
+    push('c', 1)
+
+    assert fair_queue.dispatch('jobs', 'celery', 100, weights={'a': 2}) == 9
+    assert ran == ['a1', 'a2', 'b1', 'c1', 'a3', 'a4', 'b2', 'a5', 'b3']
+    assert fair_queue.pending('jobs') == {}
+
+
+def test_dispatch_keeps_at_most_the_backlog_in_flight(queue):
+    push('a', 5)
+
+    assert fair_queue.dispatch('jobs', 'celery', 3) == 3
+    assert fair_queue.dispatch('jobs', 'celery', 3) == 0
+    assert len(in_flight_ids()) == 3
+
+    # Finishing tasks free their slots, by the task id they were published with
+    task_id = in_flight_ids()[0]
+    fair_queue.release('jobs', task_id)
+    assert fair_queue.dispatch('jobs', 'celery', 3) == 1
+    assert ran == ['a1', 'a2', 'a3', 'a4']
+
+
+def test_slots_of_lost_tasks_expire_with_their_lease(queue):
+    push('a', 4)
+
+    assert fair_queue.dispatch('jobs', 'celery', 2, lease=0.1) == 2
+    assert fair_queue.dispatch('jobs', 'celery', 2, lease=0.1) == 0
+    time.sleep(0.15)
+    assert fair_queue.dispatch('jobs', 'celery', 2, lease=0.1) == 2
+
+
+def test_paused_queue_dispatches_deferred_work_first_when_it_resumes(queue):
+    push('a', 2)
+    push('b', 1)
+    fair_queue.pause('jobs', 0.1)
+    push('a', 1, front=True)
+
+    assert fair_queue.dispatch('jobs', 'celery', 10) == 0
+    time.sleep(0.15)
+    assert fair_queue.dispatch('jobs', 'celery', 10) == 4
+    assert ran == ['a1', 'b1', 'a1', 'a2']
+
+
+def test_interactive_tasks_do_not_queue_behind_submission_blocks():
+    from retainer_app import tasks as retainer_tasks
+    from roblex_app import tasks as roblex_tasks
+
+    def queue_of(task):
+        return celery_app.amqp.router.route({}, task.name)['queue'].name
+
+    interactive = [
+        roblex_tasks.send_landing_page_lead_email, roblex_tasks.send_law_firm_notification_email,
+        roblex_tasks.create_document_submissions,
+    ]
+    assert {queue_of(task) for task in interactive} == {'roblex_interactive'}
+    blocks = [retainer_tasks.create_nextkeysign_submissions_batch, retainer_tasks.dispatch_nextkeysign_submissions]
+    assert {queue_of(task) for task in blocks} == {'retainer_submissions'}
+    assert not [
+        name for name, task in celery_app.tasks.items()
+        if name.startswith('retainer_app.') and queue_of(task) == 'roblex_interactive'
+    ]
@@ -0,0 +1,74 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from roblex import nextkeysign, rate_limit
+
+
+class StubGateway(BaseHTTPRequestHandler):
+    """Answers every request with the status queued for it, then 200"""
+    statuses = []
+    calls = []
+
+    def respond(self):
+        self.calls.append(self.command)
+        self.send_response(self.statuses.pop(0) if self.statuses else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_GET = do_POST = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_gateway(settings, monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubGateway)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.NEXTKEYSIGN_BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    settings.NEXTKEYSIGN_MAX_RETRIES = 2
+    monkeypatch.setattr(nextkeysign, 'BACKOFF_MAX', 0)
+    StubGateway.calls = []
+    yield StubGateway
+    server.shutdown()
+
+
+@pytest.mark.parametrize('status', [500, 502, 504])
+def test_post_is_not_retried_when_it_may_have_been_processed(stub_gateway, status):
+    stub_gateway.statuses = [status]
+    assert nextkeysign.post('submissions', json={}).status_code == status
+    assert stub_gateway.calls == ['POST']
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_post_is_retried_when_turned_away(stub_gateway, status):
+    stub_gateway.statuses = [status]
+    assert nextkeysign.post('submissions', json={}).status_code == 200
+    assert stub_gateway.calls == ['POST', 'POST']
+
+
+def test_get_is_retried_on_gateway_errors(stub_gateway):
+    stub_gateway.statuses = [502, 504]
+    assert nextkeysign.get('submissions').status_code == 200
+    assert stub_gateway.calls == ['GET', 'GET', 'GET']
+
+
+def test_post_is_retried_when_the_connection_is_refused(settings):
+    settings.NEXTKEYSIGN_BASE_URL = 'http://127.0.0.1:1'
+    settings.NEXTKEYSIGN_MAX_RETRIES = 1
+    with pytest.raises(nextkeysign.requests.ConnectionError) as excinfo:
+        nextkeysign.post('submissions', json={})
+    assert nextkeysign.never_sent(excinfo.value)
+
+
+def test_retries_take_rate_limit_tokens(stub_gateway, settings, fake_redis):
+    settings.OUTBOUND_RATE_LIMITS = {'nextkeysign': {'rate': 0.01, 'burst': 5}}
+    stub_gateway.statuses = [429, 503]
+
+    assert nextkeysign.post('submissions', json={}).status_code == 200
+
+    # The first attempt is the caller's; each of the two retries booked a token
+    assert rate_limit.take('nextkeysign', 5)[0] == 3
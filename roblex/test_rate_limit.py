@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from roblex import rate_limit
+
+
+@pytest.fixture
+def limits(settings, fake_redis):
+    settings.OUTBOUND_RATE_LIMITS = {
+        'api': {'rate': 20, 'burst': 5, 'interactive_rate': 10, 'interactive_burst': 2},
+        'plain': {'rate': 20, 'burst': 5},
+    }
+
+
+def test_take_grants_what_the_bucket_holds_and_refills(limits):
+    granted, wait = rate_limit.take('plain', 8)
+    assert granted == 5
+    assert 0 < wait <= 0.05
+
+    assert rate_limit.take('plain', 1)[0] == 0
+
+    # 20 tokens a second: about 4 are back after 0.2s
+    time.sleep(0.2)
+    granted, _ = rate_limit.take('plain', 10)
+    assert 3 <= granted <= 5
+
+
+def test_refill_is_capped_at_the_burst(limits):
+    rate_limit.take('plain', 5)
+    time.sleep(0.5)
+    assert rate_limit.take('plain', 20)[0] == 5
+
+
+def test_reservations_queue_behind_each_other(limits):
+    # The burst covers the first reservation; the next ones wait their turn
+    assert rate_limit.reserve('plain', 5) == 0
+    first = rate_limit.reserve('plain', 10)
+    second = rate_limit.reserve('plain', 10)
+    assert first == pytest.approx(0.5, abs=0.05)
+    assert second == pytest.approx(1.0, abs=0.05)
+
+    # Takes don't jump the queue while the bucket is in debt
+    granted, wait = rate_limit.take('plain', 1)
+    assert granted == 0
+    assert wait == pytest.approx(1.05, abs=0.05)
+
+
+def test_interactive_callers_keep_their_budget_during_a_bulk_run(limits):
+    # A bulk run books far ahead on the shared bucket
+    assert rate_limit.reserve('api', 100) > 5
+    assert rate_limit.acquire('api') > 0
+
+    rate_limit.require('api')
+    rate_limit.require('api')
+    with pytest.raises(rate_limit.RateLimited) as excinfo:
+        rate_limit.require('api')
+    assert 0 < excinfo.value.retry_after <= 0.1
+
+
+def test_unavailable_redis_lets_calls_through(limits, monkeypatch):
+    def fail(*args, **kwargs):
+        raise rate_limit.redis.ConnectionError("down")
+
+    rate_limit.get_redis()
+    monkeypatch.setattr(rate_limit, '_script', fail)
+    assert rate_limit.take('plain', 3) == (3, 0.0)
+    assert rate_limit.reserve('plain', 3) == 0
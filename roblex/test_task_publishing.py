@@ -0,0 +1,52 @@
+import pytest
+from celery import Celery
+
+from roblex import task_publishing
+
+
+@pytest.fixture
+def app():
+    app = Celery('test_task_publishing', broker='memory://', set_as_current=False)
+    app.conf.task_default_queue = 'test_task_publishing'
+    return app
+
+
+def _notify_task(app, queue):
+    @app.task(name='test.notify', queue=queue)
+    def notify(lead_id):
+        pass
+    return notify
+
+
+def _drain(app, queue):
+    """(task name, args) of every message waiting in the queue"""
+    messages = []
+    with app.connection_for_write() as connection:
+        simple_queue = connection.SimpleQueue(queue)
+        while simple_queue.qsize():
+            message = simple_queue.get(timeout=1)
+            messages.append((message.headers['task'], message.payload[0]))
+            message.ack()
+        simple_queue.close()
+    return messages
+
+
+def test_small_fan_out_is_sent_by_the_caller(app):
+    task = _notify_task(app, 'notify_small')
+
+    assert task_publishing.publish_bulk(task, [(lead_id,) for lead_id in range(3)]) == 3
+
+    assert _drain(app, 'notify_small') == [('test.notify', [0]), ('test.notify', [1]), ('test.notify', [2])]
+
+
+def test_large_fan_out_is_sent_in_chunks_by_workers(app, monkeypatch):
+    monkeypatch.setattr(task_publishing, 'PUBLISH_CHUNK_SIZE', 4)
+    task = _notify_task(app, 'notify_large')
+
+    assert task_publishing.publish_bulk(task, [(lead_id,) for lead_id in range(10)]) == 10
+
+    chunks = _drain(app, 'notify_large')
+    assert [name for name, _ in chunks] == [task_publishing.publish_chunk.name] * 3
+    for _, args in chunks:
+        app.tasks[task_publishing.publish_chunk.name].run(*args)
+    assert _drain(app, 'notify_large') == [('test.notify', [lead_id]) for lead_id in range(10)]
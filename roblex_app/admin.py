@@ -6,7 +6,8 @@ from roblex_app.models import (
 )
 
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
+from django.core.exceptions import PermissionDenied
 from django.db.models import Count, Q
 from django.contrib.auth.models import User
 from django.conf import settings
@@ -14,6 +15,7 @@ from django.contrib.admin import AdminSite
 
 from django.utils import timezone
 import pytz
+from roblex import document_mirror
 
 
 class SuperuserOnlyModelAdmin(admin.ModelAdmin):
@@ -615,6 +617,9 @@ class DocumentSubmissionInline(admin.TabularInline):
     def signing_link(self, obj):
         if obj.nextkeysign_slug and obj.status not in ['completed', 'declined', 'expired']:
             return format_html('<a href="https://sign.nextkeystack.com/s/{}" target="_blank">🔗 Sign</a>', obj.nextkeysign_slug)
+        elif obj.signed_document_sha256:
+            url = reverse('admin:roblex_app_documentsubmission_document', args=[obj.pk, 'signed'])
+            return format_html('<a href="{}" target="_blank">📋 Signed Doc</a>', url)
         elif obj.signed_document_url:
             return format_html('<a href="{}" target="_blank">📋 Signed Doc</a>', obj.signed_document_url)
         return "-"
@@ -1107,11 +1112,33 @@ class DocumentSubmissionAdmin(LawFirmFilteredModelAdmin):
     signing_link.short_description = "Signing Link"
     
     def signed_document_link(self, obj):
+        if obj.signed_document_sha256:
+            url = reverse('admin:roblex_app_documentsubmission_document', args=[obj.pk, 'signed'])
+            return format_html('<a href="{}" target="_blank">📋 View Signed Document</a>', url)
         if obj.signed_document_url:
             return format_html('<a href="{}" target="_blank">📋 View Signed Document</a>', obj.signed_document_url)
         return "Not signed"
     signed_document_link.short_description = "Signed Document"
     
+    def document_view(self, request, object_id, kind):
+        """Serve the mirrored signed document or audit log"""
+        submission = self.get_object(request, object_id)
+        if submission is None or not self.has_view_permission(request, submission):
+            raise PermissionDenied
+        if kind == 'audit-log':
+            return document_mirror.serve(submission.audit_log_sha256, f"audit-log-{submission.external_id}.pdf")
+        return document_mirror.serve(submission.signed_document_sha256, f"{submission.external_id}.pdf")
+    
+    def get_urls(self):
+        urls = [
+            path(
+                '<path:object_id>/document/<str:kind>/',
+                self.admin_site.admin_view(self.document_view),
+                name='roblex_app_documentsubmission_document',
+            ),
+        ]
+        return urls + super().get_urls()
+    
     def status_colored(self, obj):
         colors = {
             'pending': '#ffc107',  # warning yellow
@@ -1160,7 +1187,10 @@ class DocumentSubmissionAdmin(LawFirmFilteredModelAdmin):
         'external_id'
     ]
     date_hierarchy = 'created_at'
-    readonly_fields = ['nextkeysign_submission_id', 'nextkeysign_submitter_id', 'nextkeysign_slug', 'external_id', 'created_at', 'updated_at']
+    readonly_fields = [
+        'nextkeysign_submission_id', 'nextkeysign_submitter_id', 'nextkeysign_slug', 'external_id', 'created_at', 'updated_at',
+        'signed_document_sha256', 'audit_log_sha256', 'documents_mirrored_at', 'mirror_attempts'
+    ]
     list_per_page = 25
     
     fieldsets = (
@@ -1176,6 +1206,10 @@ class DocumentSubmissionAdmin(LawFirmFilteredModelAdmin):
         ('NextKeySign Data', {
             'fields': ('nextkeysign_submission_id', 'nextkeysign_submitter_id', 'nextkeysign_slug', 'external_id'),
             'classes': ('collapse',)
+        }),
+        ('Local Copy', {
+            'fields': ('signed_document_sha256', 'audit_log_sha256', 'documents_mirrored_at', 'mirror_attempts'),
+            'classes': ('collapse',)
         })
     )
     
@@ -1500,13 +1534,13 @@ class LandingPageLeadEmailAdmin(SuperuserOnlyModelAdmin):
     
     def retry_failed_emails(self, request, queryset):
         from roblex_app.tasks import send_landing_page_lead_email
+        from roblex.task_publishing import publish_bulk
         
-        failed_emails = queryset.filter(status='failed')
-        count = 0
-        for email_obj in failed_emails:
-            # Queue a new email for the lead instead of retrying specific email
-            send_landing_page_lead_email.delay(email_obj.lead.id)
-            count += 1
+        # Queue a new email for the lead instead of retrying specific email
+        failed_lead_ids = queryset.filter(status='failed').values_list('lead_id', flat=True)
+        count = publish_bulk(
+            send_landing_page_lead_email, [(lead_id,) for lead_id in failed_lead_ids], queue='retainer_submissions'
+        )
         
         self.message_user(request, f'Queued retry for {count} failed emails.')
     retry_failed_emails.short_description = "Retry selected failed emails"
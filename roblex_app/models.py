@@ -497,6 +497,11 @@ class DocumentSubmission(models.Model):
     # Document URLs (populated after completion)
     signed_document_url = models.URLField(max_length=500, blank=True, null=True)
     audit_log_url = models.URLField(max_length=500, blank=True, null=True)
+    # Local mirror of the documents (roblex/document_mirror.py), by content sha256
+    signed_document_sha256 = models.CharField(max_length=64, blank=True)
+    audit_log_sha256 = models.CharField(max_length=64, blank=True)
+    documents_mirrored_at = models.DateTimeField(null=True, blank=True)
+    mirror_attempts = models.PositiveSmallIntegerField(default=0)
     
     # Metadata
     decline_reason = models.TextField(blank=True, null=True)
@@ -2,15 +2,20 @@
 """
 Standalone Roblox API Test Script
 
-This script tests the Roblox API endpoints independently without Django dependencies.
-Run with: python test_roblox_api.py
+This script tests the Roblox API endpoints outside of the intake views. Requests
+go through the shared Roblox rate limit, so it reads the project settings.
+Run with: python -m roblex_app.roblox_api
 """
 
-import time
+import os
 import requests
 import json
 from datetime import datetime
 
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'roblex.settings')
+
+from roblex import rate_limit
+
 
 def search_roblox_user(username):
     """Search for a Roblox user by username"""
@@ -23,8 +28,8 @@ def search_roblox_user(username):
             "excludeBannedUsers": False
         }
 
+        rate_limit.wait('roblox')
         response = requests.post(url, json=data)
-        time.sleep(0.6)  # Rate limiting
 
         if response.status_code == 429:
             return {'error': 'Rate limit exceeded. Please try again later.'}
@@ -40,8 +45,8 @@ def search_roblox_user(username):
             
             # Get detailed user info
             user_url = f"https://users.roblox.com/v1/users/{user_id}"
+            rate_limit.wait('roblox')
             user_response = requests.get(user_url)
-            time.sleep(0.6)  # Rate limiting
 
             if user_response.status_code == 429:
                 return {'error': 'Rate limit exceeded. Please try again later.'}
@@ -52,6 +57,8 @@ def search_roblox_user(username):
 
         return results
     
+    except rate_limit.RateLimited:
+        return {'error': 'Rate limit exceeded. Please try again later.'}
     except requests.RequestException as e:
         return {'error': f'An error occurred while fetching player data: {str(e)}'}
 
@@ -62,8 +69,8 @@ def get_user_by_id(user_id):
         print(f"Getting user details for ID: {user_id}")
         url = f"https://users.roblox.com/v1/users/{user_id}"
         
+        rate_limit.wait('roblox')
         response = requests.get(url)
-        time.sleep(0.6)  # Rate limiting
 
         if response.status_code == 429:
             return {'error': 'Rate limit exceeded. Please try again later.'}
@@ -71,6 +78,8 @@ def get_user_by_id(user_id):
         response.raise_for_status()
         return response.json()
     
+    except rate_limit.RateLimited:
+        return {'error': 'Rate limit exceeded. Please try again later.'}
     except requests.RequestException as e:
         return {'error': f'An error occurred while fetching user data: {str(e)}'}
 
@@ -81,8 +90,8 @@ def get_user_avatar(user_id):
         print(f"Getting avatar for user ID: {user_id}")
         url = f"https://thumbnails.roblox.com/v1/users/avatar?userIds={user_id}&size=420x420&format=Png&isCircular=false"
         
+        rate_limit.wait('roblox')
         response = requests.get(url)
-        time.sleep(0.6)  # Rate limiting
 
         if response.status_code == 429:
             return {'error': 'Rate limit exceeded. Please try again later.'}
@@ -90,6 +99,8 @@ def get_user_avatar(user_id):
         response.raise_for_status()
         return response.json()
     
+    except rate_limit.RateLimited:
+        return {'error': 'Rate limit exceeded. Please try again later.'}
     except requests.RequestException as e:
         return {'error': f'An error occurred while fetching avatar data: {str(e)}'}
 
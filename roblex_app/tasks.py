@@ -1,12 +1,16 @@
 """
 Celery tasks for background processing in roblex_app
 """
+from concurrent.futures import ThreadPoolExecutor
+import requests
 from celery import shared_task
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.html import strip_tags
 from django.conf import settings
+from roblex import nextkeysign, rate_limit
+from roblex.task_publishing import publish_bulk
 import logging
 
 logger = logging.getLogger(__name__)
@@ -122,20 +126,16 @@ def auto_follow_up_new_leads():
         # 3. Are in 'new' status
         cutoff_time = timezone.now() - timedelta(minutes=5)
         
-        new_leads = LandingPageLead.objects.filter(
+        new_lead_ids = LandingPageLead.objects.filter(
             created_at__lt=cutoff_time,
             status='new'
         ).exclude(
             email_notifications__status='sent'
-        )
+        ).values_list('id', flat=True)
         
-        count = 0
-        for lead in new_leads:
-            try:
-                send_landing_page_lead_email.delay(lead.id)
-                count += 1
-            except Exception as e:
-                logger.error(f"Failed to queue auto follow-up for lead {lead.id}: {e}")
+        count = publish_bulk(
+            send_landing_page_lead_email, [(lead_id,) for lead_id in new_lead_ids], queue='retainer_submissions'
+        )
         
         logger.info(f"Queued auto follow-up emails for {count} new leads")
         return f"Queued auto follow-up emails for {count} new leads"
@@ -247,3 +247,159 @@ Please check your admin panel to view and manage this lead.""",
     except Exception as e:
         logger.error(f"Error in send_law_firm_notification_email task for lead {lead_id}: {e}")
         raise
+
+
+def _document_submission_payload(user_detail, doc_template, email_template_type, base_url):
+    """NextKeySign submission request for one of the user's documents"""
+    from roblex_app.models import EmailTemplate
+    
+    # Get email template for custom message
+    email_template = None
+    try:
+        email_template = EmailTemplate.objects.get(name=email_template_type, is_active=True)
+    except EmailTemplate.DoesNotExist:
+        logger.warning(f"Email template '{email_template_type}' not found or inactive, will use default NextKeySign message")
+    
+    payload = {
+        "template_id": doc_template.nextkeysign_template_id,
+        "submitters": [
+            {
+                "name": f"{user_detail.first_name} {user_detail.last_name}",
+                "email": user_detail.email,
+                "values": {
+                    "Name": f"{user_detail.first_name} {user_detail.last_name}",
+                    "Current Date": timezone.now().strftime("%Y-%m-%d")
+                },
+                "role": "First Party"
+            }
+        ],
+        "send_email": True,
+        "completed_redirect_url": f"{base_url}api/check-document-status/?user_id={user_detail.id}",
+        "declined_redirect_url": f"{base_url}?signed=declined"
+    }
+    
+    # Add custom message if email template exists
+    if email_template:
+        payload["message"] = {
+            "subject": email_template.subject,
+            "body": email_template.body.replace('[User First Name]', user_detail.first_name)
+        }
+    return payload
+
+
+def _post_document_submission(payload):
+    """
+    Create one submission in NextKeySign, from the rate limit budget kept for
+    interactive callers. Returns (first submitter, error).
+    """
+    try:
+        delay = rate_limit.acquire('nextkeysign', interactive=True)
+        if delay:
+            raise rate_limit.RateLimited('nextkeysign', delay)
+        response = nextkeysign.post('submissions', json=payload)
+        response.raise_for_status()
+        submitters = response.json()
+        if not isinstance(submitters, list) or not submitters:
+            raise ValueError("NextKeySign returned no submitters")
+        if not submitters[0].get('submission_id') or not submitters[0].get('id'):
+            raise ValueError("NextKeySign response is missing the submission or submitter id")
+        return submitters[0], None
+    except Exception as e:
+        return None, e
+
+
+def _retry_after(error, retries):
+    """
+    Seconds until a document that failed with `error` is worth posting again,
+    or None if it isn't: only when NextKeySign never saw the request.
+    """
+    if isinstance(error, rate_limit.RateLimited):
+        return error.retry_after
+    if isinstance(error, requests.ConnectionError) and nextkeysign.never_sent(error):
+        return 5 * (2 ** retries)
+    return None
+
+
+@shared_task(bind=True, max_retries=5)
+def create_document_submissions(self, user_detail_id, documents, base_url, created=None):
+    """
+    Create a user's documents in NextKeySign concurrently and record them.
+    `documents` is a list of (template name, email template type); the first
+    one is signed first and must succeed. Returns the response for
+    DocumentSubmissionStatusAPIView, where the client polls for it.
+    
+    Documents that were rate limited or couldn't connect are retried with a
+    countdown under the same task id, so the client keeps polling. `created`
+    maps the templates an earlier attempt already created to their
+    DocumentSubmission ids, so they aren't created twice.
+    """
+    from roblex_app.models import DocumentSubmission, DocumentTemplate, UserDetail
+    
+    user_detail = UserDetail.objects.select_related('law_firm').get(id=user_detail_id)
+    created = dict(created or {})
+    
+    jobs = []
+    for template_name, email_template_type in documents:
+        if template_name in created:
+            continue
+        doc_template = DocumentTemplate.get_template_for_law_firm(template_name, user_detail.law_firm)
+        if not doc_template:
+            logger.error(f"Document template '{template_name}' not found for law firm '{user_detail.law_firm}' or globally")
+            return {"error": f"Document template '{template_name}' not found"}
+        jobs.append((template_name, doc_template, _document_submission_payload(user_detail, doc_template, email_template_type, base_url)))
+    
+    results = []
+    if jobs:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            results = list(executor.map(_post_document_submission, [payload for _, _, payload in jobs]))
+    
+    earlier = DocumentSubmission.objects.in_bulk(list(created.values()))
+    submissions = {
+        template_name: earlier[submission_id]
+        for template_name, submission_id in created.items() if submission_id in earlier
+    }
+    retry_after = []
+    for (template_name, doc_template, _), (submitter, error) in zip(jobs, results):
+        if error is not None:
+            countdown = _retry_after(error, self.request.retries)
+            if countdown is not None and self.request.retries < self.max_retries:
+                logger.warning(f"Document submission for {template_name} not sent, retrying in {countdown:.0f}s: {str(error)}")
+                retry_after.append(countdown)
+            else:
+                logger.error(f"Error creating document submission for {template_name}: {str(error)}")
+            continue
+        submission = DocumentSubmission.objects.create(
+            user_detail=user_detail,
+            document_template=doc_template,
+            nextkeysign_submission_id=submitter.get('submission_id'),
+            nextkeysign_submitter_id=submitter.get('id'),
+            nextkeysign_slug=submitter.get('slug', ''),
+            status='pending',
+            external_id=f"roblox_{template_name}_{user_detail.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}"
+        )
+        logger.info(f"Created document submission {submission.id} for template {template_name}")
+        submissions[template_name] = submission
+        created[template_name] = submission.id
+    
+    if retry_after:
+        raise self.retry(kwargs={'created': created}, countdown=max(retry_after))
+    
+    first = submissions.get(documents[0][0])
+    if first is None:
+        return {"error": f"Failed to create {documents[0][0]} document submission"}
+    
+    response = {
+        "submission_url": f"{settings.NEXTKEYSIGN_BASE_URL}/s/{first.nextkeysign_slug}",
+        "submission_id": first.nextkeysign_submission_id,
+        "status": "pending",
+        "external_id": first.external_id,
+        "template_type": documents[0][0],
+        "florida_disclosure_required": documents[0][0] == 'florida_disclosure',
+    }
+    if response["florida_disclosure_required"]:
+        response.update({
+            "message": "Both Florida disclosure and retainer documents created successfully",
+            "documents_created": len(submissions),
+            "workflow": "florida_dynamic"
+        })
+    return response
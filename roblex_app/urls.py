@@ -2,7 +2,7 @@ from django.urls import path
 
 from roblex_app.views import IntakeFormAPIView, intake_form_view,SubmitIntakeIfValidAPIView,UserDetailCreateView,\
 QuestionListAPIView, SubmitAnswerAPIView,landing_page,SendEmailAPIView,EmailTemplateAPIView,\
-CreateDocumentSubmissionAPIView, DocumentWebhookAPIView, CheckDocumentStatusAPIView, CheckIntakeStatusAPIView, \
+CreateDocumentSubmissionAPIView, DocumentSubmissionStatusAPIView, DocumentWebhookAPIView, CheckDocumentStatusAPIView, CheckIntakeStatusAPIView, \
 LandingPageLeadCreateAPIView, LandingPageLeadListAPIView, LandingPageLeadDetailAPIView, LandingPageLeadEmailAPIView, \
 roblox_intake_form_view, RobloxIntakeFormAPIView
 
@@ -39,6 +39,7 @@ urlpatterns = [
    
     # NextKeySign Document Signing API endpoints
     path('api/create-document-submission/', CreateDocumentSubmissionAPIView.as_view(), name='create-document-submission'),
+    path('api/document-submission-status/<str:task_id>/', DocumentSubmissionStatusAPIView.as_view(), name='document-submission-status'),
     path('api/check-document-status/', CheckDocumentStatusAPIView.as_view(), name='check-document-status'),
     path('api/document-webhook/', DocumentWebhookAPIView.as_view(), name='document-webhook'),
 
@@ -10,6 +10,7 @@ import uuid
 import smtplib
 from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -28,6 +29,8 @@ from email.mime.application import MIMEApplication
 from rest_framework.parsers import MultiPartParser, FormParser
 
 from .xbox_api import xbox_gamertag_lookup
+from roblex import nextkeysign, rate_limit
+from roblex.task_publishing import publish_bulk
 
 from psnawp_api import PSNAWP
 
@@ -214,6 +217,7 @@ def validate_roblox_username(request):
 
 
     try:
+        rate_limit.require('roblox')
         roblox_response = requests.post(
             "https://users.roblox.com/v1/usernames/users",
             json={"usernames": [username], "excludeBannedUsers": False},
@@ -235,6 +239,12 @@ def validate_roblox_username(request):
                 "error": "Gamertag not found"
             }, status=status.HTTP_404_NOT_FOUND)
 
+    except rate_limit.RateLimited as e:
+        return Response(
+            {"error": "Too many Roblox lookups right now. Please try again shortly."},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(int(e.retry_after) + 1)}
+        )
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
@@ -310,6 +320,7 @@ class SubmitIntakeIfValidAPIView(APIView):
             ]
             try:
                 for username in usernames:
+                    rate_limit.require('roblox')
                     roblox_response = requests.post(
                         "https://users.roblox.com/v1/usernames/users",
                         json={"usernames": [username], "excludeBannedUsers": False},
@@ -323,6 +334,12 @@ class SubmitIntakeIfValidAPIView(APIView):
                             {"error": f"Invalid Roblox username: {username}. Cannot save."},
                             status=status.HTTP_400_BAD_REQUEST
                         )
+            except rate_limit.RateLimited as e:
+                return Response(
+                    {"error": "Too many Roblox lookups right now. Please try again shortly."},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={"Retry-After": str(int(e.retry_after) + 1)}
+                )
             except Exception as e:
                 return Response({"error": f"Roblox validation failed: {str(e)}"},
                                 status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -578,6 +595,9 @@ class CreateDocumentSubmissionAPIView(APIView):
     """
     Creates document submissions with dynamic Florida disclosure workflow.
     For Florida zipcodes (32003-34997), creates both disclosure and retainer documents at once.
+    
+    The documents are created in the background (create_document_submissions task);
+    the response is a 202 with a status_url to poll for the signing URL.
     """
     
     def post(self, request):
@@ -602,55 +622,31 @@ class CreateDocumentSubmissionAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # **NEW**: Florida disclosure workflow - create all required documents at once
-            florida_required = requires_florida_disclosure(user_detail.zipcode)
+            # Default to retainer_minor since gamer_dob field has been removed
+            if template_type == 'retainer_agreement':
+                template_type = 'retainer_minor'
             
-            if florida_required and template_type in ['retainer_agreement', 'retainer_minor', 'retainer_adult']:
-                # Create both Florida disclosure and retainer documents
+            # Florida disclosure workflow - create all required documents at once,
+            # the disclosure first since it is signed first
+            florida_required = requires_florida_disclosure(user_detail.zipcode)
+            if florida_required and template_type in ['retainer_minor', 'retainer_adult']:
                 print(f"Florida zipcode {user_detail.zipcode} detected - creating both documents")
-                
-                # Default to retainer_minor since gamer_dob field has been removed
-                retainer_template_type = 'retainer_minor'
-                
-                # Create both documents
-                documents_created = self._create_florida_workflow_documents(user_detail, retainer_template_type, email_template_type, request)
-                
-                if documents_created:
-                    # Get the first document (Florida disclosure) for initial signing
-                    florida_disclosure_submission = None
-                    for doc in documents_created:
-                        if doc.document_template.name == 'florida_disclosure':
-                            florida_disclosure_submission = doc
-                            break
-                    
-                    # If we found the Florida disclosure, provide its signing URL
-                    if florida_disclosure_submission:
-                        signing_url = f"{settings.NEXTKEYSIGN_BASE_URL}/s/{florida_disclosure_submission.nextkeysign_slug}"
-                        
-                        return Response({
-                            "message": "Both Florida disclosure and retainer documents created successfully",
-                            "submission_url": signing_url,  # Frontend expects this field
-                            "submission_id": florida_disclosure_submission.nextkeysign_submission_id,
-                            "status": "pending",
-                            "external_id": florida_disclosure_submission.external_id,
-                            "template_type": "florida_disclosure",
-                            "florida_disclosure_required": True,
-                            "documents_created": len(documents_created),
-                            "workflow": "florida_dynamic"
-                        }, status=status.HTTP_201_CREATED)
-                    else:
-                        return Response(
-                            {"error": "Florida disclosure document not found in created documents"},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                        )
-                else:
-                    return Response(
-                        {"error": "Failed to create Florida workflow documents"},
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                    )
+                documents = [
+                    ('florida_disclosure', 'florida_disclosure'),
+                    ('retainer_minor', email_template_type),
+                ]
             else:
-                # Standard single document creation for non-Florida residents
-                return self._create_single_document(user_detail, template_type, email_template_type, request)
+                documents = [(template_type, email_template_type)]
+            
+            from roblex_app.tasks import create_document_submissions
+            task = create_document_submissions.delay(user_detail.id, documents, request.build_absolute_uri('/'))
+            
+            return Response({
+                "task_id": task.id,
+                "status": "processing",
+                "status_url": reverse('document-submission-status', args=[task.id]),
+                "florida_disclosure_required": len(documents) > 1
+            }, status=status.HTTP_202_ACCEPTED)
                 
         except Exception as e:
             print(f"Error creating document submission: {str(e)}")
@@ -658,175 +654,39 @@ class CreateDocumentSubmissionAPIView(APIView):
                 {"error": f"Internal server error: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class DocumentSubmissionStatusAPIView(APIView):
+    """
+    Poll a document creation started by CreateDocumentSubmissionAPIView.
+    202 while it runs, then the signing URL of the document to sign first.
+    """
     
-    def _create_florida_workflow_documents(self, user_detail, retainer_template_type, email_template_type, request):
-        """
-        Create both Florida disclosure and retainer documents at once
-        """
-        documents_created = []
+    def get(self, request, task_id):
+        from roblex_app.tasks import create_document_submissions
+        result = create_document_submissions.AsyncResult(task_id)
         
-        try:
-            # 1. Create Florida disclosure document with specific Florida email template
-            florida_submission = self._create_document_submission(
-                user_detail, 
-                'florida_disclosure', 
-                'florida_disclosure',  # Use specific Florida disclosure email template
-                request
-            )
-            
-            if florida_submission:
-                documents_created.append(florida_submission)
-                print(f"Created Florida disclosure document: {florida_submission.id}")
-            
-            # 2. Create retainer document with regular email template
-            retainer_submission = self._create_document_submission(
-                user_detail, 
-                retainer_template_type, 
-                email_template_type,  # Use the original email template (eligible_no_parent or eligible_with_parent)
-                request
-            )
-            
-            if retainer_submission:
-                documents_created.append(retainer_submission)
-                print(f"Created retainer document: {retainer_submission.id}")
-            
-            return documents_created
-            
-        except Exception as e:
-            print(f"Error creating Florida workflow documents: {str(e)}")
-            return None
-    
-    def _create_single_document(self, user_detail, template_type, email_template_type, request):
-        """
-        Create a single document for non-Florida residents
-        """
-        try:
-            # Determine correct retainer type - default to minor since gamer_dob field has been removed
-            actual_template_type = template_type
-            if template_type == 'retainer_agreement':
-                actual_template_type = 'retainer_minor'  # Default to minor
-            
-            submission = self._create_document_submission(
-                user_detail, 
-                actual_template_type, 
-                email_template_type, 
-                request
-            )
-            
-            if submission:
-                signing_url = f"{settings.NEXTKEYSIGN_BASE_URL}/s/{submission.nextkeysign_slug}"
-                
-                return Response({
-                    "submission_url": signing_url,
-                    "submission_id": submission.nextkeysign_submission_id,
-                    "status": "pending",
-                    "external_id": submission.external_id,
-                    "template_type": actual_template_type,
-                    "florida_disclosure_required": False
-                }, status=status.HTTP_201_CREATED)
-            else:
-                return Response(
-                    {"error": "Failed to create document submission"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-                
-        except Exception as e:
-            print(f"Error creating single document: {str(e)}")
+        # Any task id can be passed in, so only answer for document creations
+        if result.name not in (None, create_document_submissions.name):
+            return Response({"error": "Unknown task"}, status=status.HTTP_404_NOT_FOUND)
+        
+        if result.state == 'SUCCESS':
+            if not isinstance(result.result, dict) or not (
+                'submission_url' in result.result or 'error' in result.result
+            ):
+                return Response({"error": "Unknown task"}, status=status.HTTP_404_NOT_FOUND)
+            if result.result.get('error'):
+                return Response(result.result, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response(result.result, status=status.HTTP_200_OK)
+        
+        if result.state == 'FAILURE':
+            print(f"Error creating document submission: {result.result}")
             return Response(
-                {"error": f"Internal server error: {str(e)}"},
+                {"error": "Failed to create document submission"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-    
-    def _create_document_submission(self, user_detail, template_name, email_template_type, request):
-        """
-        Helper method to create a single document submission
-        """
-        try:
-            # Get document template using law firm-specific logic
-            doc_template = DocumentTemplate.get_template_for_law_firm(template_name, user_detail.law_firm)
-            
-            if not doc_template:
-                print(f"Document template '{template_name}' not found for law firm '{user_detail.law_firm}' or globally")
-                return None
-            
-            # Get email template for custom message
-            email_template = None
-            try:
-                email_template = EmailTemplate.objects.get(name=email_template_type, is_active=True)
-            except EmailTemplate.DoesNotExist:
-                print(f"Warning: Email template '{email_template_type}' not found or inactive, will use default NextKeySign message")
-            
-            # Prepare NextKeySign API request
-            nextkeysign_url = f"{settings.NEXTKEYSIGN_BASE_URL}/api/submissions"
-            
-            # Build submitter data
-            submitter_data = {
-                "template_id": doc_template.nextkeysign_template_id,
-                "submitters": [
-                    {
-                        "name": f"{user_detail.first_name} {user_detail.last_name}",
-                        "email": user_detail.email,
-                        "values": {
-                            "Name": f"{user_detail.first_name} {user_detail.last_name}",
-                            "Current Date": timezone.now().strftime("%Y-%m-%d")
-                        },
-                        "role": "First Party"
-                    }
-                ],
-                "send_email": True,
-                "completed_redirect_url": f"{request.build_absolute_uri('/')}api/check-document-status/?user_id={user_detail.id}",
-                "declined_redirect_url": f"{request.build_absolute_uri('/')}?signed=declined"
-            }
-            
-            # Add custom message if email template exists
-            if email_template:
-                custom_body = email_template.body.replace('[User First Name]', user_detail.first_name)
-                submitter_data["message"] = {
-                    "subject": email_template.subject,
-                    "body": custom_body
-                }
-            
-            # Make API call to NextKeySign
-            headers = {
-                "X-Auth-Token": settings.NEXTKEYSIGN_API_TOKEN,
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(nextkeysign_url, json=submitter_data, headers=headers)
-            
-            if response.status_code in [200, 201]:
-                nextkeysign_response = response.json()
-                
-                if isinstance(nextkeysign_response, list) and len(nextkeysign_response) > 0:
-                    first_submitter = nextkeysign_response[0]
-                    
-                    submission_id = first_submitter.get('submission_id')
-                    submitter_id = first_submitter.get('id')
-                    submitter_slug = first_submitter.get('slug', '')
-                    
-                    if submission_id and submitter_id:
-                        # Generate unique external ID
-                        external_id = f"roblox_{template_name}_{user_detail.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}"
-                        
-                        # Create document submission record
-                        submission = DocumentSubmission.objects.create(
-                            user_detail=user_detail,
-                            document_template=doc_template,
-                            nextkeysign_submission_id=submission_id,
-                            nextkeysign_submitter_id=submitter_id,
-                            nextkeysign_slug=submitter_slug,
-                            status='pending',
-                            external_id=external_id
-                        )
-                        
-                        print(f"Created document submission {submission.id} for template {template_name}")
-                        return submission
-            
-            return None
-            
-        except Exception as e:
-            print(f"Error creating document submission for {template_name}: {str(e)}")
-            return None
+        
+        return Response({"task_id": task_id, "status": "processing"}, status=status.HTTP_202_ACCEPTED)
 
 
 class CheckDocumentStatusAPIView(APIView):
@@ -1563,13 +1423,9 @@ class LandingPageLeadEmailAPIView(APIView):
                 }, status=status.HTTP_404_NOT_FOUND)
             
             # Queue emails for valid leads
-            queued_count = 0
-            for lead_id in valid_lead_ids:
-                try:
-                    send_landing_page_lead_email.delay(lead_id)
-                    queued_count += 1
-                except Exception as e:
-                    print(f"Failed to queue email for lead {lead_id}: {e}")
+            queued_count = publish_bulk(
+                send_landing_page_lead_email, [(lead_id,) for lead_id in valid_lead_ids], queue='retainer_submissions'
+            )
             
             return Response({
                 'success': True,
@@ -1623,6 +1479,7 @@ class RobloxIntakeFormAPIView(APIView):
             ]
             try:
                 for username in usernames:
+                    rate_limit.require('roblox')
                     roblox_response = requests.post(
                         "https://users.roblox.com/v1/usernames/users",
                         json={"usernames": [username], "excludeBannedUsers": False},
@@ -1635,6 +1492,12 @@ class RobloxIntakeFormAPIView(APIView):
                             {"error": f"Invalid Roblox username: {username}. Cannot save."},
                             status=status.HTTP_400_BAD_REQUEST
                         )
+            except rate_limit.RateLimited as e:
+                return Response(
+                    {"error": "Too many Roblox lookups right now. Please try again shortly."},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={"Retry-After": str(int(e.retry_after) + 1)}
+                )
             except Exception as e:
                 return Response({"error": f"Roblox validation failed: {str(e)}"},
                                 status=status.HTTP_500_INTERNAL_SERVER_ERROR)